@@ -0,0 +1,473 @@
+"""
+Admission control for research requests.
+
+A research run fans out into dozens of LLM and HTTP calls, so the number of
+runs in flight is capped globally and per user or tenant. Requests over the
+cap wait in a bounded queue that is served fairly across keys; when the
+queue is full they are shed with a retry hint. The state lives in process,
+or in Redis so the limits hold across replicas.
+"""
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import math
+import time
+import uuid
+
+from agent.config import settings
+
+
+# Queue order: a ticket's round (tickets its key already had waiting) first,
+# then arrival time, so keys take turns instead of the busiest key going first
+ROUND_WEIGHT = 1e10
+
+
+class AdmissionRejected(Exception):
+    """A request was shed; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionStats:
+    """Counters for admission decisions."""
+
+    def __init__(self):
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters."""
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_seconds": self.wait_seconds / self.admitted if self.admitted else 0.0,
+        }
+
+
+class LocalAdmissionBackend:
+    """In-process admission state; limits apply to this replica only."""
+
+    polling = False
+
+    def __init__(self):
+        self.in_flight: Dict[str, str] = {}
+        self.in_flight_counts: Counter = Counter()
+        self.waiting: Dict[str, Tuple[float, str]] = {}
+        self.waiting_counts: Counter = Counter()
+
+    async def enqueue(self, ticket: str, key: str, lease: float, max_queue: int, max_queue_per_key: int) -> int:
+        """Queue a ticket: 0 on success, -1 if the queue is full, -2 if the key's queue is."""
+        if len(self.waiting) >= max_queue:
+            return -1
+        if self.waiting_counts[key] >= max_queue_per_key:
+            return -2
+        self.waiting[ticket] = (self.waiting_counts[key] * ROUND_WEIGHT + time.monotonic(), key)
+        self.waiting_counts[key] += 1
+        return 0
+
+    async def try_admit(
+        self,
+        ticket: str,
+        key: str,
+        lease: float,
+        max_in_flight: int,
+        max_per_key: int
+    ) -> Tuple[Optional[bool], int]:
+        """
+        Admit a queued ticket if a slot is free and no eligible ticket is
+        ahead of it. Returns (admitted, queue position); admitted is None when
+        the ticket is no longer queued.
+        """
+        if ticket not in self.waiting:
+            return None, 0
+
+        order = sorted(self.waiting, key=lambda t: self.waiting[t][0])
+        position = order.index(ticket)
+        if len(self.in_flight) >= max_in_flight or self.in_flight_counts[key] >= max_per_key:
+            return False, position
+        # Tickets ahead whose key is at its cap do not block this one
+        if any(self.in_flight_counts[self.waiting[t][1]] < max_per_key for t in order[:position]):
+            return False, position
+
+        await self.remove(ticket)
+        self.in_flight[ticket] = key
+        self.in_flight_counts[key] += 1
+        return True, 0
+
+    async def remove(self, ticket: str):
+        """Drop a ticket from the queue or release its slot."""
+        if ticket in self.waiting:
+            _, key = self.waiting.pop(ticket)
+            self.waiting_counts[key] -= 1
+            if self.waiting_counts[key] <= 0:
+                del self.waiting_counts[key]
+        if ticket in self.in_flight:
+            key = self.in_flight.pop(ticket)
+            self.in_flight_counts[key] -= 1
+            if self.in_flight_counts[key] <= 0:
+                del self.in_flight_counts[key]
+
+    async def heartbeat(self, tickets: List[str], lease: float):
+        """Tickets of this process cannot be orphaned; nothing to renew."""
+
+    async def snapshot(self) -> Dict[str, int]:
+        return {"in_flight": len(self.in_flight), "waiting": len(self.waiting)}
+
+
+# KEYS: in-flight leases, in-flight ticket keys, in-flight counts, waiting
+# queue, waiting ticket keys, waiting leases, waiting counts. Time is taken
+# from the Redis server, so replicas with skewed clocks neither expire each
+# other's live tickets nor jump the queue.
+_NOW = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+"""
+
+_PURGE = _NOW + """
+local function purge(now)
+    for _, t in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+        local k = redis.call('HGET', KEYS[2], t)
+        if k and redis.call('HINCRBY', KEYS[3], k, -1) <= 0 then redis.call('HDEL', KEYS[3], k) end
+        redis.call('HDEL', KEYS[2], t)
+        redis.call('ZREM', KEYS[1], t)
+    end
+    for _, t in ipairs(redis.call('ZRANGEBYSCORE', KEYS[6], '-inf', now)) do
+        local k = redis.call('HGET', KEYS[5], t)
+        if k and redis.call('HINCRBY', KEYS[7], k, -1) <= 0 then redis.call('HDEL', KEYS[7], k) end
+        redis.call('HDEL', KEYS[5], t)
+        redis.call('ZREM', KEYS[4], t)
+        redis.call('ZREM', KEYS[6], t)
+    end
+end
+local function count(hash, key)
+    return tonumber(redis.call('HGET', hash, key) or '0')
+end
+"""
+
+_ENQUEUE = _PURGE + """
+local ticket, key, lease = ARGV[1], ARGV[2], tonumber(ARGV[3])
+purge(now)
+if redis.call('ZCARD', KEYS[4]) >= tonumber(ARGV[4]) then return -1 end
+local n = count(KEYS[7], key)
+if n >= tonumber(ARGV[5]) then return -2 end
+redis.call('ZADD', KEYS[4], n * tonumber(ARGV[6]) + now, ticket)
+redis.call('HSET', KEYS[5], ticket, key)
+redis.call('ZADD', KEYS[6], now + lease, ticket)
+redis.call('HINCRBY', KEYS[7], key, 1)
+return 0
+"""
+
+_TRY_ADMIT = _PURGE + """
+local ticket, key, lease = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local max_in_flight, max_per_key = tonumber(ARGV[4]), tonumber(ARGV[5])
+purge(now)
+local position = redis.call('ZRANK', KEYS[4], ticket)
+if not position then return {-1, 0} end
+if redis.call('ZCARD', KEYS[1]) >= max_in_flight or count(KEYS[3], key) >= max_per_key then
+    return {0, position}
+end
+if position > 0 then
+    for _, t in ipairs(redis.call('ZRANGE', KEYS[4], 0, position - 1)) do
+        local k = redis.call('HGET', KEYS[5], t)
+        if k and count(KEYS[3], k) < max_per_key then return {0, position} end
+    end
+end
+redis.call('ZREM', KEYS[4], ticket)
+redis.call('HDEL', KEYS[5], ticket)
+redis.call('ZREM', KEYS[6], ticket)
+if redis.call('HINCRBY', KEYS[7], key, -1) <= 0 then redis.call('HDEL', KEYS[7], key) end
+redis.call('ZADD', KEYS[1], now + lease, ticket)
+redis.call('HSET', KEYS[2], ticket, key)
+redis.call('HINCRBY', KEYS[3], key, 1)
+return {1, 0}
+"""
+
+_REMOVE = """
+local ticket = ARGV[1]
+local k = redis.call('HGET', KEYS[2], ticket)
+if k then
+    if redis.call('HINCRBY', KEYS[3], k, -1) <= 0 then redis.call('HDEL', KEYS[3], k) end
+    redis.call('HDEL', KEYS[2], ticket)
+    redis.call('ZREM', KEYS[1], ticket)
+end
+k = redis.call('HGET', KEYS[5], ticket)
+if k then
+    if redis.call('HINCRBY', KEYS[7], k, -1) <= 0 then redis.call('HDEL', KEYS[7], k) end
+    redis.call('HDEL', KEYS[5], ticket)
+    redis.call('ZREM', KEYS[4], ticket)
+    redis.call('ZREM', KEYS[6], ticket)
+end
+return 0
+"""
+
+_HEARTBEAT = _NOW + """
+local expiry = now + tonumber(ARGV[1])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], 'XX', expiry, ARGV[i])
+    redis.call('ZADD', KEYS[6], 'XX', expiry, ARGV[i])
+end
+return 0
+"""
+
+
+class RedisAdmissionBackend:
+    """
+    Admission state shared by all replicas through Redis.
+
+    Every decision is one Lua script, so it is atomic across replicas.
+    Queued and admitted tickets hold leases that their process renews; the
+    tickets of a replica that dies expire and free their slots.
+    """
+
+    polling = True
+
+    def __init__(self, client=None, prefix: Optional[str] = None):
+        from agent.cache import get_redis_client
+
+        self.client = client or get_redis_client()
+        prefix = prefix or settings.ADMISSION_REDIS_PREFIX
+        self.keys = [
+            f"{prefix}:in_flight",
+            f"{prefix}:in_flight_keys",
+            f"{prefix}:in_flight_counts",
+            f"{prefix}:waiting",
+            f"{prefix}:waiting_keys",
+            f"{prefix}:waiting_expiry",
+            f"{prefix}:waiting_counts",
+        ]
+        self._enqueue = self.client.register_script(_ENQUEUE)
+        self._try_admit = self.client.register_script(_TRY_ADMIT)
+        self._remove = self.client.register_script(_REMOVE)
+        self._heartbeat = self.client.register_script(_HEARTBEAT)
+
+    async def enqueue(self, ticket: str, key: str, lease: float, max_queue: int, max_queue_per_key: int) -> int:
+        return int(await self._enqueue(keys=self.keys, args=[ticket, key, lease, max_queue, max_queue_per_key, ROUND_WEIGHT]))
+
+    async def try_admit(
+        self,
+        ticket: str,
+        key: str,
+        lease: float,
+        max_in_flight: int,
+        max_per_key: int
+    ) -> Tuple[Optional[bool], int]:
+        status, position = await self._try_admit(keys=self.keys, args=[ticket, key, lease, max_in_flight, max_per_key])
+        if int(status) < 0:
+            return None, 0
+        return bool(int(status)), int(position)
+
+    async def remove(self, ticket: str):
+        await self._remove(keys=self.keys, args=[ticket])
+
+    async def heartbeat(self, tickets: List[str], lease: float):
+        if tickets:
+            await self._heartbeat(keys=self.keys, args=[lease, *tickets])
+
+    async def snapshot(self) -> Dict[str, int]:
+        in_flight, waiting = await asyncio.gather(
+            self.client.zcard(self.keys[0]),
+            self.client.zcard(self.keys[3])
+        )
+        return {"in_flight": int(in_flight), "waiting": int(waiting)}
+
+
+class AdmissionTicket:
+    """A request's place in the admission queue, then its in-flight slot."""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self.controller = controller
+        self.id = str(uuid.uuid4())
+        self.key = key
+        self.enqueued_at = time.time()
+        self.admitted_at: Optional[float] = None
+        self.admitted = False
+        self.released = False
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Wait for a slot, yielding the queue position each time it changes.
+        Raises AdmissionRejected when the queue timeout passes first.
+        """
+        controller = self.controller
+        deadline = self.enqueued_at + controller.queue_timeout
+        last = None
+
+        while not self.admitted:
+            # Taken before trying, so a release while the caller handles a
+            # yielded position is not missed
+            changed = controller._changed
+            admitted, position = await controller._try_admit(self)
+            if admitted:
+                return
+            if admitted is None:
+                # Our lease expired (e.g. Redis was unreachable for a while)
+                self.released = True
+                raise AdmissionRejected("queue entry expired", controller.retry_after())
+            if position != last:
+                last = position
+                yield position
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                await self.release()
+                controller.stats.timeouts += 1
+                raise AdmissionRejected("timed out waiting for a research slot", controller.retry_after())
+            await controller._wait_for_change(changed, remaining)
+
+    async def release(self):
+        """Give up the queue entry or the slot. Safe to call more than once."""
+        if not self.released:
+            self.released = True
+            await self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Caps research runs in flight, globally and per key (user or tenant).
+
+    `enter` queues a request, or rejects it with AdmissionRejected when the
+    queue, or the key's share of it, is full. A queued request waits on
+    `AdmissionTicket.wait`; among waiting requests, keys take turns, so one
+    key's burst cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_in_flight: Optional[int] = None,
+        max_in_flight_per_key: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_per_key: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        lease: Optional[float] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.backend = backend or LocalAdmissionBackend()
+        self.max_in_flight = max_in_flight or settings.ADMISSION_MAX_IN_FLIGHT
+        self.max_in_flight_per_key = max_in_flight_per_key or settings.ADMISSION_MAX_IN_FLIGHT_PER_KEY
+        self.max_queue = max_queue if max_queue is not None else settings.ADMISSION_MAX_QUEUE
+        self.max_queue_per_key = max_queue_per_key if max_queue_per_key is not None else settings.ADMISSION_MAX_QUEUE_PER_KEY
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+        self.lease = lease or settings.ADMISSION_LEASE_SECONDS
+        self.poll_interval = poll_interval or settings.ADMISSION_POLL_INTERVAL_SECONDS
+
+        self.stats = AdmissionStats()
+        # Expected run time, for Retry-After; updated from finished runs
+        self.service_seconds = settings.ADMISSION_INITIAL_SERVICE_SECONDS
+        self._changed = asyncio.Event()
+        self._tickets: Dict[str, AdmissionTicket] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def retry_after(self, waiting: Optional[int] = None) -> int:
+        """Seconds until a slot is likely free, from the queue and recent run times."""
+        waiting = waiting if waiting is not None else len(self._tickets)
+        estimate = self.service_seconds * (waiting + 1) / self.max_in_flight
+        return max(1, min(int(math.ceil(estimate)), settings.ADMISSION_MAX_RETRY_AFTER_SECONDS))
+
+    async def enter(self, key: str) -> AdmissionTicket:
+        """Queue a request, admitting it at once when a slot is free."""
+        ticket = AdmissionTicket(self, key)
+        status = await self.backend.enqueue(ticket.id, key, self.lease, self.max_queue, self.max_queue_per_key)
+        if status < 0:
+            self.stats.rejected += 1
+            waiting = (await self.backend.snapshot())["waiting"]
+            reason = "research queue is full" if status == -1 else "too many queued requests for this user"
+            raise AdmissionRejected(reason, self.retry_after(waiting))
+
+        self._tickets[ticket.id] = ticket
+        self._ensure_heartbeat()
+        admitted, _ = await self._try_admit(ticket)
+        if not admitted:
+            self.stats.queued += 1
+            # The new ticket may move ahead of others; let them refresh positions
+            self._notify()
+        return ticket
+
+    async def _try_admit(self, ticket: AdmissionTicket) -> Tuple[Optional[bool], int]:
+        admitted, position = await self.backend.try_admit(
+            ticket.id, ticket.key, self.lease, self.max_in_flight, self.max_in_flight_per_key
+        )
+        if admitted:
+            ticket.admitted = True
+            ticket.admitted_at = time.time()
+            self.stats.admitted += 1
+            self.stats.wait_seconds += ticket.admitted_at - ticket.enqueued_at
+        return admitted, position
+
+    async def _release(self, ticket: AdmissionTicket):
+        self._tickets.pop(ticket.id, None)
+        if ticket.admitted:
+            # Exponentially weighted run time for Retry-After estimates
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * (time.time() - ticket.admitted_at)
+        try:
+            await self.backend.remove(ticket.id)
+        finally:
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _wait_for_change(self, changed: asyncio.Event, timeout: float):
+        """Sleep until a local ticket leaves, or the next poll for shared backends."""
+        if self.backend.polling:
+            timeout = min(timeout, self.poll_interval)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _ensure_heartbeat(self):
+        if self.backend.polling and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        """Renew the leases of this process's tickets while it holds any."""
+        while self._tickets:
+            try:
+                await self.backend.heartbeat(list(self._tickets), self.lease)
+            except Exception as e:
+                print(f"Admission heartbeat failed: {e}")
+            await asyncio.sleep(self.lease / 3)
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Current occupancy and counters."""
+        return {
+            **(await self.backend.snapshot()),
+            "max_in_flight": self.max_in_flight,
+            "max_in_flight_per_key": self.max_in_flight_per_key,
+            **self.stats.snapshot(),
+        }
+
+    async def close(self):
+        """Release every ticket of this process."""
+        for ticket in list(self._tickets.values()):
+            await ticket.release()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Get the shared admission controller, or None when admission control is off."""
+    global _controller
+    if _controller is None and settings.ADMISSION_ENABLED:
+        backend_name = settings.ADMISSION_BACKEND.lower()
+        if backend_name == "redis":
+            backend = RedisAdmissionBackend()
+        elif backend_name == "memory":
+            backend = LocalAdmissionBackend()
+        else:
+            raise ValueError(f"Unsupported admission backend: {backend_name}")
+        _controller = AdmissionController(backend)
+    return _controller
@@ -0,0 +1,277 @@
+"""
+Local approximate nearest-neighbour index for long-term memory.
+IVF-Flat over unit vectors, persisted to memory-mapped files so large
+memory corpora can be served from one box.
+"""
+from typing import Dict, Optional, Tuple
+import json
+import os
+
+import numpy as np
+
+
+class GrowableArray:
+    """Append-only 1-D numpy array with amortized growth."""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, dtype=np.int64, capacity: int = 16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values: np.ndarray):
+        """Append values, doubling capacity as needed."""
+        needed = self.size + len(values)
+        if needed > self.data.shape[0]:
+            grown = np.empty(max(needed, self.data.shape[0] * 2), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity; returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        norms = np.linalg.norm(sums, axis=1)
+        empty = norms == 0
+        if empty.any():
+            # Reseed empty clusters from random points
+            sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()), replace=False)]
+            norms[empty] = np.linalg.norm(sums[empty], axis=1)
+        centroids = sums / norms[:, None]
+
+    return centroids.astype(np.float32)
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Nearest centroid (by inner product) for each vector."""
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file index with per-user posting lists.
+
+    Vectors, their user codes and list assignments live in memory-mapped
+    files under `path`. Until the coarse quantizer is trained, and for users
+    with few memories, search is exact. After training, a query scans only
+    the user's postings in the `nprobe` lists closest to it: more probes give
+    higher recall at higher latency. Training is left to the owner, since it
+    is too slow for the insert path; `needs_training` says when it is due.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        nlist: int = 256,
+        nprobe: int = 8,
+        train_size: Optional[int] = None,
+        brute_force_max: int = 2048
+    ):
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or nlist * 39
+        self.brute_force_max = brute_force_max
+
+        self.dimensions: Optional[int] = None
+        self.size = 0
+        self.capacity = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.vectors: Optional[np.memmap] = None
+        self.users: Optional[np.memmap] = None
+        self.assignments: Optional[np.memmap] = None
+
+        self._user_rows: Dict[int, GrowableArray] = {}
+        self._postings: Dict[Tuple[int, int], GrowableArray] = {}
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self._file("meta.json")):
+            self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def needs_training(self) -> bool:
+        """Whether enough vectors exist to train the coarse quantizer."""
+        return not self.trained and self.size >= max(self.train_size, self.nlist)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+
+        self.dimensions = meta["dimensions"]
+        self.size = meta["size"]
+        self._open_arrays(meta["capacity"])
+
+        if os.path.exists(self._file("centroids.npy")):
+            self.centroids = np.load(self._file("centroids.npy"))
+
+        rows = np.arange(self.size, dtype=np.int64)
+        users = np.asarray(self.users[:self.size])
+        for user in np.unique(users):
+            self._user_rows.setdefault(int(user), GrowableArray()).extend(rows[users == user])
+        if self.trained:
+            self._index_postings(rows)
+
+    def _open_arrays(self, capacity: int):
+        """Map the vector, user and assignment files at the given capacity."""
+        specs = (
+            ("vectors", "vectors.f32", np.float32, (capacity, self.dimensions)),
+            ("users", "users.i32", np.int32, (capacity,)),
+            ("assignments", "assignments.i32", np.int32, (capacity,)),
+        )
+        for attr, name, dtype, shape in specs:
+            current = getattr(self, attr)
+            if current is not None:
+                current.flush()
+                setattr(self, attr, None)
+                del current
+
+            filename = self._file(name)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(filename, "ab") as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+            setattr(self, attr, np.memmap(filename, dtype=dtype, mode="r+", shape=shape))
+        self.capacity = capacity
+
+    def add(self, vectors: np.ndarray, user_codes: np.ndarray) -> np.ndarray:
+        """Append unit vectors for the given users; returns their row ids."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, index has {self.dimensions}")
+
+        count = vectors.shape[0]
+        if self.size + count > self.capacity:
+            self._open_arrays(max(self.size + count, self.capacity * 2, 1024))
+
+        rows = np.arange(self.size, self.size + count, dtype=np.int64)
+        self.vectors[rows[0]:rows[-1] + 1] = vectors
+        self.users[rows[0]:rows[-1] + 1] = user_codes
+        self.size += count
+
+        for user in np.unique(user_codes):
+            self._user_rows.setdefault(int(user), GrowableArray()).extend(rows[user_codes == user])
+
+        if self.trained:
+            self.assignments[rows[0]:rows[-1] + 1] = assign_to_centroids(vectors, self.centroids)
+            self._index_postings(rows)
+
+        return rows
+
+    def train(self):
+        """Train the coarse quantizer on a sample and assign every vector."""
+        if self.size >= self.nlist:
+            self.install(*self.fit())
+
+    def fit(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cluster a sample of the current vectors and assign them; returns
+        (centroids, assignments) for `install`. Only reads rows that exist
+        when it starts, so it may run in another thread while rows are added.
+        """
+        # Size before the mapping: growth remaps before the size moves
+        size = self.size
+        vectors = self.vectors
+
+        rng = np.random.default_rng(0)
+        sample_size = min(size, max(self.train_size, self.nlist * 39))
+        sample = np.asarray(vectors[np.sort(rng.choice(size, sample_size, replace=False))])
+        centroids = spherical_kmeans(sample, self.nlist)
+        return centroids, assign_to_centroids(vectors[:size], centroids)
+
+    def install(self, centroids: np.ndarray, assignments: np.ndarray):
+        """Switch to trained centroids, assigning rows added since `fit`."""
+        fitted = assignments.shape[0]
+        self.assignments[:fitted] = assignments
+        if self.size > fitted:
+            self.assignments[fitted:self.size] = assign_to_centroids(self.vectors[fitted:self.size], centroids)
+        np.save(self._file("centroids.npy"), centroids)
+
+        self.centroids = centroids
+        self._postings = {}
+        self._index_postings(np.arange(self.size, dtype=np.int64))
+
+    def _index_postings(self, rows: np.ndarray):
+        """Add rows to the (user, list) posting lists."""
+        users = np.asarray(self.users[rows])
+        lists = np.asarray(self.assignments[rows])
+        order = np.lexsort((lists, users))
+        keys = np.stack([users[order], lists[order]], axis=1)
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        for group in np.split(order, boundaries):
+            if len(group):
+                key = (int(users[group[0]]), int(lists[group[0]]))
+                self._postings.setdefault(key, GrowableArray()).extend(rows[group])
+
+    def search(self, query: np.ndarray, user_code: int, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row_ids, scores) of the best matches for one user."""
+        user_rows = self._user_rows.get(user_code)
+        if user_rows is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        if not self.trained or user_rows.size <= self.brute_force_max:
+            candidates = user_rows.view()
+        else:
+            probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+            parts = [self._postings[(user_code, int(p))].view() for p in probes if (user_code, int(p)) in self._postings]
+            candidates = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def recent(self, user_code: int, limit: int) -> np.ndarray:
+        """Row ids of a user's most recent vectors, newest first."""
+        user_rows = self._user_rows.get(user_code)
+        if user_rows is None or limit <= 0:
+            return np.empty(0, dtype=np.int64)
+        return user_rows.view()[-limit:][::-1]
+
+    def flush(self):
+        """Flush mapped files and metadata to disk."""
+        for array in (self.vectors, self.users, self.assignments):
+            if array is not None:
+                array.flush()
+
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dimensions": self.dimensions, "size": self.size, "capacity": self.capacity}, f)
+        os.replace(tmp, self._file("meta.json"))
@@ -0,0 +1,240 @@
+"""
+Semantic cache of finished research answers.
+Serves a recent report for a near-duplicate query instead of running the
+whole research graph again.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import re
+import time
+
+import numpy as np
+
+from agent.config import settings
+from agent.embeddings import get_embedding_service
+from agent.tools.search_cache import STOPWORDS, normalize_query
+
+
+def query_terms(query: str) -> Tuple[Set[str], Set[str], Set[str]]:
+    """
+    Split a query into (numeric terms, entity names, all terms), in the form
+    normalize_query produces. Numeric terms contain a digit, like "q3",
+    "fy2024" or "15"; entity names are tickers and capitalised words.
+    """
+    tokens = set(normalize_query(query).split())
+    numbers = {t for t in tokens if any(c.isdigit() for c in t)}
+    text = re.sub(r"'s\b", "", query)
+    text = re.sub(r"(?<=\w)[/.&'](?=\w)", "", text)
+    entities = {w.lower() for w in re.findall(r"[A-Za-z0-9]+", text) if w[0].isupper()}
+    return numbers, entities - STOPWORDS, tokens
+
+
+def same_subject(a: str, b: str) -> bool:
+    """
+    Whether two similar queries ask about the same company and period:
+    their numeric terms must match exactly, and every entity name in one must
+    appear in the other. Embeddings score "Q2" and "Q3", or two tickers, as
+    near-duplicates, so similarity alone would serve the wrong report.
+    """
+    numbers_a, entities_a, tokens_a = query_terms(a)
+    numbers_b, entities_b, tokens_b = query_terms(b)
+    return numbers_a == numbers_b and entities_a <= tokens_b and entities_b <= tokens_a
+
+
+class AnswerCacheStats:
+    """Hit-rate counters for the answer cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.mismatches = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "expired": self.expired,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "mismatches": self.mismatches,
+        }
+
+
+class CachedAnswer:
+    """A finished report with the query that produced it."""
+
+    __slots__ = ("query", "answer", "sources", "thinking_trace", "created_at", "refreshing")
+
+    def __init__(self, query: str, answer: str, sources: List[Dict[str, Any]], thinking_trace: List[Dict[str, Any]]):
+        self.query = query
+        self.answer = answer
+        self.sources = sources
+        self.thinking_trace = thinking_trace
+        self.created_at = time.time()
+        self.refreshing = False
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class TenantAnswerIndex:
+    """One tenant's cached answers with their unit query vectors."""
+
+    def __init__(self):
+        self.entries: List[CachedAnswer] = []
+        self.vectors: Optional[np.ndarray] = None
+
+    def add(self, vector: np.ndarray, entry: CachedAnswer, ttl: float, max_entries: int) -> int:
+        """
+        Add an entry, replacing one for the same query and dropping expired
+        and oldest ones; returns how many expired.
+        """
+        same = (self.vectors @ vector >= 0.999) if self.vectors is not None else np.zeros(0, dtype=bool)
+        live = [i for i, e in enumerate(self.entries) if e.age < ttl]
+        expired = len(self.entries) - len(live)
+        keep = [i for i in live if not same[i]]
+        keep = keep[-(max_entries - 1):] if max_entries > 1 else []
+
+        self.entries = [self.entries[i] for i in keep] + [entry]
+        rows = [self.vectors[keep]] if self.vectors is not None and keep else []
+        self.vectors = np.vstack(rows + [vector[None, :]])
+        return expired
+
+    def similar(self, vector: np.ndarray, threshold: float) -> List[Tuple[CachedAnswer, float]]:
+        """Entries at or above the threshold with their cosine similarity, most similar first."""
+        if not self.entries:
+            return []
+        scores = self.vectors @ vector
+        order = np.argsort(-scores)
+        return [(self.entries[i], float(scores[i])) for i in order if scores[i] >= threshold]
+
+
+class SemanticAnswerCache:
+    """
+    Per-tenant semantic cache of research answers.
+
+    A lookup embeds the query and returns the most similar cached answer of
+    the same tenant if its cosine similarity clears the tenant's threshold, it
+    asks about the same entities and periods, and it is younger than the TTL. Hits older than `refresh_after` can be
+    refreshed in the background while the cached answer is served.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        threshold: Optional[float] = None,
+        ttl: Optional[float] = None,
+        refresh_after: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        tenant_thresholds: Optional[Dict[str, float]] = None
+    ):
+        self.embeddings = embeddings or get_embedding_service()
+        self.threshold = threshold if threshold is not None else settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        self.ttl = ttl if ttl is not None else settings.ANSWER_CACHE_TTL_SECONDS
+        self.refresh_after = refresh_after if refresh_after is not None else settings.ANSWER_CACHE_REFRESH_AFTER_SECONDS
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES_PER_TENANT
+        self.tenant_thresholds = tenant_thresholds if tenant_thresholds is not None else settings.ANSWER_CACHE_TENANT_THRESHOLDS
+
+        self.stats = AnswerCacheStats()
+        self._tenants: Dict[str, TenantAnswerIndex] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+
+    def threshold_for(self, tenant: str) -> float:
+        """Similarity a cached query needs to answer this tenant's query."""
+        return self.tenant_thresholds.get(tenant, self.threshold)
+
+    async def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.embed(query.strip()), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    async def lookup(self, tenant: str, query: str) -> Optional[Tuple[CachedAnswer, float]]:
+        """Return (cached answer, similarity) for a near-duplicate query, or None."""
+        index = self._tenants.get(tenant)
+        if index is None:
+            self.stats.misses += 1
+            return None
+
+        candidates = index.similar(await self._embed(query), self.threshold_for(tenant))
+        matches = [(e, score) for e, score in candidates if same_subject(query, e.query)]
+        if not matches:
+            if candidates:
+                self.stats.mismatches += 1
+            self.stats.misses += 1
+            return None
+        entry, similarity = matches[0]
+        if entry.age >= self.ttl:
+            self.stats.expired += 1
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return entry, similarity
+
+    async def store(
+        self,
+        tenant: str,
+        query: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        thinking_trace: List[Dict[str, Any]]
+    ):
+        """Cache a finished answer; empty answers are not cached."""
+        if not answer:
+            return
+        vector = await self._embed(query)
+        index = self._tenants.setdefault(tenant, TenantAnswerIndex())
+        self.stats.expired += index.add(vector, CachedAnswer(query, answer, sources, thinking_trace), self.ttl, self.max_entries)
+        self.stats.stores += 1
+
+    def needs_refresh(self, entry: CachedAnswer) -> bool:
+        """Whether a served entry is old enough to be recomputed."""
+        return bool(self.refresh_after) and entry.age >= self.refresh_after and not entry.refreshing
+
+    def schedule_refresh(self, tenant: str, entry: CachedAnswer, run: Callable[[], Awaitable[Dict[str, Any]]]):
+        """
+        Recompute an entry in the background with `run`, which returns the
+        final research state, and cache the result. One refresh per entry.
+        """
+        entry.refreshing = True
+
+        async def refresh():
+            try:
+                state = await run()
+                await self.store(tenant, entry.query, state.get("final_answer", ""), state.get("sources", []), state.get("thinking_trace", []))
+                self.stats.refreshes += 1
+            except Exception as e:
+                print(f"Answer cache refresh failed for {entry.query!r}: {e}")
+                self.stats.refresh_failures += 1
+                entry.refreshing = False
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def close(self):
+        """Cancel refreshes still running."""
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        self._refresh_tasks.clear()
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Get the shared answer cache, or None when it is disabled."""
+    global _answer_cache
+    if _answer_cache is None and settings.ANSWER_CACHE_ENABLED:
+        _answer_cache = SemanticAnswerCache()
+    return _answer_cache
@@ -0,0 +1,209 @@
+"""
+Key-value cache backends.
+Shared by the tool caches: in-process LRU, local SQLite and Redis.
+"""
+from typing import Any, Optional
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from agent.config import settings
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """Get the process-wide async Redis client (created lazily)."""
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as redis
+
+        _redis_client = redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+async def close_redis_client():
+    """Close the shared Redis client."""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+
+def _encoded_size(value: Any) -> int:
+    return len(json.dumps(value, default=str))
+
+
+class InMemoryCache:
+    """In-process LRU cache bounded by total bytes and/or entry count."""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value, refreshing its LRU position."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, _, value = item
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Set a value, evicting least recently used entries over budget."""
+        size = _encoded_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        if key in self._data:
+            self._remove(key)
+
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (expires_at, size, value)
+        self.total_bytes += size
+
+        while self._over_budget():
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        """Delete a value."""
+        if key in self._data:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self._data) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.total_bytes > self.max_bytes
+
+
+class SQLiteCache:
+    """Local on-disk cache backed by a single SQLite table."""
+
+    def __init__(self, path: str, table: str = "cache"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.table = table
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self.conn.commit()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value."""
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Set a value."""
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        """Delete a value."""
+        await asyncio.to_thread(self._delete, key)
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self._delete(key)
+            return None
+        return json.loads(value)
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), expires_at)
+            )
+            self.conn.commit()
+
+    def _delete(self, key: str):
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.conn.commit()
+
+
+class RedisCache:
+    """Redis-backed cache shared across agent replicas."""
+
+    def __init__(self, prefix: str, client=None):
+        self.prefix = prefix
+        self.client = client or get_redis_client()
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value."""
+        raw = await self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Set a value."""
+        await self.client.set(
+            self._key(key),
+            json.dumps(value, default=str),
+            ex=int(ttl) if ttl else None
+        )
+
+    async def delete(self, key: str):
+        """Delete a value."""
+        await self.client.delete(self._key(key))
+
+
+def create_cache(
+    backend: str,
+    namespace: str,
+    max_bytes: Optional[int] = None,
+    max_entries: Optional[int] = None,
+    path: Optional[str] = None
+):
+    """Create a cache backend by name: memory, sqlite, redis or none."""
+    backend = backend.lower()
+
+    if backend == "none":
+        return None
+    elif backend == "memory":
+        return InMemoryCache(max_bytes=max_bytes, max_entries=max_entries)
+    elif backend == "sqlite":
+        return SQLiteCache(path or os.path.join(settings.CACHE_DIR, f"{namespace}.sqlite3"))
+    elif backend == "redis":
+        return RedisCache(prefix=namespace)
+    else:
+        raise ValueError(f"Unsupported cache backend: {backend}")
@@ -1,20 +1,58 @@
 """Checkpointer for LangGraph state persistence."""
-from langgraph.checkpoint.postgres import PostgresSaver
 from langgraph.checkpoint.memory import MemorySaver
 from agent.config import settings
-import psycopg2
 
 
-def get_checkpointer():
+_pool = None
+
+
+async def open_checkpointer():
     """
-    Get checkpointer based on configuration.
-    Uses PostgreSQL for production, memory for development.
+    Open the checkpointer selected by CHECKPOINTER.
+    PostgreSQL uses a pooled AsyncPostgresSaver and is checked before it is
+    returned, so a misconfigured database fails startup instead of silently
+    falling back to memory. Use CHECKPOINTER=memory for development.
     """
+    global _pool
+    backend = settings.CHECKPOINTER.lower()
+
+    if backend == "memory":
+        return MemorySaver()
+    if backend != "postgres":
+        raise ValueError(f"Unsupported checkpointer: {backend}")
+
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    pool = AsyncConnectionPool(
+        conninfo=settings.DATABASE_URL,
+        min_size=settings.CHECKPOINT_POOL_MIN_SIZE,
+        max_size=settings.CHECKPOINT_POOL_MAX_SIZE,
+        open=False,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+    )
+
     try:
-        # Try PostgreSQL checkpointer
-        conn = psycopg2.connect(settings.DATABASE_URL)
-        return PostgresSaver(conn)
+        await pool.open(wait=True, timeout=settings.CHECKPOINT_POOL_TIMEOUT_SECONDS)
+
+        # Readiness check
+        async with pool.connection() as conn:
+            await conn.execute("SELECT 1")
+
+        checkpointer = AsyncPostgresSaver(pool)
+        await checkpointer.setup()
     except Exception as e:
-        print(f"Warning: Could not connect to PostgreSQL for checkpointing: {e}")
-        print("Falling back to in-memory checkpointer")
-        return MemorySaver()
+        await pool.close()
+        raise RuntimeError(f"PostgreSQL checkpointer is not ready: {e}") from e
+
+    _pool = pool
+    return checkpointer
+
+
+async def close_checkpointer():
+    """Close the checkpointer connection pool."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,158 @@
+"""
+Token-budgeted context assembly for LLM prompts.
+Ranks source text by relevance to the query, drops near-duplicate passages
+and fills a per-node token budget measured with the provider's tokenizer.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+import hashlib
+import re
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken.
+    OpenAI models use their own encoding; other providers do not publish a
+    local tokenizer, so cl100k_base serves as a close estimate. Without
+    tiktoken, falls back to four characters per token.
+    """
+
+    def __init__(self, provider: str = "openai", model: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        self.encoding = None
+        try:
+            import tiktoken
+
+            try:
+                if provider == "openai" and model:
+                    self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+            if self.encoding is None:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating token counts: {e}")
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text."""
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+@lru_cache(maxsize=None)
+def _counter(provider: str, model: str) -> TokenCounter:
+    return TokenCounter(provider, model)
+
+
+def get_token_counter(role: str = "default") -> TokenCounter:
+    """Token counter for the model configured for a role."""
+    from agent.llm import resolve_llm_config
+
+    provider, model, _ = resolve_llm_config(role)
+    return _counter(provider, model)
+
+
+def terms(text: str) -> Set[str]:
+    """Lowercased word terms of a text, ignoring very short words."""
+    return {t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 2 or t.isdigit()}
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """Hashed word n-grams used to detect overlapping passages."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {_hash(" ".join(words))} if words else set()
+    return {_hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def overlap(a: Set[int], b: Set[int]) -> float:
+    """Share of the smaller shingle set found in the other (catches contained passages)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def relevance(text: str, query_terms: Set[str]) -> float:
+    """Fraction of query terms present in the text."""
+    if not query_terms:
+        return 0.0
+    return len(query_terms & terms(text)) / len(query_terms)
+
+
+def pack_context(
+    items: List[Dict[str, Any]],
+    query: str,
+    questions: Optional[List[str]] = None,
+    budget: int = 4000,
+    counter: Optional[TokenCounter] = None,
+    text_key: str = "content",
+    max_item_tokens: Optional[int] = None,
+    max_overlap: float = 0.8,
+    min_item_tokens: int = 50,
+    truncate: bool = True,
+    scores: Optional[List[float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Select item texts for a prompt within a token budget.
+
+    Items are ranked by relevance to the query and key questions, or by
+    `scores` when the caller has ranked them already; ties keep their
+    original order. Items overlapping an already selected one by more
+    than `max_overlap` are skipped, each item is cut to `max_item_tokens`,
+    and the last one that fits is truncated to the remaining budget (or
+    skipped when `truncate` is False, for items that must stay whole).
+
+    Returns [{"index", "item", "text", "tokens", "score"}], best first, where
+    index is the item's position in `items`.
+    """
+    counter = counter or TokenCounter()
+    query_terms = terms(" ".join([query] + list(questions or [])))
+
+    if scores is None:
+        scores = [relevance(item.get(text_key) or "", query_terms) for item in items]
+    ranked = sorted(zip(scores, range(len(items))), key=lambda pair: (-pair[0], pair[1]))
+
+    selected: List[Dict[str, Any]] = []
+    selected_shingles: List[Set[int]] = []
+    remaining = budget
+
+    for score, index in ranked:
+        if remaining < min_item_tokens:
+            break
+        text = items[index].get(text_key) or ""
+        if not text.strip():
+            continue
+
+        item_shingles = shingles(text)
+        if any(overlap(item_shingles, other) > max_overlap for other in selected_shingles):
+            continue
+
+        limit = min(remaining, max_item_tokens or remaining)
+        if truncate:
+            text = counter.truncate(text, limit)
+        tokens = counter.count(text)
+        if tokens > limit:
+            continue
+
+        selected.append({"index": index, "item": items[index], "text": text, "tokens": tokens, "score": score})
+        selected_shingles.append(item_shingles)
+        remaining -= tokens
+
+    return selected
@@ -0,0 +1,209 @@
+"""
+Embedding service shared by memory and retrieval.
+Reuses one embedding client, caches vectors by text hash in memory and on
+disk, and merges concurrent embed calls into batched API requests.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import re
+
+import numpy as np
+
+from agent.cache import InMemoryCache, SQLiteCache
+from agent.config import settings
+
+
+class HashingEmbeddings:
+    """
+    Local feature-hashing embedding model.
+    Deterministic and dependency-free, for offline use and tests; similar
+    texts get similar vectors through shared words and word bigrams.
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+        self.model_id = f"hashing-{dimensions}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = re.findall(r"[a-z0-9]+", text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                vectors[row, (value >> 1) % self.dimensions] += sign
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+        return self.embed_documents(texts)
+
+
+class SentenceTransformerEmbeddings:
+    """Local sentence-transformers model (optional dependency)."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.model_id = f"st-{model_name}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+        return self.model.encode(texts, normalize_embeddings=True).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts off the event loop."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+
+def create_embedding_model(provider: Optional[str] = None):
+    """Create the embedding model for a provider: openai, sentence-transformers or hashing."""
+    provider = (provider or settings.EMBEDDING_PROVIDER).lower()
+
+    if provider == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL or "text-embedding-ada-002",
+            api_key=settings.OPENAI_API_KEY
+        )
+    elif provider == "sentence-transformers":
+        return SentenceTransformerEmbeddings(settings.EMBEDDING_MODEL or "all-MiniLM-L6-v2")
+    elif provider == "hashing":
+        return HashingEmbeddings(settings.EMBEDDING_DIMENSIONS)
+    else:
+        raise ValueError(f"Unsupported embedding provider: {provider}")
+
+
+def _encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+def _decode_vector(encoded: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32).tolist()
+
+
+class EmbeddingService:
+    """
+    Async embedding service.
+
+    Lookups go through an in-process LRU and an optional SQLite cache keyed by
+    a hash of (model, text). Misses are queued for a short window and sent to
+    the model as one batch; identical texts in flight share one request.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        max_cache_entries: Optional[int] = None,
+        disk_cache_path: Optional[str] = None,
+        batch_window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        self.model = model or create_embedding_model()
+        self.model_id = getattr(self.model, "model_id", None) or \
+            f"{type(self.model).__name__}-{getattr(self.model, 'model', '')}"
+        self.memory_cache = InMemoryCache(max_entries=max_cache_entries or settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        self.disk_cache = SQLiteCache(disk_cache_path, table="embeddings") if disk_cache_path else None
+        self.batch_window = (batch_window_ms if batch_window_ms is not None else settings.EMBEDDING_BATCH_WINDOW_MS) / 1000
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+
+        self.api_calls = 0
+        self.cache_hits = 0
+        self._pending: List[Tuple[str, str]] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode()).hexdigest()
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text."""
+        key = self._key(text)
+
+        cached = await self.memory_cache.get(key)
+        if cached is None and self.disk_cache is not None:
+            encoded = await self.disk_cache.get(key)
+            if encoded is not None:
+                cached = _decode_vector(encoded)
+                await self.memory_cache.set(key, cached)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append((key, text))
+            self._schedule_flush()
+        return await asyncio.shield(future)
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts; misses are batched together."""
+        return list(await asyncio.gather(*[self.embed(text) for text in texts]))
+
+    def _schedule_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.max_batch_size:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            loop.create_task(self._flush())
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, lambda: loop.create_task(self._flush()))
+
+    async def _flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._schedule_flush()
+        if not batch:
+            return
+
+        try:
+            self.api_calls += 1
+            vectors = await self.model.aembed_documents([text for _, text in batch])
+        except Exception as e:
+            for key, _ in batch:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        # The memory tier serves repeat lookups, so waiters need not wait for disk
+        for (key, _), vector in zip(batch, vectors):
+            await self.memory_cache.set(key, vector)
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(vector)
+
+        if self.disk_cache is not None:
+            try:
+                for (key, _), vector in zip(batch, vectors):
+                    await self.disk_cache.set(key, _encode_vector(vector))
+            except Exception as e:
+                print(f"Error writing embeddings to disk cache: {e}")
+
+
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Get the shared embedding service."""
+    global _embedding_service
+    if _embedding_service is None:
+        disk_path = None
+        if settings.EMBEDDING_DISK_CACHE:
+            disk_path = f"{settings.CACHE_DIR}/embeddings.sqlite3"
+        _embedding_service = EmbeddingService(disk_cache_path=disk_path)
+    return _embedding_service
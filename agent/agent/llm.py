@@ -1,31 +1,104 @@
 """LLM provider abstraction."""
+from typing import Dict, Tuple, Any
+import threading
+
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from agent.config import settings
 
 
-def get_llm():
-    """Get configured LLM based on settings."""
-    provider = settings.LLM_PROVIDER.lower()
-    
+# Roles a client can be configured for; each may override provider/model/temperature
+LLM_ROLES = ("planning", "analysis", "synthesis", "memory")
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4-turbo-preview",
+    "anthropic": "claude-3-sonnet-20240229",
+    "google": "gemini-pro",
+}
+
+_registry: Dict[Tuple[str, str, float, str], Any] = {}
+_registry_lock = threading.Lock()
+
+
+def resolve_llm_config(role: str = "default") -> Tuple[str, str, float]:
+    """
+    Resolve (provider, model, temperature) for a role.
+    Role settings such as SYNTHESIS_LLM_MODEL override the global ones.
+    """
+    prefix = role.upper()
+    provider = getattr(settings, f"{prefix}_LLM_PROVIDER", None) or settings.LLM_PROVIDER
+    provider = provider.lower()
+
+    if provider not in DEFAULT_MODELS:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    model = getattr(settings, f"{prefix}_LLM_MODEL", None) or settings.LLM_MODEL or DEFAULT_MODELS[provider]
+
+    temperature = getattr(settings, f"{prefix}_TEMPERATURE", None)
+    if temperature is None:
+        temperature = settings.TEMPERATURE
+
+    return provider, model, temperature
+
+
+def create_llm(provider: str, model: str, temperature: float):
+    """
+    Construct a new chat model client.
+    With rate limiting on, the limiter retries calls, so the SDK does not.
+    """
+    options = {"max_retries": 0} if settings.RATE_LIMIT_ENABLED else {}
     if provider == "openai":
         return ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=settings.TEMPERATURE,
-            api_key=settings.OPENAI_API_KEY
+            model=model,
+            temperature=temperature,
+            api_key=settings.OPENAI_API_KEY,
+            **options
         )
     elif provider == "anthropic":
         return ChatAnthropic(
-            model="claude-3-sonnet-20240229",
-            temperature=settings.TEMPERATURE,
-            api_key=settings.ANTHROPIC_API_KEY
+            model=model,
+            temperature=temperature,
+            api_key=settings.ANTHROPIC_API_KEY,
+            **options
         )
     elif provider == "google":
         return ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            temperature=settings.TEMPERATURE,
-            google_api_key=settings.GOOGLE_API_KEY
+            model=model,
+            temperature=temperature,
+            google_api_key=settings.GOOGLE_API_KEY,
+            **options
         )
     else:
         raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def get_llm(role: str = "default"):
+    """
+    Get the shared LLM client for a role.
+    Clients are cached by (provider, model, temperature, role) and reused
+    across requests; chat models are safe to call concurrently.
+    """
+    provider, model, temperature = resolve_llm_config(role)
+    key = (provider, model, temperature, role)
+
+    llm = _registry.get(key)
+    if llm is None:
+        with _registry_lock:
+            llm = _registry.get(key)
+            if llm is None:
+                llm = create_llm(provider, model, temperature)
+                _registry[key] = llm
+    return llm
+
+
+def warmup_llms():
+    """Build the clients for every role at startup."""
+    for role in LLM_ROLES:
+        get_llm(role)
+
+
+def clear_llm_registry():
+    """Drop cached clients (e.g. after changing settings in tests)."""
+    with _registry_lock:
+        _registry.clear()
@@ -3,12 +3,22 @@ Memory management for long-term episodic and semantic memory.
 Supports multiple vector store backends.
 """
 from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
 import json
+import os
+import sqlite3
+import threading
+import uuid
 from datetime import datetime
 import numpy as np
 
 from agent.config import settings
+from agent.cache import get_redis_client
 from agent.llm import get_llm
+from agent.embeddings import get_embedding_service
+from agent.ann_index import IVFIndex, top_k
+from agent.telemetry import traced
 
 
 class MemoryManager:
@@ -16,7 +26,8 @@ class MemoryManager:
     
     def __init__(self):
         self.vector_store = self._init_vector_store()
-        self.llm = get_llm()
+        self.llm = get_llm("memory")
+        self.embeddings = get_embedding_service()
     
     def _init_vector_store(self):
         """Initialize vector store based on configuration."""
@@ -28,6 +39,8 @@ class MemoryManager:
             return PgVectorStore()
         elif store_type == "mongodb":
             return MongoDBStore()
+        elif store_type == "ann":
+            return AnnStore()
         else:
             return InMemoryStore()
     
@@ -40,25 +53,47 @@ class MemoryManager:
         sources: List[Dict[str, Any]]
     ):
         """Save an interaction to long-term memory."""
-        # Create memory content
-        content = f"Query: {query}\n\nAnswer: {answer}\n\nSources: {len(sources)} sources"
+        await self.save_interactions([{
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "query": query,
+            "answer": answer,
+            "sources": sources
+        }])
+    
+    @traced("memory.save", kind="memory")
+    async def save_interactions(self, interactions: List[Dict[str, Any]]):
+        """
+        Save several interactions with one batched embedding request and one
+        vector store write.
+        """
+        records = []
+        for interaction in interactions:
+            # Create memory content
+            content = (
+                f"Query: {interaction['query']}\n\nAnswer: {interaction['answer']}"
+                f"\n\nSources: {len(interaction['sources'])} sources"
+            )
+            records.append({
+                "user_id": interaction["user_id"],
+                "content": content,
+                "metadata": {
+                    "thread_id": interaction["thread_id"],
+                    "query": interaction["query"],
+                    "timestamp": interaction.get("timestamp") or datetime.utcnow().isoformat(),
+                    "source_count": len(interaction["sources"])
+                }
+            })
         
-        # Generate embedding
-        embedding = await self._generate_embedding(content)
+        # Generate embeddings
+        embeddings = await self.embeddings.embed_many([r["content"] for r in records])
+        for record, embedding in zip(records, embeddings):
+            record["embedding"] = embedding
         
         # Save to vector store
-        await self.vector_store.save(
-            user_id=user_id,
-            content=content,
-            embedding=embedding,
-            metadata={
-                "thread_id": thread_id,
-                "query": query,
-                "timestamp": datetime.utcnow().isoformat(),
-                "source_count": len(sources)
-            }
-        )
+        await self.vector_store.save_many(records)
     
+    @traced("memory.retrieve", kind="memory")
     async def retrieve_relevant_memories(
         self,
         user_id: str,
@@ -78,21 +113,24 @@ class MemoryManager:
         
         return results
     
+    @traced("memory.recent", kind="memory")
     async def get_user_memories(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent memories for a user."""
         return await self.vector_store.get_recent(user_id, limit)
     
     async def _generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text."""
-        from langchain_openai import OpenAIEmbeddings
-        
-        embeddings = OpenAIEmbeddings(api_key=settings.OPENAI_API_KEY)
-        embedding = embeddings.embed_query(text)
-        return embedding
+        return await self.embeddings.embed(text)
 
 
 class PineconeStore:
-    """Pinecone vector store implementation."""
+    """
+    Pinecone vector store implementation.
+    Vector IDs are "<user_id>#<epoch_ms>#<suffix>" so they sort by time, and a
+    Redis sorted set per user serves as the recency index.
+    """
+    
+    UPSERT_BATCH_SIZE = 100
     
     def __init__(self):
         from pinecone import Pinecone
@@ -100,115 +138,266 @@ class PineconeStore:
         self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
         self.index = self.pc.Index(settings.PINECONE_INDEX_NAME)
     
+    def _recent_key(self, user_id: str) -> str:
+        return f"pinecone:recent:{settings.PINECONE_INDEX_NAME}:{user_id}"
+    
     async def save(self, user_id: str, content: str, embedding: List[float], metadata: Dict):
         """Save to Pinecone."""
-        vector_id = f"{user_id}_{metadata['timestamp']}"
-        self.index.upsert(vectors=[{
-            "id": vector_id,
-            "values": embedding,
-            "metadata": {
-                **metadata,
-                "user_id": user_id,
-                "content": content
-            }
-        }])
+        await self.save_many([{"user_id": user_id, "content": content, "embedding": embedding, "metadata": metadata}])
+    
+    async def save_many(self, records: List[Dict[str, Any]]):
+        """Upsert a batch of memories and add them to the recency index."""
+        vectors = []
+        recent: Dict[str, Dict[str, float]] = {}
+        for r in records:
+            timestamp_ms = int(datetime.fromisoformat(r["metadata"]["timestamp"]).timestamp() * 1000)
+            vector_id = f"{r['user_id']}#{timestamp_ms:013d}#{uuid.uuid4().hex[:8]}"
+            vectors.append({
+                "id": vector_id,
+                "values": r["embedding"],
+                "metadata": {
+                    **r["metadata"],
+                    "user_id": r["user_id"],
+                    "content": r["content"]
+                }
+            })
+            recent.setdefault(r["user_id"], {})[vector_id] = timestamp_ms
+        
+        await asyncio.gather(*[
+            asyncio.to_thread(self.index.upsert, vectors=vectors[i:i + self.UPSERT_BATCH_SIZE])
+            for i in range(0, len(vectors), self.UPSERT_BATCH_SIZE)
+        ])
+        
+        try:
+            redis = get_redis_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                for user_id, members in recent.items():
+                    pipe.zadd(self._recent_key(user_id), members)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Pinecone recency index update failed: {e}")
     
     async def search(self, user_id: str, embedding: List[float], limit: int) -> List[Dict]:
         """Search Pinecone."""
-        results = self.index.query(
-            vector=embedding,
-            filter={"user_id": user_id},
-            top_k=limit,
-            include_metadata=True
-        )
+        return (await self.search_many(user_id, [embedding], limit))[0]
+    
+    async def search_many(self, user_id: str, embeddings: List[List[float]], limit: int) -> List[List[Dict]]:
+        """Run several queries for one user concurrently."""
+        responses = await asyncio.gather(*[
+            asyncio.to_thread(
+                self.index.query,
+                vector=embedding,
+                filter={"user_id": user_id},
+                top_k=limit,
+                include_metadata=True
+            )
+            for embedding in embeddings
+        ])
         
         return [
-            {
-                "content": match["metadata"]["content"],
-                "metadata": match["metadata"],
-                "score": match["score"]
-            }
-            for match in results["matches"]
+            [
+                {
+                    "content": match["metadata"]["content"],
+                    "metadata": match["metadata"],
+                    "score": match["score"]
+                }
+                for match in response["matches"]
+            ]
+            for response in responses
         ]
     
     async def get_recent(self, user_id: str, limit: int) -> List[Dict]:
-        """Get recent memories."""
-        # Pinecone doesn't support direct time-based queries
-        # This is a simplified implementation
-        return []
+        """Get recent memories via the recency index, newest first."""
+        try:
+            raw_ids = await get_redis_client().zrevrange(self._recent_key(user_id), 0, limit - 1)
+            ids = [i.decode() if isinstance(i, bytes) else i for i in raw_ids]
+        except Exception as e:
+            print(f"Pinecone recency index unavailable, listing IDs: {e}")
+            ids = await asyncio.to_thread(self._list_recent_ids, user_id, limit)
+        
+        if not ids:
+            return []
+        
+        response = await asyncio.to_thread(self.index.fetch, ids=ids)
+        vectors = response["vectors"]
+        return [
+            {"content": vectors[i]["metadata"]["content"], "metadata": vectors[i]["metadata"]}
+            for i in ids if i in vectors
+        ]
+    
+    def _list_recent_ids(self, user_id: str, limit: int) -> List[str]:
+        """Fallback: list the user's time-sortable IDs by prefix (serverless indexes)."""
+        ids = [vector_id for page in self.index.list(prefix=f"{user_id}#") for vector_id in page]
+        return sorted(ids, reverse=True)[:limit]
 
 
 class PgVectorStore:
-    """PostgreSQL with pgvector extension."""
+    """
+    PostgreSQL with pgvector extension.
+    
+    Uses an async psycopg connection pool with binary vector encoding, an
+    HNSW index for cosine search, a (user_id, created_at) index for the
+    per-user filter and recency, and COPY for bulk inserts. ef_search and
+    ivfflat probes can be tuned per query.
+    """
     
     def __init__(self):
-        import psycopg2
-        from psycopg2.extras import Json
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+    
+    async def _get_pool(self):
+        """Open the pool and ensure the schema on first use."""
+        if self.pool is not None:
+            return self.pool
         
-        self.conn = psycopg2.connect(settings.DATABASE_URL)
-        self._ensure_table()
-    
-    def _ensure_table(self):
-        """Ensure vector table exists."""
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE EXTENSION IF NOT EXISTS vector;
+        async with self._pool_lock:
+            if self.pool is None:
+                import psycopg
+                from psycopg_pool import AsyncConnectionPool
+                
+                # The extension must exist before connections register the vector type
+                async with await psycopg.AsyncConnection.connect(settings.DATABASE_URL, autocommit=True) as conn:
+                    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
                 
+                pool = AsyncConnectionPool(
+                    conninfo=settings.DATABASE_URL,
+                    min_size=settings.PGVECTOR_POOL_MIN_SIZE,
+                    max_size=settings.PGVECTOR_POOL_MAX_SIZE,
+                    configure=self._configure,
+                    open=False
+                )
+                await pool.open(wait=True)
+                await self._ensure_table(pool)
+                self.pool = pool
+        return self.pool
+    
+    async def _configure(self, conn):
+        from pgvector.psycopg import register_vector_async
+        
+        await register_vector_async(conn)
+        await conn.set_autocommit(True)
+    
+    async def _ensure_table(self, pool):
+        """Ensure vector table and indexes exist."""
+        async with pool.connection() as conn:
+            await conn.execute(f"""
                 CREATE TABLE IF NOT EXISTS memory_vectors (
-                    id SERIAL PRIMARY KEY,
+                    id BIGSERIAL PRIMARY KEY,
                     user_id TEXT NOT NULL,
                     content TEXT NOT NULL,
-                    embedding vector(1536),
+                    embedding vector({settings.EMBEDDING_DIMENSIONS}),
                     metadata JSONB,
                     created_at TIMESTAMP DEFAULT NOW()
                 );
                 
-                CREATE INDEX IF NOT EXISTS memory_vectors_user_idx ON memory_vectors(user_id);
-                CREATE INDEX IF NOT EXISTS memory_vectors_embedding_idx ON memory_vectors 
-                USING ivfflat (embedding vector_cosine_ops);
+                -- Serves the user_id filter and recency ordering
+                CREATE INDEX IF NOT EXISTS memory_vectors_user_recent_idx
+                ON memory_vectors (user_id, created_at DESC);
+                DROP INDEX IF EXISTS memory_vectors_user_idx;
+                
+                -- HNSW needs no training data, unlike the old ivfflat index built on an empty table
+                DROP INDEX IF EXISTS memory_vectors_embedding_idx;
+                CREATE INDEX IF NOT EXISTS memory_vectors_embedding_hnsw_idx ON memory_vectors
+                USING hnsw (embedding vector_cosine_ops)
+                WITH (m = {settings.PGVECTOR_HNSW_M}, ef_construction = {settings.PGVECTOR_HNSW_EF_CONSTRUCTION});
             """)
-            self.conn.commit()
+    
+    async def create_user_index(self, user_id: str):
+        """
+        Build a partial HNSW index for one large tenant so its searches do
+        not filter through other users' neighbours.
+        """
+        from psycopg import sql
+        
+        pool = await self._get_pool()
+        name = f"memory_vectors_user_{hashlib.sha1(user_id.encode()).hexdigest()[:16]}_hnsw_idx"
+        async with pool.connection() as conn:
+            await conn.execute(
+                sql.SQL(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON memory_vectors "
+                    "USING hnsw (embedding vector_cosine_ops) WHERE user_id = {}"
+                ).format(sql.Identifier(name), sql.Literal(user_id))
+            )
     
     async def save(self, user_id: str, content: str, embedding: List[float], metadata: Dict):
         """Save to pgvector."""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO memory_vectors (user_id, content, embedding, metadata)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (user_id, content, embedding, json.dumps(metadata))
-            )
-            self.conn.commit()
+        await self.save_many([{"user_id": user_id, "content": content, "embedding": embedding, "metadata": metadata}])
     
-    async def search(self, user_id: str, embedding: List[float], limit: int) -> List[Dict]:
-        """Search pgvector."""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT content, metadata, 1 - (embedding <=> %s::vector) as score
-                FROM memory_vectors
-                WHERE user_id = %s
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-                """,
-                (embedding, user_id, embedding, limit)
-            )
-            
-            results = []
-            for row in cur.fetchall():
-                results.append({
-                    "content": row[0],
-                    "metadata": row[1],
-                    "score": row[2]
-                })
-            
-            return results
+    async def save_many(self, records: List[Dict[str, Any]]):
+        """Bulk insert with binary COPY in one transaction."""
+        from psycopg.types.json import Jsonb
+        
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    async with cur.copy(
+                        "COPY memory_vectors (user_id, content, embedding, metadata) FROM STDIN WITH (FORMAT BINARY)"
+                    ) as copy:
+                        copy.set_types(["text", "text", "vector", "jsonb"])
+                        for r in records:
+                            await copy.write_row((
+                                r["user_id"],
+                                r["content"],
+                                np.asarray(r["embedding"], dtype=np.float32),
+                                Jsonb(r["metadata"])
+                            ))
+    
+    async def search(
+        self,
+        user_id: str,
+        embedding: List[float],
+        limit: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[Dict]:
+        """Search pgvector; ef_search (HNSW) and probes (ivfflat) trade recall for latency."""
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "SELECT set_config('hnsw.ef_search', %s, true)",
+                    (str(max(ef_search or settings.PGVECTOR_EF_SEARCH, limit)),)
+                )
+                if settings.PGVECTOR_ITERATIVE_SCAN:
+                    # Keep scanning the graph until enough rows pass the user filter (pgvector >= 0.8)
+                    await conn.execute(
+                        "SELECT set_config('hnsw.iterative_scan', %s, true)",
+                        (settings.PGVECTOR_ITERATIVE_SCAN,)
+                    )
+                if probes or settings.PGVECTOR_IVFFLAT_PROBES:
+                    await conn.execute(
+                        "SELECT set_config('ivfflat.probes', %s, true)",
+                        (str(probes or settings.PGVECTOR_IVFFLAT_PROBES),)
+                    )
+                
+                # Query vector is sent once, in binary
+                cur = await conn.execute(
+                    """
+                    SELECT content, metadata, embedding <=> %(query)b AS distance
+                    FROM memory_vectors
+                    WHERE user_id = %(user_id)s
+                    ORDER BY distance
+                    LIMIT %(limit)s
+                    """,
+                    {
+                        "query": np.asarray(embedding, dtype=np.float32),
+                        "user_id": user_id,
+                        "limit": limit
+                    }
+                )
+                rows = await cur.fetchall()
+        
+        return [
+            {"content": content, "metadata": metadata, "score": 1 - distance}
+            for content, metadata, distance in rows
+        ]
     
     async def get_recent(self, user_id: str, limit: int) -> List[Dict]:
         """Get recent memories."""
-        with self.conn.cursor() as cur:
-            cur.execute(
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(
                 """
                 SELECT content, metadata
                 FROM memory_vectors
@@ -218,82 +407,350 @@ class PgVectorStore:
                 """,
                 (user_id, limit)
             )
-            
-            return [{"content": row[0], "metadata": row[1]} for row in cur.fetchall()]
+            return [{"content": row[0], "metadata": row[1]} for row in await cur.fetchall()]
 
 
 class MongoDBStore:
-    """MongoDB Atlas Vector Search."""
+    """
+    MongoDB vector store.
+    Uses an Atlas Vector Search index when one exists; otherwise scores the
+    user's memories client-side in one vectorized pass.
+    """
     
     def __init__(self):
-        from pymongo import MongoClient
+        from pymongo import MongoClient, ASCENDING, DESCENDING
         
         self.client = MongoClient(settings.DATABASE_URL)
         self.db = self.client.finance_chatbot
         self.collection = self.db.memories
+        self.collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        self.vector_index_available = self._has_vector_index()
+    
+    def _has_vector_index(self) -> bool:
+        """Check for the Atlas Vector Search index (not available outside Atlas)."""
+        try:
+            names = [index["name"] for index in self.collection.list_search_indexes()]
+            return settings.MONGODB_VECTOR_INDEX in names
+        except Exception:
+            return False
     
     async def save(self, user_id: str, content: str, embedding: List[float], metadata: Dict):
         """Save to MongoDB."""
-        self.collection.insert_one({
-            "user_id": user_id,
-            "content": content,
-            "embedding": embedding,
-            "metadata": metadata,
-            "created_at": datetime.utcnow()
-        })
+        await self.save_many([{"user_id": user_id, "content": content, "embedding": embedding, "metadata": metadata}])
+    
+    async def save_many(self, records: List[Dict[str, Any]]):
+        """Save a batch of memories."""
+        created_at = datetime.utcnow()
+        await asyncio.to_thread(self.collection.insert_many, [
+            {
+                "user_id": r["user_id"],
+                "content": r["content"],
+                "embedding": r["embedding"],
+                "metadata": r["metadata"],
+                "created_at": created_at
+            }
+            for r in records
+        ], ordered=False)
     
     async def search(self, user_id: str, embedding: List[float], limit: int) -> List[Dict]:
         """Search MongoDB with vector search."""
-        # Simplified - requires Atlas Vector Search index
-        results = self.collection.find({"user_id": user_id}).limit(limit)
-        return [{"content": r["content"], "metadata": r["metadata"]} for r in results]
+        return (await self.search_many(user_id, [embedding], limit))[0]
+    
+    async def search_many(self, user_id: str, embeddings: List[List[float]], limit: int) -> List[List[Dict]]:
+        """Run several queries for one user."""
+        if self.vector_index_available:
+            try:
+                return await asyncio.gather(*[
+                    asyncio.to_thread(self._vector_search, user_id, embedding, limit)
+                    for embedding in embeddings
+                ])
+            except Exception as e:
+                print(f"Atlas vector search failed, using client-side search: {e}")
+                self.vector_index_available = False
+        
+        return await asyncio.to_thread(self._client_side_search, user_id, embeddings, limit)
+    
+    def _vector_search(self, user_id: str, embedding: List[float], limit: int) -> List[Dict]:
+        """$vectorSearch aggregation; the index must declare user_id as a filter field."""
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": settings.MONGODB_VECTOR_INDEX,
+                    "path": "embedding",
+                    "queryVector": embedding,
+                    "numCandidates": limit * settings.MONGODB_NUM_CANDIDATES_FACTOR,
+                    "limit": limit,
+                    "filter": {"user_id": user_id}
+                }
+            },
+            {"$project": {"_id": 0, "content": 1, "metadata": 1, "score": {"$meta": "vectorSearchScore"}}}
+        ]
+        return list(self.collection.aggregate(pipeline))
+    
+    def _client_side_search(self, user_id: str, embeddings: List[List[float]], limit: int) -> List[List[Dict]]:
+        """Score all of the user's memories against every query in one matrix product."""
+        docs = list(self.collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "content": 1, "metadata": 1, "embedding": 1}
+        ))
+        if not docs:
+            return [[] for _ in embeddings]
+        
+        matrix = np.stack([normalize_vector(d["embedding"]) for d in docs])
+        queries = np.stack([normalize_vector(e) for e in embeddings])
+        scores = queries @ matrix.T
+        
+        return [
+            [
+                {"content": docs[i]["content"], "metadata": docs[i]["metadata"], "score": float(row[i])}
+                for i in top_k(row, limit)
+            ]
+            for row in scores
+        ]
     
     async def get_recent(self, user_id: str, limit: int) -> List[Dict]:
         """Get recent memories."""
-        results = self.collection.find({"user_id": user_id}).sort("created_at", -1).limit(limit)
-        return [{"content": r["content"], "metadata": r["metadata"]} for r in results]
+        def fetch():
+            results = self.collection.find(
+                {"user_id": user_id},
+                {"_id": 0, "content": 1, "metadata": 1}
+            ).sort("created_at", -1).limit(limit)
+            return [{"content": r["content"], "metadata": r["metadata"]} for r in results]
+        
+        return await asyncio.to_thread(fetch)
+
+
+def normalize_vector(embedding: List[float]) -> np.ndarray:
+    """Embedding as a unit-length float32 vector (zero vectors stay zero)."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class MemoryRecord:
+    """Stored memory without its embedding (kept in the user matrix)."""
+    
+    __slots__ = ("content", "metadata", "timestamp")
+    
+    def __init__(self, content: str, metadata: Dict, timestamp: datetime):
+        self.content = content
+        self.metadata = metadata
+        self.timestamp = timestamp
+
+
+class UserMemoryIndex:
+    """
+    One user's memories as a contiguous float32 matrix.
+    Rows are normalized on insert, so cosine similarity against a query is a
+    single matrix-vector product. Capacity doubles when full.
+    """
+    
+    __slots__ = ("vectors", "records", "size")
+    
+    def __init__(self, dimensions: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.records: List[MemoryRecord] = []
+        self.size = 0
+    
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+    
+    def add(self, vector: np.ndarray, record: MemoryRecord):
+        """Append a normalized vector and its record."""
+        if vector.shape[0] != self.dimensions:
+            raise ValueError(f"Embedding has {vector.shape[0]} dimensions, index has {self.dimensions}")
+        
+        if self.size == self.vectors.shape[0]:
+            grown = np.zeros((self.size * 2, self.dimensions), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        
+        self.vectors[self.size] = vector
+        self.records.append(record)
+        self.size += 1
+    
+    def search(self, query: np.ndarray, limit: int) -> List[tuple]:
+        """Return (record, score) pairs for the top matches."""
+        scores = self.vectors[:self.size] @ query
+        return [(self.records[i], float(scores[i])) for i in top_k(scores, limit)]
 
 
 class InMemoryStore:
-    """In-memory store for development."""
+    """
+    In-memory store for development.
+    Large users are searched in a worker thread, so the matrix product does
+    not stall other requests on the event loop.
+    """
     
     def __init__(self):
-        self.memories = []
+        self.users: Dict[str, UserMemoryIndex] = {}
     
     async def save(self, user_id: str, content: str, embedding: List[float], metadata: Dict):
         """Save to memory."""
-        self.memories.append({
-            "user_id": user_id,
-            "content": content,
-            "embedding": embedding,
-            "metadata": metadata,
-            "timestamp": datetime.utcnow()
-        })
+        vector = normalize_vector(embedding)
+        index = self.users.get(user_id)
+        if index is None:
+            index = self.users[user_id] = UserMemoryIndex(vector.shape[0])
+        index.add(vector, MemoryRecord(content, metadata, datetime.utcnow()))
+    
+    async def save_many(self, records: List[Dict[str, Any]]):
+        """Save a batch of memories."""
+        for r in records:
+            await self.save(r["user_id"], r["content"], r["embedding"], r["metadata"])
     
     async def search(self, user_id: str, embedding: List[float], limit: int) -> List[Dict]:
         """Search in memory with cosine similarity."""
-        user_memories = [m for m in self.memories if m["user_id"] == user_id]
-        
-        # Calculate cosine similarity
-        for memory in user_memories:
-            memory["score"] = self._cosine_similarity(embedding, memory["embedding"])
+        index = self.users.get(user_id)
+        if index is None:
+            return []
         
-        # Sort by score
-        user_memories.sort(key=lambda x: x["score"], reverse=True)
+        query = normalize_vector(embedding)
+        if index.size >= settings.INMEMORY_THREAD_SEARCH_MIN:
+            matches = await asyncio.to_thread(index.search, query, limit)
+        else:
+            matches = index.search(query, limit)
+        return [
+            {"content": record.content, "metadata": record.metadata, "score": score}
+            for record, score in matches
+        ]
+    
+    async def get_recent(self, user_id: str, limit: int) -> List[Dict]:
+        """Get recent memories."""
+        index = self.users.get(user_id)
+        if index is None or limit <= 0:
+            return []
         
+        # Records are appended in insertion order
+        return [{"content": r.content, "metadata": r.metadata} for r in reversed(index.records[-limit:])]
+
+
+class AnnStore:
+    """
+    Self-hosted approximate nearest-neighbour store.
+    Vectors live in a memory-mapped IVF index; content and metadata in a
+    SQLite file next to it. Index and SQLite work runs in a thread under one
+    lock. The index is trained in a background thread once it is large
+    enough; searches stay exact until training finishes.
+    """
+    
+    def __init__(self, path: Optional[str] = None, nlist: Optional[int] = None, nprobe: Optional[int] = None):
+        path = path or settings.ANN_INDEX_PATH
+        self.index = IVFIndex(
+            path,
+            nlist=nlist or settings.ANN_NLIST,
+            nprobe=nprobe or settings.ANN_NPROBE,
+            brute_force_max=settings.ANN_BRUTE_FORCE_MAX
+        )
+        self._lock = threading.Lock()
+        self._training: Optional[threading.Thread] = None
+        self.conn = sqlite3.connect(os.path.join(path, "records.sqlite3"), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_code INTEGER PRIMARY KEY,
+                user_id TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS memories (
+                row_id INTEGER PRIMARY KEY,
+                user_code INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT
+            );
+        """)
+        self.user_codes = dict(
+            (user_id, code) for code, user_id in self.conn.execute("SELECT user_code, user_id FROM users")
+        )
+    
+    def _user_code(self, user_id: str, create: bool = False) -> Optional[int]:
+        code = self.user_codes.get(user_id)
+        if code is None and create:
+            code = len(self.user_codes)
+            self.conn.execute("INSERT INTO users (user_code, user_id) VALUES (?, ?)", (code, user_id))
+            self.user_codes[user_id] = code
+        return code
+    
+    async def save(self, user_id: str, content: str, embedding: List[float], metadata: Dict):
+        """Save to the ANN index."""
+        await self.save_many([{"user_id": user_id, "content": content, "embedding": embedding, "metadata": metadata}])
+    
+    async def save_many(self, records: List[Dict[str, Any]]):
+        """Insert a batch of memories incrementally."""
+        if records:
+            await asyncio.to_thread(self._save_many, records)
+    
+    def _save_many(self, records: List[Dict[str, Any]]):
+        vectors = np.stack([normalize_vector(r["embedding"]) for r in records])
+        with self._lock:
+            codes = np.array([self._user_code(r["user_id"], create=True) for r in records], dtype=np.int32)
+            rows = self.index.add(vectors, codes)
+            self.conn.executemany(
+                "INSERT INTO memories (row_id, user_code, content, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (int(row), int(code), r["content"], json.dumps(r["metadata"]))
+                    for row, code, r in zip(rows, codes, records)
+                ]
+            )
+            # Persist the index size first so a crash cannot hand out committed row ids again
+            self.index.flush()
+            self.conn.commit()
+            
+            if self.index.needs_training and self._training is None:
+                self._training = threading.Thread(target=self._train, daemon=True)
+                self._training.start()
+    
+    async def train(self):
+        """Train the index now, e.g. from a benchmark or an admin task."""
+        await asyncio.to_thread(self._train)
+    
+    def _train(self):
+        # k-means runs outside the lock; only switching to the centroids holds it
+        try:
+            centroids, assignments = self.index.fit()
+            with self._lock:
+                self.index.install(centroids, assignments)
+        except Exception as e:
+            print(f"Error training ANN index: {e}")
+        finally:
+            self._training = None
+    
+    async def search(self, user_id: str, embedding: List[float], limit: int, nprobe: Optional[int] = None) -> List[Dict]:
+        """Search the ANN index; `nprobe` trades latency for recall."""
+        return await asyncio.to_thread(self._search, user_id, normalize_vector(embedding), limit, nprobe)
+    
+    def _search(self, user_id: str, query: np.ndarray, limit: int, nprobe: Optional[int]) -> List[Dict]:
+        with self._lock:
+            code = self._user_code(user_id)
+            if code is None:
+                return []
+            rows, scores = self.index.search(query, code, limit, nprobe=nprobe)
+            records = self._fetch(rows)
         return [
-            {"content": m["content"], "metadata": m["metadata"], "score": m["score"]}
-            for m in user_memories[:limit]
+            {"content": records[row][0], "metadata": records[row][1], "score": float(score)}
+            for row, score in zip(rows.tolist(), scores) if row in records
         ]
     
     async def get_recent(self, user_id: str, limit: int) -> List[Dict]:
         """Get recent memories."""
-        user_memories = [m for m in self.memories if m["user_id"] == user_id]
-        user_memories.sort(key=lambda x: x["timestamp"], reverse=True)
-        return [{"content": m["content"], "metadata": m["metadata"]} for m in user_memories[:limit]]
-    
-    def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
-        """Calculate cosine similarity."""
-        a_np = np.array(a)
-        b_np = np.array(b)
-        return np.dot(a_np, b_np) / (np.linalg.norm(a_np) * np.linalg.norm(b_np))
+        return await asyncio.to_thread(self._get_recent, user_id, limit)
+    
+    def _get_recent(self, user_id: str, limit: int) -> List[Dict]:
+        with self._lock:
+            code = self._user_code(user_id)
+            if code is None:
+                return []
+            rows = self.index.recent(code, limit)
+            records = self._fetch(rows)
+        return [
+            {"content": records[row][0], "metadata": records[row][1]}
+            for row in rows.tolist() if row in records
+        ]
+    
+    def _fetch(self, rows: np.ndarray) -> Dict[int, tuple]:
+        if len(rows) == 0:
+            return {}
+        ids = rows.tolist()
+        placeholders = ",".join("?" * len(ids))
+        cursor = self.conn.execute(
+            f"SELECT row_id, content, metadata FROM memories WHERE row_id IN ({placeholders})", ids
+        )
+        return {row_id: (content, json.loads(metadata)) for row_id, content, metadata in cursor}
@@ -0,0 +1,129 @@
+"""
+Background writer for long-term memory.
+Keeps embedding and vector store writes off the response critical path.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import asyncio
+
+from agent.config import settings
+from agent.telemetry import record_queue_wait
+
+
+class MemoryWriteQueue:
+    """
+    Bounded queue of interactions drained by background workers.
+
+    Workers batch queued interactions into one embedding request and one
+    vector store write, retrying failed batches with exponential backoff.
+    `stop` flushes what is queued before the workers exit.
+    """
+
+    def __init__(
+        self,
+        memory_manager,
+        max_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_backoff: Optional[float] = None
+    ):
+        self.memory_manager = memory_manager
+        self.max_size = max_size or settings.MEMORY_WRITE_QUEUE_SIZE
+        self.workers = workers or settings.MEMORY_WRITE_WORKERS
+        self.batch_size = batch_size or settings.MEMORY_WRITE_BATCH_SIZE
+        self.max_retries = max_retries if max_retries is not None else settings.MEMORY_WRITE_MAX_RETRIES
+        self.retry_backoff = retry_backoff if retry_backoff is not None else settings.MEMORY_WRITE_RETRY_BACKOFF_SECONDS
+
+        self.written = 0
+        self.failed: List[Dict[str, Any]] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        """Number of interactions waiting to be written."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start the worker tasks."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Flush queued interactions, then stop the workers."""
+        if not self._tasks:
+            return
+
+        timeout = timeout if timeout is not None else settings.MEMORY_WRITE_SHUTDOWN_TIMEOUT_SECONDS
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Memory writer: shutdown timed out with {self.pending} interactions unsaved")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(
+        self,
+        user_id: str,
+        thread_id: str,
+        query: str,
+        answer: str,
+        sources: List[Dict[str, Any]]
+    ):
+        """
+        Queue an interaction for saving.
+        Falls back to saving inline when the writer is not running; waits for
+        a free slot when the queue is full.
+        """
+        interaction = {
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "query": query,
+            "answer": answer,
+            "sources": sources,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+        if not self._tasks:
+            await self.memory_manager.save_interactions([interaction])
+            return
+
+        await self._queue.put(interaction)
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        # The save span reports how long the oldest interaction was queued
+        oldest = min(datetime.fromisoformat(i["timestamp"]) for i in batch)
+        record_queue_wait((datetime.utcnow() - oldest).total_seconds())
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.memory_manager.save_interactions(batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Memory writer: dropping {len(batch)} interactions after {attempt + 1} attempts: {e}")
+                    self.failed = (self.failed + batch)[-self.max_size:]
+                    return
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
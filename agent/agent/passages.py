@@ -0,0 +1,154 @@
+"""
+Passage chunking and in-request relevance ranking of crawled content.
+Splits source text into overlapping passages and scores them against the
+query with BM25, optionally blended with embedding similarity.
+"""
+from typing import Any, Dict, List, Optional
+import re
+
+import numpy as np
+
+from agent.config import settings
+from agent.context import terms
+
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def chunk_text(text: str, max_words: int = 120, overlap_words: int = 20) -> List[str]:
+    """
+    Split text into passages of about `max_words` words on sentence and line
+    boundaries. Consecutive passages share up to `overlap_words` words of
+    trailing sentences so facts spanning a boundary stay together.
+    """
+    sentences = [s.strip() for s in SENTENCE_BREAK.split(text) if s and s.strip()]
+    passages: List[str] = []
+    current: List[str] = []
+    words = 0
+
+    for sentence in sentences:
+        length = len(sentence.split())
+        if current and words + length > max_words:
+            passages.append(" ".join(current))
+            # Carry trailing sentences forward as overlap
+            carried: List[str] = []
+            carried_words = 0
+            for previous in reversed(current):
+                n = len(previous.split())
+                if carried_words + n > overlap_words:
+                    break
+                carried.insert(0, previous)
+                carried_words += n
+            current, words = carried, carried_words
+
+        if length > max_words:
+            # A single over-long "sentence" (tables, lists without punctuation)
+            tokens = sentence.split()
+            step = max(1, max_words - overlap_words)
+            for start in range(0, len(tokens), step):
+                passages.append(" ".join(tokens[start:start + max_words]))
+                if start + max_words >= len(tokens):
+                    break
+            current, words = [], 0
+            continue
+
+        current.append(sentence)
+        words += length
+
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def bm25_scores(passages: List[str], query_terms: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    BM25 score of every passage for the query terms.
+    Term frequencies for all passages are built in one scatter-add and
+    scored as a matrix.
+    """
+    n = len(passages)
+    if n == 0 or not query_terms:
+        return np.zeros(n, dtype=np.float32)
+
+    term_ids = {t: i for i, t in enumerate(query_terms)}
+    tokenized = [TOKEN.findall(p.lower()) for p in passages]
+    lengths = np.fromiter((len(t) for t in tokenized), dtype=np.float32, count=n)
+
+    passage_ids = np.repeat(np.arange(n), lengths.astype(np.int64))
+    token_ids = np.fromiter(
+        (term_ids.get(t, -1) for tokens in tokenized for t in tokens),
+        dtype=np.int64,
+        count=int(lengths.sum())
+    )
+    mask = token_ids >= 0
+
+    tf = np.zeros((n, len(query_terms)), dtype=np.float32)
+    np.add.at(tf, (passage_ids[mask], token_ids[mask]), 1)
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+async def embedding_scores(passages: List[str], query: str) -> np.ndarray:
+    """Cosine similarity of passages to the query, via the shared embedding service."""
+    from agent.embeddings import get_embedding_service
+
+    service = get_embedding_service()
+    vectors = np.asarray(await service.embed_many([query] + passages), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors[1:] @ vectors[0]
+
+
+def _unit_range(scores: np.ndarray) -> np.ndarray:
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.zeros_like(scores)
+
+
+async def rank_passages(
+    sources: List[Dict[str, Any]],
+    query: str,
+    questions: Optional[List[str]] = None,
+    top_k: Optional[int] = None,
+    ranking: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Chunk every source and return its best passages, best first, as
+    [{"source_index", "position", "content", "score"}].
+
+    ranking "bm25" is lexical only; "hybrid" re-scores the best BM25
+    candidates with embedding similarity and blends the two.
+    """
+    top_k = top_k or settings.PASSAGE_TOP_K
+    ranking = (ranking or settings.PASSAGE_RANKING).lower()
+
+    passages: List[Dict[str, Any]] = []
+    for source_index, source in enumerate(sources):
+        chunks = chunk_text(source.get("content") or "", settings.PASSAGE_WORDS, settings.PASSAGE_OVERLAP_WORDS)
+        passages.extend(
+            {"source_index": source_index, "position": position, "content": chunk}
+            for position, chunk in enumerate(chunks)
+        )
+    if not passages:
+        return []
+
+    query_terms = sorted(terms(" ".join([query] + list(questions or []))))
+    scores = bm25_scores([p["content"] for p in passages], query_terms)
+
+    if ranking == "hybrid":
+        candidates = np.argsort(-scores, kind="stable")[:settings.PASSAGE_EMBEDDING_CANDIDATES]
+        try:
+            similarity = await embedding_scores([passages[i]["content"] for i in candidates], query)
+            weight = settings.PASSAGE_EMBEDDING_WEIGHT
+            blended = (1 - weight) * _unit_range(scores[candidates]) + weight * _unit_range(similarity)
+            scores = np.full(len(passages), -1.0, dtype=np.float32)
+            scores[candidates] = blended
+        except Exception as e:
+            print(f"Embedding re-ranking failed, using BM25 only: {e}")
+    elif ranking != "bm25":
+        raise ValueError(f"Unsupported passage ranking: {ranking}")
+
+    best = np.argsort(-scores, kind="stable")[:top_k]
+    return [dict(passages[i], score=float(scores[i])) for i in best]
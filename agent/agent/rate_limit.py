@@ -0,0 +1,472 @@
+"""
+Rate limiting and retries for search and LLM provider calls.
+
+Providers enforce per-account request and token budgets (RPM/TPM). Every
+provider, or provider:model for LLMs, gets one limiter shared by all
+coroutines in the process. A call first reserves a request, and its
+estimated tokens, from token buckets that refill at the configured rates,
+then takes a slot under a concurrency limit that halves when the provider
+answers 429 and grows back by one slot per window of successful calls.
+Throttled and transient failures are retried with jittered exponential
+backoff, or after the provider's Retry-After, during which the provider is
+paused for every caller. The buckets and pauses live in process, or in Redis
+so replicas draw from one budget.
+"""
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+import asyncio
+import random
+import time
+
+import httpx
+
+from agent.config import settings
+from agent.telemetry import current_span
+
+
+T = TypeVar("T")
+
+# Published default tier limits; override per provider or provider:model with RATE_LIMITS
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "tavily": {"rpm": 100},
+    "brave": {"rpm": 60},
+    "serper": {"rpm": 300},
+    "openai": {"rpm": 500, "tpm": 300000},
+    "anthropic": {"rpm": 50, "tpm": 40000},
+    "google": {"rpm": 60, "tpm": 120000},
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# SDK exceptions for throttling and transient failures that carry no HTTP status
+THROTTLE_ERRORS = {"RateLimitError", "ResourceExhausted", "TooManyRequests"}
+TRANSIENT_ERRORS = THROTTLE_ERRORS | {
+    "APIConnectionError", "APITimeoutError", "InternalServerError", "OverloadedError",
+    "ServiceUnavailable", "DeadlineExceeded",
+}
+
+# Concurrency is cut at most once per this many seconds, so a burst of 429s
+# from calls that were already in flight counts as one signal
+DECREASE_COOLDOWN_SECONDS = 2.0
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """HTTP status of a provider error, from httpx or the provider SDKs."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code
+    return status if isinstance(status, int) else None
+
+
+def _error_names(exc: BaseException):
+    return {cls.__name__ for cls in type(exc).__mro__}
+
+
+def is_throttled(exc: BaseException) -> bool:
+    return error_status(exc) == 429 or bool(_error_names(exc) & THROTTLE_ERRORS)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Throttling, server errors, timeouts and dropped connections."""
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError) or bool(_error_names(exc) & TRANSIENT_ERRORS)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Delay the provider asked for, from Retry-After (seconds or a date) or retry-after-ms."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Budget of `limit` units per minute, refilled continuously.
+    Reservations may overdraw it; the caller then waits until the debt is
+    repaid, so waiting callers are served in reservation order.
+    """
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.rate = limit / 60
+        self.tokens = limit
+        self.updated = time.monotonic()
+
+    def take(self, amount: float, now: float) -> float:
+        """Take amount (negative to return it); returns seconds until it is covered."""
+        refilled = self.tokens + (now - self.updated) * self.rate
+        self.tokens = min(self.limit, refilled - amount)
+        self.updated = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class LocalRateBackend:
+    """In-process buckets and pauses; budgets apply to this replica only."""
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.paused_until: Dict[str, float] = {}
+
+    def _bucket(self, key: str, limit: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.limit != limit:
+            bucket = self.buckets[key] = TokenBucket(limit)
+        return bucket
+
+    async def reserve(self, name: str, rpm: float, tpm: float, requests: float, tokens: float) -> float:
+        """Take from the request and token budgets; returns seconds to wait before calling."""
+        now = time.monotonic()
+        wait = self.paused_until.get(name, 0.0) - now
+        if rpm and requests:
+            wait = max(wait, self._bucket(f"{name}:requests", rpm).take(requests, now))
+        if tpm and tokens:
+            wait = max(wait, self._bucket(f"{name}:tokens", tpm).take(tokens, now))
+        return max(0.0, wait)
+
+    async def pause(self, name: str, seconds: float):
+        """Hold every call to a provider for the given time."""
+        until = time.monotonic() + seconds
+        self.paused_until[name] = max(self.paused_until.get(name, 0.0), until)
+
+
+# KEYS: request bucket, token bucket, pause key. Time is taken from the
+# Redis server so replicas with skewed clocks agree.
+_RESERVE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local function take(key, limit, amount)
+    if limit <= 0 or amount == 0 then return 0 end
+    local rate = limit / 60
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or limit
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(limit, tokens + (now - updated) * rate - amount)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', key, 120)
+    if tokens >= 0 then return 0 end
+    return -tokens / rate
+end
+local wait = math.max(
+    take(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[3])),
+    take(KEYS[2], tonumber(ARGV[2]), tonumber(ARGV[4]))
+)
+local paused = tonumber(redis.call('GET', KEYS[3]) or '0')
+return tostring(math.max(wait, paused - now, 0))
+"""
+
+_PAUSE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local seconds = tonumber(ARGV[1])
+if now + seconds > tonumber(redis.call('GET', KEYS[1]) or '0') then
+    redis.call('SET', KEYS[1], tostring(now + seconds), 'PX', math.ceil(seconds * 1000) + 1000)
+end
+return 0
+"""
+
+
+class RedisRateBackend:
+    """Buckets and pauses in Redis, shared by every replica."""
+
+    def __init__(self, client=None, prefix: Optional[str] = None):
+        from agent.cache import get_redis_client
+
+        self.client = client or get_redis_client()
+        self.prefix = prefix or settings.RATE_LIMIT_REDIS_PREFIX
+        self._reserve = self.client.register_script(_RESERVE)
+        self._pause = self.client.register_script(_PAUSE)
+
+    async def reserve(self, name: str, rpm: float, tpm: float, requests: float, tokens: float) -> float:
+        keys = [f"{self.prefix}:{name}:requests", f"{self.prefix}:{name}:tokens", f"{self.prefix}:{name}:paused"]
+        return float(await self._reserve(keys=keys, args=[rpm or 0, tpm or 0, requests, tokens]))
+
+    async def pause(self, name: str, seconds: float):
+        await self._pause(keys=[f"{self.prefix}:{name}:paused"], args=[seconds])
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted by AIMD: halved when the provider throttles,
+    raised by one slot after a limit's worth of successful calls.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def capacity(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        while self.in_flight >= self.capacity:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # A slot handed to this waiter goes to the next one
+                self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.capacity - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def on_success(self):
+        if self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self.decreased_at >= DECREASE_COOLDOWN_SECONDS:
+            self.limit = max(self.minimum, self.limit / 2)
+            self.decreased_at = now
+
+
+class RateLimitStats:
+    """Counters for one provider's limiter."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters."""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "avg_wait_seconds": self.wait_seconds / self.calls if self.calls else 0.0,
+        }
+
+
+class ProviderLimiter:
+    """Request and token budgets, adaptive concurrency and retries for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        backend=None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        max_retry_after: Optional[float] = None
+    ):
+        self.name = name
+        self.rpm = rpm or 0
+        self.tpm = tpm or 0
+        self.backend = backend or LocalRateBackend()
+        self.concurrency = AdaptiveConcurrency(int(concurrency or settings.RATE_LIMIT_MAX_CONCURRENCY))
+        self.max_retries = max_retries if max_retries is not None else settings.RATE_LIMIT_MAX_RETRIES
+        self.backoff_base = backoff_base if backoff_base is not None else settings.RATE_LIMIT_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max if backoff_max is not None else settings.RATE_LIMIT_BACKOFF_MAX_SECONDS
+        self.max_retry_after = max_retry_after if max_retry_after is not None else settings.RATE_LIMIT_MAX_RETRY_AFTER_SECONDS
+        self.stats = RateLimitStats()
+
+    async def _wait(self, seconds: float):
+        """Sleep, attributing the time to the open span as queue wait."""
+        if seconds <= 0:
+            return
+        self.stats.wait_seconds += seconds
+        current = current_span()
+        if current is not None:
+            current.queue_wait += seconds
+        await asyncio.sleep(seconds)
+
+    async def _acquire(self, tokens: float):
+        await self._wait(await self.backend.reserve(self.name, self.rpm, self.tpm, 1, tokens))
+        started = time.monotonic()
+        await self.concurrency.acquire()
+        waited = time.monotonic() - started
+        self.stats.wait_seconds += waited
+        current = current_span()
+        if current is not None:
+            current.queue_wait += waited
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for a retry attempt (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _retry_delay(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        if not is_throttled(exc):
+            return self.backoff(attempt)
+
+        self.stats.throttled += 1
+        self.concurrency.on_throttle()
+        hint = retry_after_seconds(exc)
+        if hint is not None and hint > self.max_retry_after:
+            return None
+        # Small jitter on the provider's delay so paused callers do not return at once
+        delay = hint * random.uniform(1.0, 1.1) if hint is not None else self.backoff(attempt)
+        await self.backend.pause(self.name, delay)
+        return delay
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        tokens: float = 0,
+        retry_if: Optional[Callable[[BaseException], bool]] = None
+    ) -> T:
+        """
+        Run func within the provider's limits, retrying throttled and
+        transient failures. `tokens` is the call's estimated token use;
+        `retry_if` can veto a retry, e.g. once output has been streamed.
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            # Tokens are reserved once per call; settle() corrects the estimate
+            await self._acquire(tokens if attempt == 0 else 0)
+            try:
+                result = await func()
+            except Exception as e:
+                self.concurrency.release()
+                delay = await self._retry_delay(e, attempt)
+                if delay is None or (retry_if is not None and not retry_if(e)):
+                    self.stats.failures += 1
+                    raise
+                attempt += 1
+                self.stats.retries += 1
+                current = current_span()
+                if current is not None:
+                    current.attrs["retries"] = attempt
+                await self._wait(delay)
+                continue
+            except BaseException:
+                self.concurrency.release()
+                raise
+            self.concurrency.release()
+            self.concurrency.on_success()
+            return result
+
+    async def settle(self, estimated: float, actual: float):
+        """Correct the token budget once a call's real usage is known."""
+        if self.tpm and actual != estimated:
+            await self.backend.reserve(self.name, self.rpm, self.tpm, 0, actual - estimated)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "concurrency_limit": self.concurrency.capacity,
+            "in_flight": self.concurrency.in_flight,
+            **self.stats.snapshot(),
+        }
+
+
+def provider_limits(provider: str, model: Optional[str] = None) -> Dict[str, float]:
+    """Configured limits for provider:model, else the provider, else its defaults."""
+    if model and f"{provider}:{model}" in settings.RATE_LIMITS:
+        return settings.RATE_LIMITS[f"{provider}:{model}"]
+    return settings.RATE_LIMITS.get(provider) or DEFAULT_LIMITS.get(provider, {})
+
+
+_backend = None
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        backend_name = settings.RATE_LIMIT_BACKEND.lower()
+        if backend_name == "redis":
+            _backend = RedisRateBackend()
+        elif backend_name == "memory":
+            _backend = LocalRateBackend()
+        else:
+            raise ValueError(f"Unsupported rate limit backend: {backend_name}")
+    return _backend
+
+
+def get_rate_limiter(provider: str, model: Optional[str] = None) -> Optional[ProviderLimiter]:
+    """Get the shared limiter for a provider (and LLM model), or None when rate limiting is off."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    name = f"{provider}:{model}" if model else provider
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limits = provider_limits(provider, model)
+        limiter = _limiters[name] = ProviderLimiter(
+            name,
+            rpm=limits.get("rpm"),
+            tpm=limits.get("tpm"),
+            concurrency=limits.get("concurrency"),
+            backend=_get_backend()
+        )
+    return limiter
+
+
+def get_llm_rate_limiter(role: str = "default") -> Optional[ProviderLimiter]:
+    """Limiter for the provider and model serving an LLM role."""
+    from agent.llm import resolve_llm_config
+
+    provider, model, _ = resolve_llm_config(role)
+    return get_rate_limiter(provider, model)
+
+
+def estimate_llm_tokens(role: str, prompt: str) -> int:
+    """Tokens to reserve for a call: the prompt plus a typical completion."""
+    from agent.context import get_token_counter
+
+    return get_token_counter(role).count(prompt) + settings.RATE_LIMIT_COMPLETION_TOKENS
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every limiter created so far."""
+    return {name: limiter.snapshot() for name, limiter in sorted(_limiters.items())}
+
+
+def clear_rate_limiters():
+    """Drop limiters and their state (e.g. after changing settings in tests)."""
+    global _backend
+    _limiters.clear()
+    _backend = None
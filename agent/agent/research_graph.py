@@ -2,37 +2,76 @@
 LangGraph-based multi-agent research workflow.
 Orchestrates deep financial research with thinking, search, and synthesis.
 """
-from typing import TypedDict, List, Dict, Any, Annotated
+from typing import TypedDict, List, Dict, Any, Annotated, Optional, Tuple
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.postgres import PostgresSaver
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langgraph.constants import Send
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
 import operator
+import uuid
 
 from agent.llm import get_llm
-from agent.tools.search import search_web
-from agent.tools.crawler import crawl_url
+from agent.context import get_token_counter, pack_context
+from agent.passages import rank_passages
+from agent.streaming import generate
+from agent.telemetry import traced
+from agent.tools.pipeline import FetchLimits, run_fetch_limits, search_and_crawl
+from agent.research_loop import next_queries, novelty
+from agent.tools.crawl_cache import normalize_url
+from agent.tools.financial_extractor import format_fact
 from agent.config import settings
 
 
+def merge_sources(left: List[Dict[str, Any]], right: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Append sources, skipping URLs already present (parallel branches may find the same page)."""
+    seen = {normalize_url(s["url"]) for s in left}
+    merged = list(left)
+    for source in right:
+        key = normalize_url(source["url"])
+        if key not in seen:
+            seen.add(key)
+            merged.append(source)
+    return merged
+
+
 class ResearchState(TypedDict):
     """State for the research graph."""
     query: str
     thread_id: str
     user_id: str
     messages: Annotated[List[Any], operator.add]
-    sources: Annotated[List[Dict[str, Any]], operator.add]
+    sources: Annotated[List[Dict[str, Any]], merge_sources]
     thinking_trace: Annotated[List[Dict[str, Any]], operator.add]
     final_answer: str
     iteration: int
     max_iterations: int
     memory_context: List[Dict[str, Any]]
+    executed_queries: Annotated[List[str], operator.add]
+    stalled: bool
+    branch_findings: Annotated[List[Dict[str, Any]], operator.add]
+
 
+class BranchState(TypedDict):
+    """Input of one parallel research branch."""
+    query: str
+    questions: List[str]
+    plan: Dict[str, Any]
+    max_iterations: int
+    run_id: str  # shared by the branches of one run
+    branch: int  # position among the run's branches
 
-def planning_node(state: ResearchState) -> ResearchState:
+
+def get_plan(state: ResearchState) -> Dict[str, Any]:
+    """Research plan from the planning step."""
+    return next((t["content"] for t in state["thinking_trace"] if t["step"] == "planning"), {})
+
+
+@traced("planning")
+async def planning_node(state: ResearchState) -> ResearchState:
     """
     Planning node: Analyze query and create research plan.
     """
-    llm = get_llm()
+    llm = get_llm("planning")
     
     memory_context_str = ""
     if state.get("memory_context"):
@@ -59,12 +98,13 @@ Respond in JSON format:
     "reasoning": "brief explanation"
 }}"""
     
-    response = llm.invoke([HumanMessage(content=planning_prompt)])
+    # The plan is parsed as a whole, so its tokens are not streamed
+    text = await generate(llm, [HumanMessage(content=planning_prompt)], node="planning", stream=False)
     
     # Parse JSON response
     import json
     try:
-        plan = json.loads(response.content)
+        plan = json.loads(text)
     except:
         # Fallback if not valid JSON
         plan = {
@@ -86,75 +126,129 @@ Respond in JSON format:
     }
 
 
-def search_node(state: ResearchState) -> ResearchState:
+async def gather_sources(
+    plan: Dict[str, Any],
+    query: str,
+    existing: List[Dict[str, Any]],
+    executed: List[str],
+    limits: Optional[FetchLimits] = None
+) -> Tuple[List[str], List[Dict[str, Any]], bool]:
+    """
+    Run one search pass: new queries refined from gaps, skipping URLs already
+    gathered. Returns (queries, new sources, stalled). Passes given the same
+    limits share one fetch concurrency budget.
+    """
+    queries = next_queries(
+        plan,
+        query,
+        existing,
+        executed,
+        limit=settings.SEARCH_QUERIES_PER_ITERATION
+    )
+    
+    found = []
+    if queries:
+        # Search and crawl concurrently, bounded by the pipeline deadline
+        found = await search_and_crawl(
+            queries,
+            max_results=settings.SEARCH_RESULTS_PER_QUERY,
+            exclude_urls=[s["url"] for s in existing],
+            limits=limits
+        )
+    
+    # Diminishing returns: a pass that adds neither new domains nor novel
+    # content. Sources count as novel when their content fingerprint is new,
+    # so new pages from known domains keep the loop going
+    result = novelty(existing, found)
+    stalled = not result["sources"]
+    return queries, result["sources"], stalled
+
+
+@traced("search")
+async def search_node(state: ResearchState) -> ResearchState:
     """
     Search node: Execute web searches and gather sources.
+    Each pass runs queries not tried yet, refined from gaps in what has been
+    found, and skips URLs already gathered.
     """
-    # Extract search queries from thinking trace
-    plan = state["thinking_trace"][-1]["content"]
-    search_queries = plan.get("search_queries", [state["query"]])
-    
-    all_sources = []
-    seen_urls = set()
-    
-    for query in search_queries[:3]:  # Limit to 3 searches
-        results = search_web(query, max_results=5)
-        
-        for result in results:
-            url = result.get("url")
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                
-                # Crawl content
-                content = crawl_url(url)
-                
-                source = {
-                    "url": url,
-                    "title": result.get("title", ""),
-                    "snippet": result.get("snippet", ""),
-                    "content": content[:5000] if content else result.get("snippet", ""),  # Limit content
-                    "publishedAt": result.get("published_date"),
-                    "metadata": {
-                        "query": query,
-                        "score": result.get("score", 0)
-                    }
-                }
-                all_sources.append(source)
+    queries, new_sources, stalled = await gather_sources(
+        get_plan(state),
+        state["query"],
+        state["sources"],
+        state.get("executed_queries", [])
+    )
     
     thinking_entry = {
         "step": "search",
-        "content": f"Found {len(all_sources)} unique sources",
+        "content": f"Found {len(new_sources)} new sources from {len(queries)} queries",
+        "queries": queries,
         "iteration": state["iteration"]
     }
     
     return {
-        "sources": all_sources,
+        "sources": new_sources,
+        "executed_queries": queries,
+        "iteration": state["iteration"] + 1,
+        "stalled": stalled,
         "thinking_trace": [thinking_entry],
-        "messages": [AIMessage(content=f"Gathered {len(all_sources)} sources")],
+        "messages": [AIMessage(content=f"Gathered {len(new_sources)} sources")],
     }
 
 
-def analysis_node(state: ResearchState) -> ResearchState:
+async def build_analysis_prompt(query: str, questions: List[str], sources: List[Dict[str, Any]]) -> str:
     """
-    Analysis node: Analyze gathered data and extract insights.
+    Analysis prompt over a set of sources.
+    Sources are chunked into passages; the best-ranked passages are packed
+    into ANALYSIS_CONTEXT_TOKENS and shown grouped under their source.
+    Structured facts from tables and XBRL get their own ANALYSIS_FACTS_TOKENS.
     """
-    llm = get_llm()
+    passages = await rank_passages(sources, query, questions)
+    packed = pack_context(
+        passages,
+        query,
+        questions,
+        budget=settings.ANALYSIS_CONTEXT_TOKENS,
+        counter=get_token_counter("analysis"),
+        max_item_tokens=settings.CONTEXT_MAX_SOURCE_TOKENS,
+        scores=[p["score"] for p in passages]
+    )
+    
+    by_source: Dict[int, List[Dict[str, Any]]] = {}
+    for p in packed:
+        by_source.setdefault(p["item"]["source_index"], []).append(p)
     
-    # Prepare sources summary
     sources_text = "\n\n".join([
-        f"Source {i+1}: {s['title']}\nURL: {s['url']}\nContent: {s['content'][:1000]}..."
-        for i, s in enumerate(state["sources"][-10:])  # Last 10 sources
+        f"Source {i+1}: {sources[i]['title']}\nURL: {sources[i]['url']}\nContent: " + "\n...\n".join(
+            p["text"] for p in sorted(by_source[i], key=lambda p: p["item"]["position"])
+        )
+        for i in sorted(by_source)
     ])
     
-    plan = state["thinking_trace"][0]["content"]
+    fact_lines = [
+        {"content": f"{format_fact(fact)} (Source {i+1})", "order": (i, n)}
+        for i, s in enumerate(sources)
+        for n, fact in enumerate(s.get("facts") or [])
+    ]
+    packed_facts = pack_context(
+        fact_lines,
+        query,
+        questions,
+        budget=settings.ANALYSIS_FACTS_TOKENS,
+        counter=get_token_counter("analysis"),
+        max_overlap=1.0,
+        min_item_tokens=1,
+        truncate=False
+    )
+    facts_text = "\n".join(p["text"] for p in sorted(packed_facts, key=lambda p: p["item"]["order"]))
+    facts_section = f"\nKey Figures (metric | period | value unit):\n{facts_text}\n" if facts_text else ""
     
-    analysis_prompt = f"""Analyze the following sources to answer the research query.
+    return f"""Analyze the following sources to answer the research query.
 
-Query: {state['query']}
+Query: {query}
 
 Key Questions:
-{chr(10).join([f"- {q}" for q in plan.get('key_questions', [])])}
-
+{chr(10).join([f"- {q}" for q in questions])}
+{facts_section}
 Sources:
 {sources_text}
 
@@ -165,12 +259,27 @@ Provide a detailed analysis covering:
 4. Potential concerns or risks
 
 Format your analysis clearly with sections."""
+
+
+@traced("analyze")
+async def analysis_node(state: ResearchState) -> ResearchState:
+    """
+    Analysis node: Analyze gathered data and extract insights.
+    """
+    llm = get_llm("analysis")
     
-    response = llm.invoke([HumanMessage(content=analysis_prompt)])
+    plan = get_plan(state)
+    analysis_prompt = await build_analysis_prompt(
+        state["query"],
+        plan.get("key_questions", []),
+        state["sources"]
+    )
+    
+    analysis = await generate(llm, [HumanMessage(content=analysis_prompt)], node="analyze")
     
     thinking_entry = {
         "step": "analysis",
-        "content": response.content,
+        "content": analysis,
         "iteration": state["iteration"]
     }
     
@@ -180,20 +289,117 @@ Format your analysis clearly with sections."""
     }
 
 
-def synthesis_node(state: ResearchState) -> ResearchState:
+def fan_out_branches(state: ResearchState) -> List[Send]:
+    """
+    Map step: one research branch per key question.
+    Questions beyond RESEARCH_BRANCH_WIDTH are shared round-robin between
+    the branches, so the fan-out never exceeds the configured width.
+    """
+    plan = get_plan(state)
+    questions = plan.get("key_questions") or [state["query"]]
+    width = max(1, min(settings.RESEARCH_BRANCH_WIDTH, len(questions)))
+    
+    groups: List[List[str]] = [[] for _ in range(width)]
+    for i, question in enumerate(questions):
+        groups[i % width].append(question)
+    
+    run_id = str(uuid.uuid4())
+    return [
+        Send("research_branch", {
+            "query": state["query"],
+            "questions": group,
+            "plan": plan,
+            "max_iterations": state["max_iterations"],
+            "run_id": run_id,
+            "branch": i
+        })
+        for i, group in enumerate(groups)
+    ]
+
+
+@traced("research_branch")
+async def research_branch_node(state: BranchState) -> ResearchState:
+    """
+    Research branch: search and analyze one sub-question.
+    Branches run concurrently and share the run's fetch limits; their
+    findings are merged in synthesis.
+    """
+    branch_plan = {
+        "search_queries": state["questions"],
+        "key_questions": state["questions"],
+        "metrics": state["plan"].get("metrics", [])
+    }
+    
+    sources: List[Dict[str, Any]] = []
+    executed: List[str] = []
+    with run_fetch_limits(state["run_id"]) as limits:
+        for _ in range(state["max_iterations"]):
+            queries, new_sources, stalled = await gather_sources(branch_plan, state["query"], sources, executed, limits)
+            sources += new_sources
+            executed += queries
+            if stalled or len(sources) >= settings.RESEARCH_BRANCH_MIN_SOURCES:
+                break
+    
+    analysis = ""
+    if sources:
+        llm = get_llm("analysis")
+        analysis_prompt = await build_analysis_prompt(state["query"], state["questions"], sources)
+        analysis = await generate(llm, [HumanMessage(content=analysis_prompt)], node="analyze", branch=state["branch"])
+    
+    finding = {
+        "branch": state["branch"],
+        "questions": state["questions"],
+        "analysis": analysis,
+        "sources": [s["url"] for s in sources]
+    }
+    thinking_entry = {
+        "step": "branch",
+        "content": finding,
+        "queries": executed
+    }
+    
+    return {
+        "sources": sources,
+        "executed_queries": executed,
+        "branch_findings": [finding],
+        "thinking_trace": [thinking_entry],
+        "messages": [AIMessage(content=f"Researched: {'; '.join(state['questions'])}")],
+    }
+
+
+@traced("synthesize")
+async def synthesis_node(state: ResearchState) -> ResearchState:
     """
     Synthesis node: Create final answer with citations.
     """
-    llm = get_llm()
+    llm = get_llm("synthesis")
     
-    # Get analysis from thinking trace
-    analysis = next((t["content"] for t in reversed(state["thinking_trace"]) if t["step"] == "analysis"), "")
+    # Get analysis from the parallel branches, or from the thinking trace
+    if state.get("branch_findings"):
+        analysis = "\n\n".join(
+            f"### {'; '.join(f['questions'])}\n{f['analysis'] or 'No sources found.'}"
+            for f in state["branch_findings"]
+        )
+    else:
+        analysis = next((t["content"] for t in reversed(state["thinking_trace"]) if t["step"] == "analysis"), "")
     
-    # Prepare sources for citation
-    sources_list = "\n".join([
-        f"[{i+1}] {s['title']} - {s['url']}"
+    # Prepare sources for citation: the most relevant that fit the budget,
+    # numbered by their position in state so citations match the sources list
+    citations = [
+        {"content": f"[{i+1}] {s['title']} - {s['url']}"}
         for i, s in enumerate(state["sources"])
-    ])
+    ]
+    packed = pack_context(
+        citations,
+        state["query"],
+        get_plan(state).get("key_questions", []),
+        budget=settings.SYNTHESIS_CONTEXT_TOKENS,
+        counter=get_token_counter("synthesis"),
+        max_overlap=1.0,
+        min_item_tokens=1,
+        truncate=False
+    )
+    sources_list = "\n".join(p["text"] for p in sorted(packed, key=lambda p: p["index"]))
     
     synthesis_prompt = f"""Create a comprehensive research report answering the query.
 
@@ -215,7 +421,8 @@ Use inline citations like [1], [2] to reference sources.
 Be specific with numbers, dates, and metrics.
 Maintain objectivity and note any limitations."""
     
-    response = llm.invoke([HumanMessage(content=synthesis_prompt)])
+    # Tokens are forwarded to the SSE stream as they are generated
+    report = await generate(llm, [HumanMessage(content=synthesis_prompt)], node="synthesize")
     
     thinking_entry = {
         "step": "synthesis",
@@ -224,9 +431,9 @@ Maintain objectivity and note any limitations."""
     }
     
     return {
-        "final_answer": response.content,
+        "final_answer": report,
         "thinking_trace": [thinking_entry],
-        "messages": [AIMessage(content=response.content)],
+        "messages": [AIMessage(content=report)],
     }
 
 
@@ -234,44 +441,55 @@ def should_continue(state: ResearchState) -> str:
     """
     Decide whether to continue research or finish.
     """
-    if state["iteration"] >= state["max_iterations"]:
-        return "synthesize"
-    
-    if len(state["sources"]) >= 10:  # Enough sources
+    if len(state["sources"]) >= settings.RESEARCH_MIN_SOURCES:  # Enough sources
         return "analyze"
     
+    if state["iteration"] >= state["max_iterations"] or state.get("stalled"):
+        return "analyze" if state["sources"] else "synthesize"
+    
     return "search"
 
 
-def create_research_graph() -> StateGraph:
+def create_research_graph(checkpointer=None, mode: Optional[str] = None):
     """
     Create the research workflow graph.
+    The compiled graph is stateless between runs, so build it once at startup
+    with the shared checkpointer and reuse it for every request.
+    
+    mode "linear" runs planning -> search loop -> analysis -> synthesis;
+    "parallel" fans out one search+analysis branch per key question and
+    merges their findings in synthesis.
     """
+    mode = (mode or settings.RESEARCH_MODE).lower()
     workflow = StateGraph(ResearchState)
     
     # Add nodes
     workflow.add_node("planning", planning_node)
-    workflow.add_node("search", search_node)
-    workflow.add_node("analyze", analysis_node)
     workflow.add_node("synthesize", synthesis_node)
-    
-    # Add edges
     workflow.set_entry_point("planning")
-    workflow.add_edge("planning", "search")
-    workflow.add_conditional_edges(
-        "search",
-        should_continue,
-        {
-            "search": "search",
-            "analyze": "analyze",
-            "synthesize": "synthesize"
-        }
-    )
-    workflow.add_edge("analyze", "synthesize")
+    
+    if mode == "parallel":
+        workflow.add_node("research_branch", research_branch_node)
+        workflow.add_conditional_edges("planning", fan_out_branches, ["research_branch"])
+        workflow.add_edge("research_branch", "synthesize")
+    elif mode == "linear":
+        workflow.add_node("search", search_node)
+        workflow.add_node("analyze", analysis_node)
+        workflow.add_edge("planning", "search")
+        workflow.add_conditional_edges(
+            "search",
+            should_continue,
+            {
+                "search": "search",
+                "analyze": "analyze",
+                "synthesize": "synthesize"
+            }
+        )
+        workflow.add_edge("analyze", "synthesize")
+    else:
+        raise ValueError(f"Unsupported research mode: {mode}")
+    
     workflow.add_edge("synthesize", END)
     
     # Add checkpointer for state persistence
-    from agent.checkpointer import get_checkpointer
-    checkpointer = get_checkpointer()
-    
-    return workflow.compile(checkpointer=checkpointer)
+    return workflow.compile(checkpointer=checkpointer or MemorySaver())
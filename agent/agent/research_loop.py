@@ -0,0 +1,98 @@
+"""
+Helpers for the iterative search loop.
+Picks follow-up queries from gaps in what has been found and measures how
+much new material each pass adds.
+"""
+from typing import Any, Dict, Iterable, List, Set
+from urllib.parse import urlparse
+import hashlib
+
+from agent.tools.search_cache import normalize_query
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(normalize_query(text).split())
+
+
+def coverage(term: str, sources: List[Dict[str, Any]]) -> float:
+    """
+    Best fraction of a term's tokens found together in a single source.
+    A key question is covered once one source mentions most of it.
+    """
+    wanted = _tokens(term)
+    if not wanted:
+        return 1.0
+    best = 0.0
+    for source in sources:
+        found = _tokens(f"{source.get('title', '')} {source.get('content', '')}")
+        best = max(best, len(wanted & found) / len(wanted))
+    return best
+
+
+def next_queries(
+    plan: Dict[str, Any],
+    query: str,
+    sources: List[Dict[str, Any]],
+    executed: Iterable[str],
+    limit: int,
+    covered_threshold: float = 0.8
+) -> List[str]:
+    """
+    Choose up to `limit` queries not run yet.
+
+    Planned search queries come first. After that, key questions and metrics
+    the gathered sources do not cover yet become queries, least covered
+    first. Queries are compared after normalization, so rephrasings of an
+    executed query are skipped.
+    """
+    seen = {normalize_query(q) for q in executed}
+    chosen: List[str] = []
+
+    def take(candidate: str) -> bool:
+        key = normalize_query(candidate)
+        if key and key not in seen:
+            seen.add(key)
+            chosen.append(candidate)
+        return len(chosen) >= limit
+
+    for candidate in plan.get("search_queries") or [query]:
+        if take(candidate):
+            return chosen
+
+    gaps = [(q, coverage(q, sources)) for q in plan.get("key_questions", [])]
+    gaps += [(f"{query} {m}", coverage(m, sources)) for m in plan.get("metrics", [])]
+    for candidate, score in sorted(gaps, key=lambda g: g[1]):
+        if score < covered_threshold and take(candidate):
+            break
+
+    return chosen
+
+
+def content_fingerprint(text: str) -> str:
+    """Hash of a text's normalized words, so mirrored pages compare equal."""
+    return hashlib.sha1(" ".join(normalize_query(text[:2000]).split()).encode()).hexdigest()
+
+
+def domain(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def novelty(existing: List[Dict[str, Any]], found: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Split newly found sources into novel ones and duplicates of existing
+    content, and count the domains they add.
+    """
+    fingerprints = {content_fingerprint(s.get("content", "")) for s in existing}
+    domains = {domain(s["url"]) for s in existing}
+
+    novel = []
+    for source in found:
+        fingerprint = content_fingerprint(source.get("content", ""))
+        if fingerprint in fingerprints:
+            continue
+        fingerprints.add(fingerprint)
+        novel.append(source)
+
+    new_domains = {domain(s["url"]) for s in novel} - domains
+    return {"sources": novel, "new_domains": len(new_domains)}
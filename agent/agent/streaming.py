@@ -0,0 +1,112 @@
+"""
+Token streaming from graph nodes to the SSE response.
+The endpoint installs a queue for the run; nodes that generate through
+`generate` forward each LLM token to it as soon as the provider emits it.
+"""
+from contextvars import ContextVar, Token
+from typing import Any, List, Optional
+import asyncio
+
+from agent.rate_limit import estimate_llm_tokens, get_llm_rate_limiter
+from agent.telemetry import record_llm_usage, span
+
+
+# LLM role whose model generates for each node
+NODE_ROLES = {"planning": "planning", "analyze": "analysis", "synthesize": "synthesis"}
+
+_token_queue: ContextVar[Optional[asyncio.Queue]] = ContextVar("token_queue", default=None)
+
+
+def set_token_queue(queue: Optional[asyncio.Queue]) -> Token:
+    """Route tokens generated in the current context to a queue."""
+    return _token_queue.set(queue)
+
+
+def reset_token_queue(token: Token):
+    """Restore the previous token queue."""
+    _token_queue.reset(token)
+
+
+async def generate(llm, messages: List[Any], node: str, stream: bool = True, branch: Optional[int] = None) -> str:
+    """
+    Run the LLM and return the full completion text.
+    When a token queue is active (and `stream` is set) the provider's async
+    streaming API is used and every chunk is put on the queue as
+    ("token", node, text, branch); `branch` tells apart the parallel
+    research branches streaming the same node at once.
+    The call runs within the model's rate limits and is retried when
+    throttled, unless tokens were already streamed. It is recorded as an
+    "llm.<node>" span with its token usage.
+    """
+    queue = _token_queue.get() if stream else None
+    role = NODE_ROLES.get(node, "default")
+    prompt = "\n".join(str(m.content) for m in messages)
+    streamed = False
+
+    async def attempt():
+        nonlocal streamed
+        if queue is None:
+            response = await llm.ainvoke(messages)
+            return response.content, getattr(response, "usage_metadata", None)
+
+        parts = []
+        # Providers report usage on one or more chunks
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        async for chunk in llm.astream(messages):
+            for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                if key in usage:
+                    usage[key] += value or 0
+            if chunk.content:
+                parts.append(chunk.content)
+                streamed = True
+                queue.put_nowait(("token", node, chunk.content, branch))
+        return "".join(parts), usage
+
+    with span(f"llm.{node}", kind="llm") as current:
+        limiter = get_llm_rate_limiter(role)
+        if limiter is None:
+            text, usage = await attempt()
+        else:
+            estimated = estimate_llm_tokens(role, prompt)
+            text, usage = await limiter.call(attempt, tokens=estimated, retry_if=lambda e: not streamed)
+
+        record_llm_usage(current, role, prompt, text, usage)
+        if limiter is not None:
+            await limiter.settle(estimated, current.prompt_tokens + current.completion_tokens)
+    return text
+
+
+async def stream_graph(graph, initial_state: Any, config: dict):
+    """
+    Run a compiled graph and yield its node updates interleaved with tokens.
+
+    Yields ("event", {node_name: node_state}) for every node update and
+    ("token", node_name, text, branch) for every streamed LLM token, where
+    branch is the parallel research branch, or None outside parallel mode.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def run():
+        # Set inside the task so the node tasks spawned by the graph inherit it
+        set_token_queue(queue)
+        try:
+            async for event in graph.astream(initial_state, config):
+                queue.put_nowait(("event", event))
+        except Exception as e:
+            queue.put_nowait(("error", e))
+        finally:
+            queue.put_nowait(done)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if item[0] == "error":
+                raise item[1]
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,287 @@
+"""
+Latency, token and cost instrumentation for the research hot path.
+
+Spans time graph nodes, tool calls, LLM calls and memory operations. Each
+finished span is observed in Prometheus metrics (when prometheus_client is
+installed) and, while a request trace is active in the current context,
+appended to that trace so the endpoint can report a per-request breakdown.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+import time
+
+from agent.config import settings
+
+
+# USD per million (prompt, completion) tokens; matched by longest model prefix
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4-0125-preview": (10.0, 30.0),
+    "gpt-4-1106-preview": (10.0, 30.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "gemini-pro": (0.5, 1.5),
+    "gemini-1.5-pro": (3.5, 10.5),
+    "gemini-1.5-flash": (0.35, 1.05),
+}
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Span:
+    """One timed operation with the resources it used."""
+
+    __slots__ = (
+        "name", "kind", "attrs", "started", "wall", "queue_wait", "bytes",
+        "prompt_tokens", "completion_tokens", "cost", "model", "error"
+    )
+
+    def __init__(self, name: str, kind: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.queue_wait = 0.0
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.model: Optional[str] = None
+        self.error = False
+
+
+class RequestTrace:
+    """Spans recorded while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Per-span-name totals plus request-wide tokens and cost."""
+        spans: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            entry = spans.setdefault(span.name, {
+                "kind": span.kind,
+                "count": 0,
+                "wall_ms": 0.0,
+                "max_ms": 0.0,
+                "queue_wait_ms": 0.0,
+                "bytes": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+                "errors": 0
+            })
+            entry["count"] += 1
+            entry["wall_ms"] += span.wall * 1000
+            entry["max_ms"] = max(entry["max_ms"], span.wall * 1000)
+            entry["queue_wait_ms"] += span.queue_wait * 1000
+            entry["bytes"] += span.bytes
+            entry["prompt_tokens"] += span.prompt_tokens
+            entry["completion_tokens"] += span.completion_tokens
+            entry["cost_usd"] += span.cost
+            entry["errors"] += int(span.error)
+
+        for entry in spans.values():
+            for key in ("wall_ms", "max_ms", "queue_wait_ms"):
+                entry[key] = round(entry[key], 1)
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+
+        return {
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "prompt_tokens": sum(s.prompt_tokens for s in self.spans),
+            "completion_tokens": sum(s.completion_tokens for s in self.spans),
+            "cost_usd": round(sum(s.cost for s in self.spans), 6),
+            "spans": spans
+        }
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_pending_queue_wait: ContextVar[float] = ContextVar("pending_queue_wait", default=0.0)
+
+
+def start_trace() -> RequestTrace:
+    """
+    Collect spans of the rest of the current context, and of tasks created
+    from it, into a new request trace. Every request runs in its own context.
+    """
+    trace = RequestTrace()
+    _trace.set(trace)
+    return trace
+
+
+def current_span() -> Optional[Span]:
+    """Innermost open span of the current context."""
+    return _current_span.get()
+
+
+def record_queue_wait(seconds: float):
+    """
+    Attribute time spent waiting for a concurrency slot to the next span
+    opened in this context.
+    """
+    _pending_queue_wait.set(seconds)
+
+
+def add_bytes(count: int):
+    """Add bytes fetched to the innermost open span."""
+    span = _current_span.get()
+    if span is not None:
+        span.bytes += count
+
+
+def model_price(model: Optional[str]) -> Tuple[float, float]:
+    """(prompt, completion) USD per million tokens for a model; zero if unknown."""
+    if not model:
+        return 0.0, 0.0
+    prices = {**MODEL_PRICES, **{k: tuple(v) for k, v in settings.LLM_PRICES.items()}}
+    matches = [name for name in prices if model.startswith(name)]
+    if not matches:
+        return 0.0, 0.0
+    return prices[max(matches, key=len)]
+
+
+def record_llm_usage(span: Span, role: str, prompt: str, completion: str, usage: Optional[Dict[str, Any]] = None):
+    """
+    Set token counts and estimated cost of an LLM call on a span.
+    Uses the provider's usage metadata when it reports any, otherwise
+    counts the prompt and completion with the role's tokenizer.
+    """
+    from agent.context import get_token_counter
+    from agent.llm import resolve_llm_config
+
+    _, model, _ = resolve_llm_config(role)
+    if usage and usage.get("input_tokens"):
+        span.prompt_tokens = int(usage["input_tokens"])
+        span.completion_tokens = int(usage.get("output_tokens") or 0)
+    else:
+        counter = get_token_counter(role)
+        span.prompt_tokens = counter.count(prompt)
+        span.completion_tokens = counter.count(completion)
+
+    prompt_price, completion_price = model_price(model)
+    span.model = model
+    span.cost = (span.prompt_tokens * prompt_price + span.completion_tokens * completion_price) / 1_000_000
+
+
+class _Metrics:
+    """Prometheus collectors for spans and requests."""
+
+    def __init__(self):
+        from prometheus_client import Counter, Histogram
+
+        self.span_seconds = Histogram(
+            "research_span_seconds", "Wall time of instrumented operations",
+            ["kind", "name"], buckets=LATENCY_BUCKETS
+        )
+        self.queue_wait_seconds = Histogram(
+            "research_span_queue_wait_seconds", "Time spent waiting for a concurrency slot",
+            ["kind", "name"], buckets=LATENCY_BUCKETS
+        )
+        self.span_errors = Counter("research_span_errors_total", "Operations that raised", ["kind", "name"])
+        self.bytes = Counter("research_fetched_bytes_total", "Bytes fetched from providers and pages", ["name"])
+        self.tokens = Counter("research_llm_tokens_total", "LLM tokens", ["name", "model", "type"])
+        self.cost = Counter("research_llm_cost_usd_total", "Estimated LLM cost in USD", ["name", "model"])
+        self.request_seconds = Histogram(
+            "research_request_seconds", "Wall time of research requests",
+            ["endpoint", "cached"], buckets=LATENCY_BUCKETS
+        )
+        self.request_cost = Counter("research_request_cost_usd_total", "Estimated LLM cost of research requests", ["endpoint"])
+
+    def observe(self, span: Span):
+        self.span_seconds.labels(span.kind, span.name).observe(span.wall)
+        if span.queue_wait:
+            self.queue_wait_seconds.labels(span.kind, span.name).observe(span.queue_wait)
+        if span.error:
+            self.span_errors.labels(span.kind, span.name).inc()
+        if span.bytes:
+            self.bytes.labels(span.name).inc(span.bytes)
+        if span.model:
+            self.tokens.labels(span.name, span.model, "prompt").inc(span.prompt_tokens)
+            self.tokens.labels(span.name, span.model, "completion").inc(span.completion_tokens)
+            self.cost.labels(span.name, span.model).inc(span.cost)
+
+
+_metrics: Optional[_Metrics] = None
+_metrics_unavailable = False
+
+
+def get_metrics() -> Optional[_Metrics]:
+    """Shared Prometheus collectors, or None when disabled or not installed."""
+    global _metrics, _metrics_unavailable
+    if _metrics is None and not _metrics_unavailable and settings.TELEMETRY_ENABLED:
+        try:
+            _metrics = _Metrics()
+        except ImportError:
+            print("prometheus_client not installed; /metrics is disabled")
+            _metrics_unavailable = True
+    return _metrics
+
+
+@contextmanager
+def span(name: str, kind: str = "tool", **attrs):
+    """
+    Time the enclosed block as a span.
+    Queue wait recorded with record_queue_wait just before is attached to it.
+    """
+    current = Span(name, kind, attrs)
+    current.queue_wait = _pending_queue_wait.get()
+    if current.queue_wait:
+        _pending_queue_wait.set(0.0)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        current.wall = time.perf_counter() - current.started
+
+        trace = _trace.get()
+        if trace is not None:
+            trace.spans.append(current)
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.observe(current)
+
+
+def traced(name: str, kind: str = "node"):
+    """Decorate an async function so every call runs in a span."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_request(endpoint: str, seconds: float, cached: bool, cost: float = 0.0):
+    """Record a finished research request."""
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.request_seconds.labels(endpoint, str(cached).lower()).observe(seconds)
+        if cost:
+            metrics.request_cost.labels(endpoint).inc(cost)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus exposition of all metrics, with its content type."""
+    if get_metrics() is None:
+        return b"# metrics disabled or prometheus_client not installed\n", "text/plain; charset=utf-8"
+
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    return generate_latest(), CONTENT_TYPE_LATEST
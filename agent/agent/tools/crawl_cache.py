@@ -0,0 +1,201 @@
+"""Crawl cache keyed by normalized URL with TTL and conditional revalidation."""
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import hashlib
+import time
+
+from agent.cache import create_cache
+from agent.config import settings
+
+
+TRACKING_PARAMS = {"gclid", "fbclid", "mc_cid", "mc_eid", "ref", "cmpid"}
+
+FILING_HOSTS = ("sec.gov", "bseindia.com", "nseindia.com", "sebi.gov.in", "rbi.org.in")
+FILING_MARKERS = ("annual-report", "annualreport", "10-k", "10-q", "/filings", "/investor", "earnings-release", ".pdf")
+
+NEWS_HOSTS = (
+    "reuters.com", "bloomberg.com", "cnbc.com", "moneycontrol.com", "economictimes.indiatimes.com",
+    "livemint.com", "business-standard.com", "financialexpress.com", "ft.com", "wsj.com"
+)
+NEWS_MARKERS = ("/news/", "/markets/", "/live/")
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL for cache lookups.
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the query string and strips trailing slashes.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def cache_key(url: str) -> str:
+    """Cache key for a URL: hash of its normalized form."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+
+def body_hash(body: bytes) -> str:
+    """Content hash of a raw response body."""
+    return hashlib.sha256(body).hexdigest()
+
+
+def ttl_for_url(url: str) -> float:
+    """Filings change rarely and get a long TTL; news gets a short one."""
+    normalized = normalize_url(url)
+    host = urlsplit(normalized).hostname or ""
+
+    if host.endswith(FILING_HOSTS) or any(m in normalized for m in FILING_MARKERS):
+        return settings.CRAWL_CACHE_FILING_TTL_SECONDS
+    if host.endswith(NEWS_HOSTS) or any(m in normalized for m in NEWS_MARKERS):
+        return settings.CRAWL_CACHE_NEWS_TTL_SECONDS
+    return settings.CRAWL_CACHE_DEFAULT_TTL_SECONDS
+
+
+class CrawlCacheStats:
+    """Hit-rate counters for the crawl cache."""
+
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.stores = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the counters with the effective hit rate."""
+        served = self.hits + self.revalidated + self.stale_served
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+            "stores": self.stores,
+            "hit_rate": served / self.lookups if self.lookups else 0.0,
+        }
+
+
+class CrawlCache:
+    """
+    Stores extracted page text with its HTTP validators.
+
+    Entries are kept past their TTL so stale pages can be revalidated with a
+    conditional GET instead of being downloaded and parsed again.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = CrawlCacheStats()
+
+    async def lookup(self, url: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return (entry, is_fresh) for a URL."""
+        self.stats.lookups += 1
+        try:
+            entry = await self.backend.get(cache_key(url))
+        except Exception as e:
+            print(f"Crawl cache lookup failed for {url}: {e}")
+            entry = None
+
+        if entry is None:
+            self.stats.misses += 1
+            return None, False
+
+        if time.time() - entry["fetched_at"] < entry["ttl"]:
+            self.stats.hits += 1
+            return entry, True
+
+        self.stats.stale += 1
+        return entry, False
+
+    def conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Build If-None-Match / If-Modified-Since headers for a stale entry."""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def store(
+        self,
+        url: str,
+        text: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        body_hash: Optional[str] = None,
+        facts: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Store freshly extracted text and structured facts."""
+        entry = {
+            "url": normalize_url(url),
+            "text": text,
+            "facts": facts or [],
+            "body_hash": body_hash,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+            "ttl": ttl_for_url(url),
+        }
+        await self._write(entry)
+        self.stats.stores += 1
+        return entry
+
+    async def mark_revalidated(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Restart the TTL of an entry confirmed unchanged, either by a 304 or
+        by a re-downloaded body with the same content hash.
+        """
+        entry = {**entry, "fetched_at": time.time()}
+        await self._write(entry)
+        self.stats.revalidated += 1
+        return entry
+
+    def mark_stale_served(self):
+        """Record that a stale entry was served because the refetch failed."""
+        self.stats.stale_served += 1
+
+    async def _write(self, entry: Dict[str, Any]):
+        retention = entry["ttl"] * settings.CRAWL_CACHE_STALE_RETENTION_FACTOR
+        try:
+            await self.backend.set(cache_key(entry["url"]), entry, ttl=retention)
+        except Exception as e:
+            print(f"Crawl cache write failed for {entry['url']}: {e}")
+
+
+_crawl_cache: Optional[CrawlCache] = None
+_crawl_cache_initialized = False
+
+
+def get_crawl_cache() -> Optional[CrawlCache]:
+    """Get the configured crawl cache, or None when caching is disabled."""
+    global _crawl_cache, _crawl_cache_initialized
+    if not _crawl_cache_initialized:
+        backend = create_cache(
+            settings.CRAWL_CACHE_BACKEND,
+            namespace="crawl",
+            max_bytes=settings.CRAWL_CACHE_MAX_BYTES
+        )
+        _crawl_cache = CrawlCache(backend) if backend is not None else None
+        _crawl_cache_initialized = True
+    return _crawl_cache
@@ -1,35 +1,123 @@
 """Web crawler for extracting content from URLs."""
-import httpx
-from bs4 import BeautifulSoup
-from typing import Optional
+from typing import Any, Dict, Optional
 
+from agent.config import settings
+from agent.tools.crawl_cache import get_crawl_cache, body_hash
+from agent.tools.extraction import content_kind, extract_content, extract_document_async
+from agent.tools.http_client import get_http_client, provider_timeout
+from agent.telemetry import add_bytes, span
 
-def crawl_url(url: str, timeout: int = 10) -> Optional[str]:
+
+def extract_text(html: str) -> str:
+    """Extract readable text from an HTML document."""
+    return extract_content(html.encode("utf-8"), "html", "utf-8")
+
+
+def _document(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {"text": entry["text"], "facts": entry.get("facts") or []}
+
+
+async def crawl_url(url: str, timeout: Optional[float] = None) -> Optional[str]:
+    """Crawl a URL and extract main content."""
+    document = await crawl_document(url, timeout)
+    return document["text"] if document else None
+
+
+async def crawl_document(url: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
     """
-    Crawl a URL and extract main content.
+    Crawl a URL and extract {"text", "facts"}, where facts are structured
+    financial records from the page's tables and inline XBRL.
+    Fresh cached pages are returned without a request; stale ones are
+    revalidated with a conditional GET. The body is streamed and capped at
+    CRAWL_MAX_BYTES (CRAWL_MAX_PDF_BYTES for PDFs); unsupported content
+    types are skipped before their body is read.
     """
+    with span("crawl_url"):
+        return await _crawl_document(url, timeout)
+
+
+async def _crawl_document(url: str, timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+    cache = get_crawl_cache()
+    entry, fresh = await cache.lookup(url) if cache else (None, False)
+    if fresh:
+        return _document(entry)
+
     try:
-        with httpx.Client(follow_redirects=True, timeout=timeout) as client:
-            response = client.get(url, headers={
-                "User-Agent": "Mozilla/5.0 (compatible; FinanceResearchBot/1.0)"
-            })
+        client = get_http_client()
+        async with client.stream(
+            "GET",
+            url,
+            headers=cache.conditional_headers(entry) if cache else None,
+            follow_redirects=True,
+            timeout=timeout if timeout is not None else provider_timeout("crawl")
+        ) as response:
+            if entry and response.status_code == 304:
+                await cache.mark_revalidated(entry)
+                return _document(entry)
+
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, "lxml")
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
-            
-            # Get text
-            text = soup.get_text(separator="\n", strip=True)
-            
-            # Clean up whitespace
-            lines = [line.strip() for line in text.splitlines() if line.strip()]
-            content = "\n".join(lines)
-            
-            return content
-            
+
+            content_type = response.headers.get("content-type")
+            kind = content_kind(content_type) if content_type else None
+            limit = settings.CRAWL_MAX_PDF_BYTES if kind == "pdf" else settings.CRAWL_MAX_BYTES
+
+            declared = int(response.headers.get("content-length") or 0)
+            if kind == "pdf" and declared > limit:
+                # A truncated PDF cannot be parsed, so do not download it
+                print(f"Skipping {url}: PDF of {declared} bytes exceeds {limit}")
+                return None
+
+            chunks = []
+            size = 0
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if kind is None and len(chunks) == 1:
+                    # No usable Content-Type: sniff the first bytes
+                    kind = content_kind(content_type, chunk)
+                    if kind is None:
+                        print(f"Skipping {url}: unsupported content type {content_type!r}")
+                        return None
+                    limit = settings.CRAWL_MAX_PDF_BYTES if kind == "pdf" else settings.CRAWL_MAX_BYTES
+                if size >= limit:
+                    truncated = True
+                    break
+
+            data = b"".join(chunks)[:limit]
+            add_bytes(len(data))
+            if kind is None:
+                return None
+            if kind == "pdf" and truncated:
+                print(f"Skipping {url}: PDF exceeds {limit} bytes")
+                return None
+
+            encoding = response.charset_encoding
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+
+        digest = body_hash(data)
+        if entry and entry.get("body_hash") == digest:
+            await cache.mark_revalidated(entry)
+            return _document(entry)
+
+        # Parsing is CPU bound; keep it off the event loop
+        document = await extract_document_async(data, kind, encoding)
+
+        if cache:
+            await cache.store(
+                url,
+                document["text"],
+                etag=etag,
+                last_modified=last_modified,
+                body_hash=digest,
+                facts=document["facts"]
+            )
+        return document
+
     except Exception as e:
         print(f"Error crawling {url}: {e}")
+        if entry:
+            cache.mark_stale_served()
+            return _document(entry)
         return None
@@ -0,0 +1,257 @@
+"""
+Content extraction for crawled documents.
+Dispatches on content type (HTML, PDF, plain text), pulls structured
+financial facts out of HTML, and runs CPU-heavy parsing in a process pool
+so it does not hold the event loop.
+"""
+import asyncio
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from agent.config import settings
+
+
+# Subtrees that never hold article text
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "svg", "nav", "footer", "header", "aside", "form", "iframe")
+
+# Elements that end a line of text
+BLOCK_TAGS = (
+    "p", "div", "section", "article", "main", "br", "li", "ul", "ol", "tr", "table",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dt", "dd"
+)
+
+# Main-content containers, best first; used when they hold enough of the page
+MAIN_CONTENT_XPATH = "//main | //article | //*[@role='main'] | //*[@id='content' or @id='main-content']"
+MAIN_CONTENT_MIN_SHARE = 0.3
+
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+PDF_TYPES = {"application/pdf", "application/x-pdf"}
+TEXT_TYPES = {"text/plain", "text/csv", "text/markdown", "application/json", "application/xml", "text/xml"}
+
+
+def content_kind(content_type: Optional[str], head: bytes = b"") -> Optional[str]:
+    """
+    Classify a response as "html", "pdf" or "text" from its Content-Type,
+    sniffing the first bytes when the header is missing or generic.
+    Returns None for content we do not extract (images, archives, video).
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime in HTML_TYPES:
+        return "html"
+    if mime in PDF_TYPES:
+        return "pdf"
+    if mime in TEXT_TYPES:
+        return "text"
+
+    if mime in ("", "application/octet-stream", "binary/octet-stream"):
+        start = head.lstrip()[:64].lower()
+        if start.startswith(b"%pdf"):
+            return "pdf"
+        if start.startswith((b"<!doctype html", b"<html", b"<?xml", b"<head", b"<body")):
+            return "html"
+    return None
+
+
+def _clean_lines(text: str) -> str:
+    lines = (re.sub(r"[ \t ]+", " ", line).strip().rstrip(" |") for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _parse_lxml(data: bytes, encoding: Optional[str] = None):
+    import lxml.html
+    from lxml import etree
+
+    parser = lxml.html.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True)
+    try:
+        return lxml.html.document_fromstring(data, parser=parser)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def _text_from_tree(root) -> str:
+    from lxml import etree
+
+    # ix:header holds inline-XBRL contexts, hidden from readers
+    etree.strip_elements(root, *BOILERPLATE_TAGS, "ix:header", with_tail=False)
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = "\n" + element.tail if element.tail else "\n"
+    for element in root.iter("td", "th"):
+        element.tail = " | " + element.tail if element.tail else " | "
+
+    body = root.find("body")
+    body = body if body is not None else root
+    text = body.text_content()
+
+    for candidate in root.xpath(MAIN_CONTENT_XPATH):
+        candidate_text = candidate.text_content()
+        if len(candidate_text) >= MAIN_CONTENT_MIN_SHARE * len(text):
+            text = candidate_text
+            break
+
+    return _clean_lines(text)
+
+
+def extract_html_lxml(data: bytes, encoding: Optional[str] = None) -> str:
+    """
+    Extract readable text with lxml.
+    Boilerplate subtrees are stripped in C, and the page's main/article
+    element is used when it holds a meaningful share of the text.
+    """
+    root = _parse_lxml(data, encoding)
+    return _text_from_tree(root) if root is not None else ""
+
+
+def extract_html_selectolax(data: bytes, encoding: Optional[str] = None) -> str:
+    """Extract readable text with selectolax's lexbor parser (optional dependency)."""
+    from selectolax.lexbor import LexborHTMLParser
+
+    html = data.decode(encoding or "utf-8", errors="replace")
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(BOILERPLATE_TAGS))
+
+    node = tree.body or tree.root
+    if node is None:
+        return ""
+    text = node.text(separator="\n")
+
+    for selector in ("main", "article", "[role=main]", "#content", "#main-content"):
+        candidate = tree.css_first(selector)
+        if candidate is not None:
+            candidate_text = candidate.text(separator="\n")
+            if len(candidate_text) >= MAIN_CONTENT_MIN_SHARE * len(text):
+                text = candidate_text
+                break
+
+    return _clean_lines(text)
+
+
+def extract_html_bs4(data: bytes, encoding: Optional[str] = None) -> str:
+    """Extract readable text with BeautifulSoup (slowest; kept for comparison)."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(data, "lxml", from_encoding=encoding)
+    for element in soup(list(BOILERPLATE_TAGS)):
+        element.decompose()
+    return _clean_lines(soup.get_text(separator="\n", strip=True))
+
+
+HTML_PARSERS = {
+    "lxml": extract_html_lxml,
+    "selectolax": extract_html_selectolax,
+    "bs4": extract_html_bs4,
+}
+
+
+def resolve_html_parser(name: Optional[str] = None) -> str:
+    """Parser to use: "auto" picks selectolax when installed, else lxml."""
+    name = (name or settings.CRAWL_HTML_PARSER).lower()
+    if name == "auto":
+        try:
+            import selectolax  # noqa: F401
+            return "selectolax"
+        except ImportError:
+            return "lxml"
+    if name not in HTML_PARSERS:
+        raise ValueError(f"Unsupported HTML parser: {name}")
+    return name
+
+
+def extract_pdf(data: bytes) -> str:
+    """Extract text from a PDF with pypdf (optional dependency)."""
+    try:
+        from io import BytesIO
+        from pypdf import PdfReader
+    except ImportError:
+        print("pypdf not installed; skipping PDF")
+        return ""
+
+    reader = PdfReader(BytesIO(data))
+    pages = []
+    for page in reader.pages[:settings.CRAWL_MAX_PDF_PAGES]:
+        pages.append(page.extract_text() or "")
+    return _clean_lines("\n".join(pages))
+
+
+def extract_content(data: bytes, kind: str, encoding: Optional[str] = None, parser: Optional[str] = None) -> str:
+    """Extract text from a document body of the given kind."""
+    if kind == "html":
+        return HTML_PARSERS[resolve_html_parser(parser)](data, encoding)
+    if kind == "pdf":
+        return extract_pdf(data)
+    if kind == "text":
+        return _clean_lines(data.decode(encoding or "utf-8", errors="replace"))
+    raise ValueError(f"Unsupported content kind: {kind}")
+
+
+def extract_document(
+    data: bytes,
+    kind: str,
+    encoding: Optional[str] = None,
+    parser: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Extract {"text", "facts"} from a document body.
+    For HTML, numeric tables and inline-XBRL facts become structured facts.
+    With the lxml parser the page is parsed once and the tables that
+    yielded facts are left out of the text.
+    """
+    if kind != "html" or not settings.FINANCIAL_FACTS_ENABLED:
+        return {"text": extract_content(data, kind, encoding, parser), "facts": []}
+
+    from agent.tools.financial_extractor import extract_facts
+
+    root = _parse_lxml(data, encoding)
+    if root is None:
+        return {"text": "", "facts": []}
+
+    has_inline_xbrl = re.search(rb"nonfraction", data, re.IGNORECASE) is not None
+    facts, tables = extract_facts(root, settings.FINANCIAL_FACTS_MAX, has_inline_xbrl)
+
+    parser = resolve_html_parser(parser)
+    if parser != "lxml":
+        return {"text": extract_content(data, kind, encoding, parser), "facts": facts}
+
+    for table in tables:
+        if table.getparent() is not None:
+            # Keep the tail text that follows the table
+            table.drop_tree()
+    return {"text": _text_from_tree(root), "facts": facts}
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared process pool for parsing, or None when EXTRACTION_WORKERS is 0."""
+    global _pool
+    if _pool is None and settings.EXTRACTION_WORKERS > 0:
+        # spawn: forking a process that runs an event loop and open sockets is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def close_extraction_pool():
+    """Shut down the parsing processes."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def extract_document_async(data: bytes, kind: str, encoding: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract text and facts off the event loop.
+    Small documents are parsed in a thread, where the transfer to a worker
+    process would cost more than the parse; larger ones go to the pool.
+    """
+    parser = resolve_html_parser()
+    pool = get_extraction_pool()
+    if pool is None or len(data) < settings.EXTRACTION_INLINE_MAX_BYTES:
+        return await asyncio.to_thread(extract_document, data, kind, encoding, parser)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, extract_document, data, kind, encoding, parser)
@@ -0,0 +1,193 @@
+"""
+Structured financial facts from filings and results pages.
+Turns numeric HTML tables and inline-XBRL facts into compact
+(metric, period, value, unit) records.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+
+NUMBER = re.compile(
+    r"^(?P<neg>\()?\s*(?P<minus>[-−–])?\s*(?:[$€£¥₹]|rs\.?|inr|usd)?\s*"
+    r"(?P<num>\d{1,3}(?:,\d{2,3})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*(?P<suffix>%|x|bps)?\s*\)?$",
+    re.IGNORECASE
+)
+UNIT_IN_LABEL = re.compile(r"\(([^()]*)\)\s*$")
+YEAR = re.compile(r"^(?:FY\s?)?(?:19|20)\d{2}$", re.IGNORECASE)
+CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+
+def _local(tag: Any) -> str:
+    return tag.split(":")[-1].lower() if isinstance(tag, str) else ""
+
+
+def parse_number(text: str) -> Optional[Tuple[float, Optional[str]]]:
+    """
+    Parse a table cell such as "27,385", "(1,234)", "3.40%", "1.2x" or
+    "₹ 1,05,000" into (value, unit suffix); None if it is not a number.
+    """
+    match = NUMBER.match(text.strip())
+    if not match:
+        return None
+    value = float(match.group("num").replace(",", ""))
+    if match.group("neg") or match.group("minus"):
+        value = -value
+    suffix = match.group("suffix")
+    return value, suffix.lower() if suffix else None
+
+
+def _split_label(label: str) -> Tuple[str, Optional[str]]:
+    """'Net profit (₹ crore)' -> ('Net profit', '₹ crore')."""
+    match = UNIT_IN_LABEL.search(label)
+    if match:
+        return label[:match.start()].strip(" :"), match.group(1).strip() or None
+    return label.strip(" :"), None
+
+
+def _cells(row) -> List[str]:
+    return [" ".join(cell.text_content().split()) for cell in row if _local(cell.tag) in ("td", "th")]
+
+
+def facts_from_table(table, max_facts: int) -> List[Dict[str, Any]]:
+    """
+    Facts from one table whose body is mostly numbers.
+    The first row without numbers is the header of period labels; the first
+    cell of each later row is the metric, with its unit in parentheses.
+    """
+    rows = [_cells(row) for row in table.iter("tr")]
+    rows = [r for r in rows if any(r)]
+    if len(rows) < 2:
+        return []
+
+    header: List[str] = []
+    table_unit: Optional[str] = None
+    facts: List[Dict[str, Any]] = []
+    numeric = 0
+    data_cells = 0
+
+    for index, cells in enumerate(rows):
+        values = [parse_number(c) for c in cells[1:]]
+        # A header of bare years ("2024 | 2023") also parses as numbers
+        year_header = index == 0 and all(YEAR.match(c) for c in cells[1:] if c) and any(cells[1:])
+        if not header and (year_header or not any(values)):
+            header = cells
+            table_unit = _split_label(cells[0])[1] if cells else None
+            continue
+
+        metric, unit = _split_label(cells[0]) if cells else ("", None)
+        for column, (cell, parsed) in enumerate(zip(cells[1:], values), start=1):
+            if not cell:
+                continue
+            data_cells += 1
+            if parsed is None or not metric:
+                continue
+            numeric += 1
+            value, suffix = parsed
+            period = header[column] if column < len(header) else ""
+            facts.append({
+                "metric": metric,
+                "period": period,
+                "value": value,
+                "unit": unit or suffix or table_unit,
+                "source": "table"
+            })
+
+    # Layout tables and link lists are mostly text
+    if numeric < 2 or numeric < 0.5 * data_cells:
+        return []
+    return facts[:max_facts]
+
+
+def _metric_name(concept: str) -> str:
+    """'us-gaap:NetIncomeLoss' -> 'Net Income Loss'."""
+    return CAMEL.sub(" ", concept.split(":")[-1])
+
+
+def facts_from_inline_xbrl(root, max_facts: int) -> List[Dict[str, Any]]:
+    """Numeric facts (ix:nonFraction) with their context periods and units."""
+    periods: Dict[str, str] = {}
+    units: Dict[str, str] = {}
+    elements = []
+
+    for element in root.iter():
+        name = _local(element.tag)
+        if name == "context":
+            instant = [e.text_content().strip() for e in element.iter() if _local(e.tag) == "instant"]
+            start = [e.text_content().strip() for e in element.iter() if _local(e.tag) == "startdate"]
+            end = [e.text_content().strip() for e in element.iter() if _local(e.tag) == "enddate"]
+            if instant:
+                periods[element.get("id")] = instant[0]
+            elif start and end:
+                periods[element.get("id")] = f"{start[0]}..{end[0]}"
+        elif name == "unit":
+            measures = [e.text_content().strip().split(":")[-1] for e in element.iter() if _local(e.tag) == "measure"]
+            units[element.get("id")] = "/".join(measures)
+        elif name == "nonfraction":
+            elements.append(element)
+
+    facts = []
+    for element in elements[:max_facts]:
+        text = element.text_content().strip()
+        if element.get("format", "").endswith("fixed-zero") or text in ("-", "—", ""):
+            value = 0.0
+        else:
+            parsed = parse_number(text)
+            if parsed is None:
+                continue
+            value = abs(parsed[0])
+        value *= 10 ** int(element.get("scale") or 0)
+        if element.get("sign") == "-":
+            value = -value
+
+        facts.append({
+            "metric": _metric_name(element.get("name", "")),
+            "period": periods.get(element.get("contextref"), ""),
+            "value": value,
+            "unit": units.get(element.get("unitref")),
+            "source": "ixbrl"
+        })
+    return facts
+
+
+def extract_facts(root, max_facts: int = 200, has_inline_xbrl: bool = True) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """
+    Facts from a parsed lxml HTML tree.
+    Returns (facts, tables) where tables are the elements all of whose facts
+    were kept, so callers can leave them out of the flattened text.
+    """
+    facts: List[Dict[str, Any]] = []
+    if has_inline_xbrl:
+        facts.extend(facts_from_inline_xbrl(root, max_facts))
+
+    consumed = []
+    for table in root.iter("table"):
+        if len(facts) >= max_facts:
+            break
+        # Nested tables are read as part of their outermost table
+        if any(_local(a.tag) == "table" for a in table.iterancestors()):
+            continue
+        remaining = max_facts - len(facts)
+        # One over the budget shows whether the table was cut short
+        table_facts = facts_from_table(table, remaining + 1)
+        facts.extend(table_facts[:remaining])
+        # A table cut short by the cap stays in the text so no rows are lost
+        if table_facts and len(table_facts) <= remaining:
+            consumed.append(table)
+
+    # Inline XBRL repeats values in summary and detail tables
+    seen = set()
+    unique = []
+    for fact in facts:
+        key = (fact["metric"].lower(), fact["period"], fact["value"], fact["unit"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(fact)
+    return unique, consumed
+
+
+def format_fact(fact: Dict[str, Any]) -> str:
+    """One compact prompt line: 'Net profit | Q2 FY25 | 16,373 ₹ crore'."""
+    value = f"{fact['value']:,.4f}".rstrip("0").rstrip(".")
+    unit = f" {fact['unit']}" if fact.get("unit") else ""
+    period = fact.get("period") or "n/a"
+    return f"{fact['metric']} | {period} | {value}{unit}"
@@ -0,0 +1,152 @@
+"""Process-wide pooled async HTTP client shared by all research tools."""
+import httpx
+from typing import Optional, Dict, Any
+
+from agent.config import settings
+
+
+USER_AGENT = "Mozilla/5.0 (compatible; FinanceResearchBot/1.0)"
+
+
+class PoolStats:
+    """Counters describing how the connection pool is being used."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.waiting = 0
+        self.in_flight = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return the current counters."""
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+        }
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that records pool usage via httpcore trace events.
+
+    A request counts as waiting until its headers are sent; if no TCP connect
+    happened before that, it was served from an already open connection.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        state = {"connected": False, "sent": False}
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(name: str, info: Dict[str, Any]):
+            if name == "connection.connect_tcp.started":
+                state["connected"] = True
+                stats.connections_opened += 1
+            elif name.endswith("send_request_headers.started") and not state["sent"]:
+                state["sent"] = True
+                stats.waiting -= 1
+                if not state["connected"]:
+                    stats.connections_reused += 1
+            if parent_trace is not None:
+                await parent_trace(name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        stats.requests += 1
+        stats.waiting += 1
+        stats.in_flight += 1
+        try:
+            return await self._transport.handle_async_request(request)
+        finally:
+            if not state["sent"]:
+                stats.waiting -= 1
+            stats.in_flight -= 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+pool_stats = PoolStats()
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def provider_timeout(provider: str) -> httpx.Timeout:
+    """Get the request timeout for a tool or search provider."""
+    timeouts = {
+        "tavily": settings.TAVILY_TIMEOUT_SECONDS,
+        "brave": settings.BRAVE_TIMEOUT_SECONDS,
+        "serper": settings.SERPER_TIMEOUT_SECONDS,
+        "crawl": settings.CRAWL_TIMEOUT_SECONDS,
+    }
+    return httpx.Timeout(
+        timeouts.get(provider, settings.HTTP_DEFAULT_TIMEOUT_SECONDS),
+        connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+    )
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build a pooled async client with keep-alive limits and HTTP/2."""
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+
+    return httpx.AsyncClient(
+        transport=InstrumentedTransport(transport, pool_stats),
+        timeout=httpx.Timeout(
+            settings.HTTP_DEFAULT_TIMEOUT_SECONDS,
+            connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+        ),
+        headers={"User-Agent": USER_AGENT}
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Create the shared client. Called from the FastAPI lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared client.
+    Created lazily when used outside the FastAPI app (scripts, tests).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Get connection pool usage counters."""
+    return pool_stats.snapshot()
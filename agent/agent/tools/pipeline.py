@@ -0,0 +1,159 @@
+"""Concurrent search-and-crawl pipeline used by the search node."""
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+from agent.config import settings
+from agent.tools.search import search_web
+from agent.tools.crawler import crawl_document
+from agent.tools.crawl_cache import normalize_url
+from agent.telemetry import record_queue_wait
+
+
+class FetchLimits:
+    """Global and per-host fetch concurrency limits."""
+
+    def __init__(self, max_concurrency: Optional[int] = None, per_host_concurrency: Optional[int] = None):
+        per_host = per_host_concurrency or settings.FETCH_PER_HOST_CONCURRENCY
+        self.global_limit = asyncio.Semaphore(max_concurrency or settings.FETCH_CONCURRENCY)
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(per_host))
+
+
+# run id -> (limits, number of holders)
+_run_limits: Dict[str, Tuple[FetchLimits, int]] = {}
+
+
+@contextmanager
+def run_fetch_limits(run_id: str) -> Iterator[FetchLimits]:
+    """
+    Fetch limits shared by everything holding the same run id, so the
+    concurrent branches of one research run stay within one budget.
+    """
+    limits, holders = _run_limits.get(run_id) or (FetchLimits(), 0)
+    _run_limits[run_id] = (limits, holders + 1)
+    try:
+        yield limits
+    finally:
+        limits, holders = _run_limits[run_id]
+        if holders > 1:
+            _run_limits[run_id] = (limits, holders - 1)
+        else:
+            del _run_limits[run_id]
+
+
+class SearchCrawlPipeline:
+    """
+    Issues all search queries at once and starts crawling each URL as soon as
+    the search that found it returns.
+
+    Crawls are bounded by a global and a per-host concurrency limit, and
+    searches by the search provider's rate limiter. The whole run is bounded
+    by a deadline: sources whose crawl has not finished when it expires keep
+    their search snippet as content. Pipelines given the
+    same FetchLimits share them; otherwise each run has its own.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        per_host_concurrency: Optional[int] = None,
+        deadline: Optional[float] = None,
+        max_content_chars: Optional[int] = None,
+        limits: Optional[FetchLimits] = None
+    ):
+        self.max_concurrency = max_concurrency or settings.FETCH_CONCURRENCY
+        self.per_host_concurrency = per_host_concurrency or settings.FETCH_PER_HOST_CONCURRENCY
+        self.deadline = deadline if deadline is not None else settings.SEARCH_DEADLINE_SECONDS
+        self.max_content_chars = max_content_chars or settings.MAX_SOURCE_CHARS
+        self.limits = limits
+
+    async def run(
+        self,
+        queries: List[str],
+        max_results: int = 5,
+        exclude_urls: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search all queries concurrently and return the gathered sources."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+
+        limits = self.limits or FetchLimits(self.max_concurrency, self.per_host_concurrency)
+        global_limit = limits.global_limit
+        host_limits = limits.host_limits
+
+        sources: Dict[str, Dict[str, Any]] = {}
+        seen = {normalize_url(url) for url in exclude_urls or ()}
+        tasks: List[asyncio.Task] = []
+
+        async def crawl(url: str):
+            host = urlparse(url).netloc.lower()
+            queued = time.perf_counter()
+            # Take the host slot first so a busy host does not hold global slots
+            async with host_limits[host]:
+                async with global_limit:
+                    record_queue_wait(time.perf_counter() - queued)
+                    document = await crawl_document(url)
+            if document and document["text"]:
+                sources[url]["content"] = document["text"][:self.max_content_chars]
+            if document and document["facts"]:
+                sources[url]["facts"] = document["facts"]
+
+        async def search(query: str):
+            # Searches are paced by the provider's rate limiter, and may sleep
+            # there on Retry-After, so they do not take page-fetch slots
+            try:
+                results = await search_web(query, max_results)
+            except Exception as e:
+                print(f"Error searching {query!r}: {e}")
+                return
+
+            for result in results:
+                url = result.get("url")
+                if not url:
+                    continue
+                key = normalize_url(url)
+                if key in seen:
+                    continue
+                seen.add(key)
+                sources[url] = {
+                    "url": url,
+                    "title": result.get("title", ""),
+                    "snippet": result.get("snippet", ""),
+                    "content": result.get("snippet", ""),
+                    "publishedAt": result.get("published_date"),
+                    "metadata": {
+                        "query": query,
+                        "score": result.get("score", 0)
+                    }
+                }
+                tasks.append(asyncio.create_task(crawl(url)))
+
+        tasks.extend(asyncio.create_task(search(q)) for q in queries)
+
+        # Crawl tasks are appended while searches complete, so re-check the
+        # pending set after every wake-up until everything is done or time is up
+        while True:
+            pending = [t for t in tasks if not t.done()]
+            remaining = deadline - loop.time()
+            if not pending or remaining <= 0:
+                break
+            await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+        return list(sources.values())
+
+
+async def search_and_crawl(
+    queries: List[str],
+    max_results: int = 5,
+    exclude_urls: Optional[Iterable[str]] = None,
+    limits: Optional[FetchLimits] = None
+) -> List[Dict[str, Any]]:
+    """Run the search-and-crawl pipeline with the configured limits, or shared ones."""
+    return await SearchCrawlPipeline(limits=limits).run(queries, max_results=max_results, exclude_urls=exclude_urls)
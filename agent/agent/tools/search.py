@@ -1,39 +1,63 @@
 """Web search tool with multiple provider support."""
-import httpx
 from typing import List, Dict, Any
 from agent.config import settings
+from agent.tools.http_client import get_http_client, provider_timeout
+from agent.tools.search_cache import get_search_cache
+from agent.telemetry import add_bytes, span
+from agent.rate_limit import get_rate_limiter
 
 
-def search_web(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+async def search_web(query: str, max_results: int = 10) -> List[Dict[str, Any]]:
     """
     Search the web using configured provider.
+    Results are served from the search cache when an equivalent query was
+    made recently. Provider calls run within the provider's rate limits and
+    are retried when throttled.
     """
     provider = settings.SEARCH_PROVIDER.lower()
-    
+
     if provider == "tavily":
-        return search_tavily(query, max_results)
+        search = search_tavily
     elif provider == "brave":
-        return search_brave(query, max_results)
+        search = search_brave
     elif provider == "serper":
-        return search_serper(query, max_results)
+        search = search_serper
     else:
         raise ValueError(f"Unsupported search provider: {provider}")
 
+    limiter = get_rate_limiter(provider)
+
+    async def fetch() -> List[Dict[str, Any]]:
+        if limiter is None:
+            return await search(query, max_results)
+        return await limiter.call(lambda: search(query, max_results))
+
+    with span("search_web", provider=provider):
+        cache = get_search_cache()
+        if cache is None:
+            return await fetch()
+        return await cache.get_or_fetch(provider, query, max_results, fetch)
+
 
-def search_tavily(query: str, max_results: int) -> List[Dict[str, Any]]:
+async def search_tavily(query: str, max_results: int) -> List[Dict[str, Any]]:
     """Search using Tavily API."""
-    from tavily import TavilyClient
-    
-    client = TavilyClient(api_key=settings.TAVILY_API_KEY)
-    response = client.search(
-        query=query,
-        max_results=max_results,
-        search_depth="advanced",
-        include_raw_content=True
-    )
-    
+    url = "https://api.tavily.com/search"
+    payload = {
+        "api_key": settings.TAVILY_API_KEY,
+        "query": query,
+        "max_results": max_results,
+        "search_depth": "advanced",
+        "include_raw_content": True
+    }
+
+    client = get_http_client()
+    response = await client.post(url, json=payload, timeout=provider_timeout("tavily"))
+    response.raise_for_status()
+    add_bytes(len(response.content))
+    data = response.json()
+
     results = []
-    for item in response.get("results", []):
+    for item in data.get("results", []):
         results.append({
             "url": item.get("url"),
             "title": item.get("title"),
@@ -41,11 +65,11 @@ def search_tavily(query: str, max_results: int) -> List[Dict[str, Any]]:
             "score": item.get("score", 0),
             "published_date": item.get("published_date")
         })
-    
+
     return results
 
 
-def search_brave(query: str, max_results: int) -> List[Dict[str, Any]]:
+async def search_brave(query: str, max_results: int) -> List[Dict[str, Any]]:
     """Search using Brave Search API."""
     url = "https://api.search.brave.com/res/v1/web/search"
     headers = {
@@ -56,12 +80,13 @@ def search_brave(query: str, max_results: int) -> List[Dict[str, Any]]:
         "q": query,
         "count": max_results
     }
-    
-    with httpx.Client() as client:
-        response = client.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-    
+
+    client = get_http_client()
+    response = await client.get(url, headers=headers, params=params, timeout=provider_timeout("brave"))
+    response.raise_for_status()
+    add_bytes(len(response.content))
+    data = response.json()
+
     results = []
     for item in data.get("web", {}).get("results", []):
         results.append({
@@ -71,11 +96,11 @@ def search_brave(query: str, max_results: int) -> List[Dict[str, Any]]:
             "score": 0,
             "published_date": item.get("age")
         })
-    
+
     return results
 
 
-def search_serper(query: str, max_results: int) -> List[Dict[str, Any]]:
+async def search_serper(query: str, max_results: int) -> List[Dict[str, Any]]:
     """Search using Serper API."""
     url = "https://google.serper.dev/search"
     headers = {
@@ -86,12 +111,13 @@ def search_serper(query: str, max_results: int) -> List[Dict[str, Any]]:
         "q": query,
         "num": max_results
     }
-    
-    with httpx.Client() as client:
-        response = client.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-    
+
+    client = get_http_client()
+    response = await client.post(url, headers=headers, json=payload, timeout=provider_timeout("serper"))
+    response.raise_for_status()
+    add_bytes(len(response.content))
+    data = response.json()
+
     results = []
     for item in data.get("organic", []):
         results.append({
@@ -101,5 +127,5 @@ def search_serper(query: str, max_results: int) -> List[Dict[str, Any]]:
             "score": item.get("position", 0),
             "published_date": item.get("date")
         })
-    
+
     return results
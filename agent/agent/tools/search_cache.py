@@ -0,0 +1,141 @@
+"""Search result cache with query normalization and request coalescing."""
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+import asyncio
+import hashlib
+import re
+
+from agent.cache import create_cache
+from agent.config import settings
+
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "in", "on", "at", "to", "by", "with",
+    "is", "are", "was", "were", "be", "what", "which", "who", "how", "does", "do",
+    "vs", "versus", "about", "from", "its", "it", "this", "that", "latest", "current"
+}
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so near-identical queries share a cache entry.
+    Lowercases, joins abbreviations like "P/E" or "S&P", drops stopwords and
+    punctuation, and sorts the remaining tokens.
+    """
+    text = query.lower()
+    text = re.sub(r"'s\b", "", text)
+    text = re.sub(r"(?<=\w)[/.&'](?=\w)", "", text)
+    tokens = re.findall(r"[a-z0-9]+", text)
+    return " ".join(sorted({t for t in tokens if t not in STOPWORDS}))
+
+
+def search_cache_key(provider: str, query: str, max_results: int) -> str:
+    """Cache key for a (provider, normalized query, max_results) triple."""
+    digest = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+    return f"{provider}:{max_results}:{digest}"
+
+
+class SearchCacheStats:
+    """Hit-rate counters for the search cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the counters with the hit rate (coalesced calls count as hits)."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+class SearchCache:
+    """
+    Caches provider results and coalesces identical concurrent searches so
+    only one upstream call per key is in flight in this process.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = SearchCacheStats()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_or_fetch(
+        self,
+        provider: str,
+        query: str,
+        max_results: int,
+        fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Return cached results, joining an in-flight call or fetching them."""
+        key = search_cache_key(provider, query, max_results)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats.coalesced += 1
+        else:
+            # The lookup runs in its own task, so a caller that is cancelled
+            # (e.g. at its pipeline deadline) does not cancel the others
+            task = asyncio.create_task(self._lookup_or_fetch(key, fetch))
+            task.add_done_callback(_consume_exception)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _lookup_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        results = await self._get(key)
+        if results is not None:
+            self.stats.hits += 1
+            return results
+
+        self.stats.misses += 1
+        results = await fetch()
+        if results:
+            await self._set(key, results)
+        return results
+
+    async def _get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            print(f"Search cache lookup failed: {e}")
+            return None
+
+    async def _set(self, key: str, results: List[Dict[str, Any]]):
+        try:
+            await self.backend.set(key, results, ttl=self.ttl)
+        except Exception as e:
+            print(f"Search cache write failed: {e}")
+
+
+def _consume_exception(future: asyncio.Future):
+    # Mark the exception retrieved when no caller was waiting on the task
+    if not future.cancelled():
+        future.exception()
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_initialized = False
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Get the configured search cache, or None when caching is disabled."""
+    global _search_cache, _search_cache_initialized
+    if not _search_cache_initialized:
+        backend = create_cache(
+            settings.SEARCH_CACHE_BACKEND,
+            namespace="search",
+            max_entries=settings.SEARCH_CACHE_MAX_ENTRIES
+        )
+        _search_cache = SearchCache(backend, ttl=settings.SEARCH_CACHE_TTL_SECONDS) if backend is not None else None
+        _search_cache_initialized = True
+    return _search_cache
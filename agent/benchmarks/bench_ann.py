@@ -0,0 +1,69 @@
+"""
+Benchmark the local ANN index: recall@k and latency per nprobe setting.
+
+Usage (from the agent directory):
+    python -m benchmarks.bench_ann --memories 100000 --dimensions 384
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from agent.ann_index import IVFIndex, top_k
+
+
+def clustered_vectors(rng, centres: np.ndarray, count: int, noise: float = 1.0) -> np.ndarray:
+    """Unit vectors drawn around topic centres, like real memories."""
+    vectors = centres[rng.integers(0, len(centres), count)]
+    vectors = vectors + noise * rng.standard_normal(vectors.shape, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((500, args.dimensions), dtype=np.float32)
+    vectors = clustered_vectors(rng, centres, args.memories)
+    queries = clustered_vectors(rng, centres, args.queries)
+
+    with tempfile.TemporaryDirectory() as path:
+        index = IVFIndex(path, nlist=args.nlist)
+
+        start = time.perf_counter()
+        for offset in range(0, args.memories, 1000):
+            batch = vectors[offset:offset + 1000]
+            index.add(batch, np.zeros(len(batch), dtype=np.int32))
+        index.flush()
+        print(f"memories={args.memories} dimensions={args.dimensions} nlist={args.nlist}")
+        print(f"build: {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        index.train()
+        print(f"train: {time.perf_counter() - start:.1f}s")
+
+        exact = [set(top_k(vectors @ q, args.limit).tolist()) for q in queries]
+
+        for nprobe in (1, 4, 8, 16, 32, 64):
+            latencies, hits = [], 0
+            for q, truth in zip(queries, exact):
+                start = time.perf_counter()
+                rows, _ = index.search(q, 0, args.limit, nprobe=nprobe)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(truth & set(rows.tolist()))
+            latencies = np.array(latencies)
+            print(
+                f"nprobe={nprobe:>3} recall@{args.limit}={hits / (len(queries) * args.limit):.3f} "
+                f"p50={np.percentile(latencies, 50):.3f}ms p99={np.percentile(latencies, 99):.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark HTML extraction over a stored corpus of finance pages.
+
+Compares the available parsers on time per page and extracted size, then
+measures end-to-end throughput of concurrent extraction in threads versus
+the process pool.
+
+Usage (from the agent directory):
+    python -m benchmarks.bench_extraction --corpus benchmarks/corpus --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agent.tools.extraction import HTML_PARSERS, extract_content
+
+
+def load_corpus(path: str):
+    pages = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(path, name), "rb") as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def available_parsers():
+    names = []
+    for name in HTML_PARSERS:
+        try:
+            extract_content(b"<html><body><p>x</p></body></html>", "html", "utf-8", name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def bench_parsers(pages, repeat: int):
+    for parser in available_parsers():
+        latencies = []
+        sizes = 0
+        for _ in range(repeat):
+            for _, data in pages:
+                start = time.perf_counter()
+                text = extract_content(data, "html", "utf-8", parser)
+                latencies.append((time.perf_counter() - start) * 1000)
+                sizes += len(text)
+        latencies = np.array(latencies)
+        print(
+            f"{parser:>10}: p50={np.percentile(latencies, 50):.2f}ms "
+            f"p95={np.percentile(latencies, 95):.2f}ms "
+            f"text={sizes // (repeat * len(pages)):,} chars/page"
+        )
+
+
+async def bench_concurrency(pages, repeat: int, parser: str, workers: int):
+    documents = [data for _ in range(repeat) for _, data in pages]
+    loop = asyncio.get_running_loop()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[asyncio.to_thread(extract_content, d, "html", "utf-8", parser) for d in documents])
+    thread_seconds = time.perf_counter() - start
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Warm the workers so start-up is not counted
+        await asyncio.gather(*[loop.run_in_executor(pool, extract_content, pages[0][1], "html", "utf-8", parser) for _ in range(workers)])
+        start = time.perf_counter()
+        await asyncio.gather(*[loop.run_in_executor(pool, extract_content, d, "html", "utf-8", parser) for d in documents])
+        process_seconds = time.perf_counter() - start
+
+    print(f"{len(documents)} pages with {parser}:")
+    print(f"   threads: {len(documents) / thread_seconds:,.0f} pages/s")
+    print(f"   {workers} processes: {len(documents) / process_seconds:,.0f} pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(__file__), "corpus"))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    print(f"corpus: {len(pages)} pages, {sum(len(d) for _, d in pages) // len(pages):,} bytes/page")
+    bench_parsers(pages, args.repeat)
+    asyncio.run(bench_concurrency(pages, args.repeat, available_parsers()[0], args.workers))
+
+
+if __name__ == "__main__":
+    main()
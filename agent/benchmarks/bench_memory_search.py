@@ -0,0 +1,56 @@
+"""
+Benchmark InMemoryStore search latency.
+
+Usage (from the agent directory):
+    python -m benchmarks.bench_memory_search --memories 100000 --dimensions 1536
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from agent.memory import InMemoryStore
+
+
+async def run(memories: int, dimensions: int, queries: int, limit: int):
+    rng = np.random.default_rng(0)
+    store = InMemoryStore()
+
+    start = time.perf_counter()
+    vectors = rng.standard_normal((memories, dimensions), dtype=np.float32)
+    for i in range(memories):
+        await store.save("bench-user", f"memory {i}", vectors[i], {"i": i})
+    insert_seconds = time.perf_counter() - start
+
+    query_vectors = rng.standard_normal((queries, dimensions), dtype=np.float32)
+    await store.search("bench-user", query_vectors[0], limit)  # warm up
+
+    latencies = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        await store.search("bench-user", query, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies = np.array(latencies)
+    print(f"memories={memories} dimensions={dimensions} limit={limit}")
+    print(f"insert: {memories / insert_seconds:,.0f} memories/s")
+    print(
+        f"search: p50={np.percentile(latencies, 50):.3f}ms "
+        f"p95={np.percentile(latencies, 95):.3f}ms "
+        f"p99={np.percentile(latencies, 99):.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.memories, args.dimensions, args.queries, args.limit))
+
+
+if __name__ == "__main__":
+    main()
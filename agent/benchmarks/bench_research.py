@@ -0,0 +1,323 @@
+"""
+Offline load benchmark of the research endpoints.
+
+Recorded search results, pages and LLM completions are replayed through
+local stand-ins (benchmarks/replay.py) with injected latency, so runs are
+reproducible and need no API keys. Each scenario drives /research or
+/research/stream in process at a fixed concurrency and reports latency
+percentiles, time to first answer token, requests/s, CPU time, memory and
+the mean time per span from the endpoints' timing breakdown. Results are
+written as JSON; pass an earlier file with --compare to print the deltas.
+
+Usage (from the agent directory):
+    python -m benchmarks.bench_research
+    python -m benchmarks.bench_research --scenario stream-c8 --requests 40 --latency-scale 0.5
+    python -m benchmarks.bench_research --compare benchmarks/results/research-abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.replay import Latency, ReplayFixtures, install_replay, replay_environment
+
+
+SCENARIOS = {
+    "research-c1": {"endpoint": "/research", "concurrency": 1, "requests": 4, "mode": "linear"},
+    "research-c8": {"endpoint": "/research", "concurrency": 8, "requests": 24, "mode": "linear"},
+    "stream-c8": {"endpoint": "/research/stream", "concurrency": 8, "requests": 24, "mode": "linear"},
+    "stream-c8-parallel": {"endpoint": "/research/stream", "concurrency": 8, "requests": 24, "mode": "parallel"},
+    "stream-c32": {"endpoint": "/research/stream", "concurrency": 32, "requests": 64, "mode": "linear"},
+}
+DEFAULT_SCENARIOS = ["research-c1", "research-c8", "stream-c8", "stream-c8-parallel"]
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if platform.system() == "Darwin" else peak / 1024
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    array = np.array(values)
+    return {
+        "p50": round(float(np.percentile(array, 50)), 1),
+        "p95": round(float(np.percentile(array, 95)), 1),
+        "p99": round(float(np.percentile(array, 99)), 1),
+        "mean": round(float(array.mean()), 1),
+        "max": round(float(array.max()), 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def post(app, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    POST to the ASGI app and time the response as it is sent.
+    Calls the app directly rather than through httpx's ASGI transport,
+    which buffers the whole body and so hides time to first token.
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    finished = asyncio.Event()
+    received = False
+    result = {"status": None, "ttft_ms": None, "timings": None, "error": None}
+    buffer = b""
+    chunks: List[bytes] = []
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal buffer
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            if path.endswith("/stream"):
+                buffer += chunk
+                while b"\n\n" in buffer:
+                    raw, buffer = buffer.split(b"\n\n", 1)
+                    if not raw.startswith(b"data: "):
+                        continue
+                    event = json.loads(raw[6:])
+                    if event["type"] == "answer" and result["ttft_ms"] is None:
+                        result["ttft_ms"] = (time.perf_counter() - start) * 1000
+                    elif event["type"] == "done":
+                        result["timings"] = event["content"].get("timings")
+                    elif event["type"] == "error":
+                        result["error"] = event["content"]
+            if not message.get("more_body", False):
+                finished.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    if not path.endswith("/stream"):
+        if result["status"] == 200:
+            result["timings"] = json.loads(b"".join(chunks)).get("timings")
+        else:
+            result["error"] = b"".join(chunks).decode(errors="replace")[:200]
+    return result
+
+
+def span_means(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Mean wall time and queue wait per span name per request."""
+    totals: Dict[str, Dict[str, float]] = {}
+    timed = [r["timings"] for r in results if r.get("timings")]
+    for timings in timed:
+        for name, entry in timings["spans"].items():
+            total = totals.setdefault(name, {"count": 0.0, "wall_ms": 0.0, "queue_wait_ms": 0.0})
+            for key in total:
+                total[key] += entry[key]
+    return {
+        name: {key: round(value / len(timed), 1) for key, value in total.items()}
+        for name, total in sorted(totals.items())
+    }
+
+
+async def run_scenario(app_module, fixtures: ReplayFixtures, name: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    from agent.research_graph import create_research_graph
+
+    # A fresh graph per scenario: its own in-memory checkpoints and the scenario's mode
+    app_module.research_graph = create_research_graph(mode=spec["mode"])
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(spec["requests"]):
+        queue.put_nowait(i)
+    results: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {
+                "query": fixtures.queries[i % len(fixtures.queries)],
+                "thread_id": f"bench-{name}-{uuid.uuid4()}",
+                "user_id": f"bench-user-{i % spec['concurrency']}",
+                "show_thinking": True,
+                "max_iterations": 3,
+                "use_cache": spec.get("use_cache", False),
+                "include_timings": True
+            }
+            results.append(await post(app_module.app, spec["endpoint"], payload))
+
+    rss_start = rss_mb()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(spec["concurrency"])])
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200 and not r["error"]]
+    return {
+        "name": name,
+        **spec,
+        "completed": len(ok),
+        "errors": len(results) - len(ok),
+        "rejected": sum(1 for r in results if r["status"] == 429),
+        "error_samples": [r["error"] for r in results if r["error"]][:3],
+        "elapsed_s": round(elapsed, 2),
+        "rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": percentiles([r["latency_ms"] for r in ok]),
+        "ttft_ms": percentiles([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "cpu_s": round(time.process_time() - cpu_start, 2),
+        "rss_mb_start": round(rss_start, 1),
+        "rss_mb_end": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "spans": span_means(ok),
+    }
+
+
+async def run(scenarios: List[str], overrides: Dict[str, Any], latency: Latency) -> List[Dict[str, Any]]:
+    # The environment must be in place before the agent config is first imported
+    for key, value in replay_environment().items():
+        os.environ.setdefault(key, value)
+
+    fixtures = ReplayFixtures()
+    install_replay(fixtures, latency)
+    import main as app_module
+
+    reports = []
+    async with app_module.lifespan(app_module.app):
+        for name in scenarios:
+            spec = {**SCENARIOS[name], **{k: v for k, v in overrides.items() if v is not None}}
+            report = await run_scenario(app_module, fixtures, name, spec)
+            reports.append(report)
+            print_report(report)
+    return reports
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency_ms"] or {}
+    print(
+        f"{report['name']:>20}: {report['completed']}/{report['requests']} ok "
+        f"c={report['concurrency']} rps={report['rps']:.2f} "
+        f"p50={latency.get('p50', 0):,.0f}ms p95={latency.get('p95', 0):,.0f}ms p99={latency.get('p99', 0):,.0f}ms"
+        + (f" ttft_p50={report['ttft_ms']['p50']:,.0f}ms" if report["ttft_ms"] else "")
+        + f" cpu={report['cpu_s']:.1f}s rss={report['rss_mb_end']:.0f}MB"
+    )
+    for sample in report["error_samples"]:
+        print(f"{'':>22}error: {sample}")
+
+
+def compare(reports: List[Dict[str, Any]], baseline_path: str):
+    """Print percentage changes against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["scenarios"]}
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nvs {baseline_path}:")
+    for report in reports:
+        old = baseline.get(report["name"])
+        if not old or not report["latency_ms"] or not old["latency_ms"]:
+            continue
+        line = (
+            f"{report['name']:>20}: p50 {delta(report['latency_ms']['p50'], old['latency_ms']['p50'])} "
+            f"p95 {delta(report['latency_ms']['p95'], old['latency_ms']['p95'])} "
+            f"rps {delta(report['rps'], old['rps'])}"
+        )
+        if report["ttft_ms"] and old.get("ttft_ms"):
+            line += f" ttft_p50 {delta(report['ttft_ms']['p50'], old['ttft_ms']['p50'])}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default: %(default)s")
+    parser.add_argument("--requests", type=int, help="override requests per scenario")
+    parser.add_argument("--concurrency", type=int, help="override concurrency per scenario")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply all injected latencies; 0 measures service overhead only")
+    parser.add_argument("--search-ms", type=float, default=800)
+    parser.add_argument("--page-ms", type=float, default=300)
+    parser.add_argument("--llm-first-token-ms", type=float, default=600)
+    parser.add_argument("--llm-token-ms", type=float, default=5)
+    parser.add_argument("--output", help="results JSON path; default benchmarks/results/research-<commit>.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    latency = Latency(
+        args.search_ms / 1000,
+        args.page_ms / 1000,
+        args.llm_first_token_ms / 1000,
+        args.llm_token_ms / 1000
+    ).scaled(args.latency_scale)
+    scenarios = args.scenario or DEFAULT_SCENARIOS
+    overrides = {"requests": args.requests, "concurrency": args.concurrency}
+
+    reports = asyncio.run(run(scenarios, overrides, latency))
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"research-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "latency": latency.as_dict(),
+            "scenarios": reports
+        }, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        compare(reports, args.compare)
+
+
+if __name__ == "__main__":
+    main()
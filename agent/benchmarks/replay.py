@@ -0,0 +1,214 @@
+"""
+Local stand-ins that replay recorded provider responses.
+
+Search requests are answered from a recorded result pool, page fetches from
+the stored HTML corpus and LLM calls from recorded completions, each after
+an injected latency. They plug in at the same seams as the real providers:
+the shared HTTP client's transport and the LLM client factory, so the
+search, crawl, extraction and graph code under test is unchanged.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+import httpx
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+SEARCH_HOSTS = {"api.tavily.com"}
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class Latency:
+    """Injected latencies in seconds, each varied by +/- jitter."""
+
+    def __init__(
+        self,
+        search: float = 0.8,
+        page: float = 0.3,
+        llm_first_token: float = 0.6,
+        llm_token: float = 0.005,
+        jitter: float = 0.25,
+        seed: int = 0
+    ):
+        self.search = search
+        self.page = page
+        self.llm_first_token = llm_first_token
+        self.llm_token = llm_token
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def scaled(self, factor: float) -> "Latency":
+        return Latency(
+            self.search * factor,
+            self.page * factor,
+            self.llm_first_token * factor,
+            self.llm_token * factor,
+            self.jitter
+        )
+
+    def sample(self, seconds: float) -> float:
+        if seconds <= 0:
+            return 0.0
+        return seconds * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "search_ms": self.search * 1000,
+            "page_ms": self.page * 1000,
+            "llm_first_token_ms": self.llm_first_token * 1000,
+            "llm_token_ms": self.llm_token * 1000,
+            "jitter": self.jitter
+        }
+
+
+class ReplayFixtures:
+    """Recorded search results, pages and LLM completions."""
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, corpus_dir: str = CORPUS_DIR):
+        with open(os.path.join(fixtures_dir, "search_results.json")) as f:
+            self.search_results: List[Dict[str, Any]] = json.load(f)["results"]
+        with open(os.path.join(fixtures_dir, "llm_completions.json")) as f:
+            self.completions: Dict[str, str] = json.load(f)
+        with open(os.path.join(fixtures_dir, "queries.json")) as f:
+            self.queries: List[str] = json.load(f)
+
+        self.pages: List[bytes] = []
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.endswith((".html", ".htm")):
+                with open(os.path.join(corpus_dir, name), "rb") as f:
+                    self.pages.append(f.read())
+
+    def search(self, query: str, max_results: int) -> Dict[str, Any]:
+        """A Tavily response: a window of the result pool chosen by the query."""
+        start = _stable_hash(query) % len(self.search_results)
+        window = (self.search_results[start:] + self.search_results[:start])[:max_results]
+        return {"query": query, "results": window}
+
+    def page(self, url: str) -> bytes:
+        """
+        A stored page for a URL. The URL is written into the article so every
+        URL extracts to distinct text, as real pages would; otherwise content
+        fingerprinting would collapse the corpus to a handful of sources.
+        """
+        page = self.pages[_stable_hash(url) % len(self.pages)]
+        marker = f"<article><p>Source: {url}</p>".encode()
+        return page.replace(b"<article>", marker, 1)
+
+    def completion(self, role: str) -> str:
+        return self.completions.get(role) or self.completions["synthesis"]
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers search API calls and page fetches from fixtures."""
+
+    def __init__(self, fixtures: ReplayFixtures, latency: Latency):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if request.url.host in SEARCH_HOSTS:
+            await asyncio.sleep(self.latency.sample(self.latency.search))
+            payload = json.loads(request.content or b"{}")
+            body = self.fixtures.search(payload.get("query", ""), int(payload.get("max_results", 5)))
+            return httpx.Response(200, json=body, request=request)
+
+        await asyncio.sleep(self.latency.sample(self.latency.page))
+        return httpx.Response(
+            200,
+            content=self.fixtures.page(str(request.url)),
+            headers={"content-type": "text/html; charset=utf-8"},
+            request=request
+        )
+
+
+class ReplayChatModel:
+    """
+    Chat model returning a recorded completion for its role.
+    Streams word by word after a first-token delay, like a provider would.
+    """
+
+    def __init__(self, role: str, fixtures: ReplayFixtures, latency: Latency):
+        self.role = role
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def _tokens(self) -> List[str]:
+        text = self.fixtures.completion(self.role)
+        words = text.split(" ")
+        return [w if i == len(words) - 1 else w + " " for i, w in enumerate(words)]
+
+    async def ainvoke(self, messages: List[Any]) -> AIMessage:
+        tokens = self._tokens()
+        await asyncio.sleep(
+            self.latency.sample(self.latency.llm_first_token)
+            + self.latency.sample(self.latency.llm_token) * len(tokens)
+        )
+        return AIMessage(content="".join(tokens))
+
+    async def astream(self, messages: List[Any]):
+        await asyncio.sleep(self.latency.sample(self.latency.llm_first_token))
+        for token in self._tokens():
+            await asyncio.sleep(self.latency.sample(self.latency.llm_token))
+            yield AIMessageChunk(content=token)
+
+
+# Models that select each role's recorded completion
+REPLAY_MODELS = {f"replay-{role}": role for role in ("planning", "analysis", "synthesis", "memory")}
+
+
+def replay_environment() -> Dict[str, str]:
+    """
+    Settings that route every provider to the stand-ins and keep state in
+    process. Must be in the environment before the agent config is imported.
+    """
+    env = {
+        "CHECKPOINTER": "memory",
+        "VECTOR_STORE": "memory",
+        "EMBEDDING_PROVIDER": "hashing",
+        "EMBEDDING_DISK_CACHE": "false",
+        "LLM_PROVIDER": "openai",
+        "OPENAI_API_KEY": "replay",
+        "SEARCH_PROVIDER": "tavily",
+        "TAVILY_API_KEY": "replay",
+        # Each request should do its own provider work
+        "SEARCH_CACHE_BACKEND": "none",
+        "CRAWL_CACHE_BACKEND": "none",
+    }
+    for model, role in REPLAY_MODELS.items():
+        env[f"{role.upper()}_LLM_MODEL"] = model
+    return env
+
+
+def install_replay(fixtures: ReplayFixtures, latency: Latency) -> ReplayTransport:
+    """Swap the HTTP client and LLM factories for the stand-ins."""
+    import agent.llm
+    import agent.tools.http_client as http_client
+
+    transport = ReplayTransport(fixtures, latency)
+
+    def create_http_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=transport, headers={"User-Agent": http_client.USER_AGENT})
+
+    def create_llm(provider: str, model: str, temperature: float):
+        role = REPLAY_MODELS.get(model)
+        if role is None:
+            raise ValueError(f"No recorded completions for model {model!r}; run with the replay environment")
+        return ReplayChatModel(role, fixtures, latency)
+
+    http_client.create_http_client = create_http_client
+    agent.llm.create_llm = create_llm
+    agent.llm.clear_llm_registry()
+    return transport
+
@@ -2,19 +2,64 @@
 FastAPI entry point for the Python agent service.
 Handles research requests, streaming, and memory management.
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
 import json
-import asyncio
+import time
+import uuid
+
+from langgraph.checkpoint.memory import MemorySaver
 
 from agent.research_graph import create_research_graph, ResearchState
 from agent.config import settings
 from agent.memory import MemoryManager
+from agent.memory_writer import MemoryWriteQueue
+from agent.checkpointer import open_checkpointer, close_checkpointer
+from agent.llm import warmup_llms
+from agent.streaming import stream_graph
+from agent.tools.http_client import init_http_client, close_http_client, get_pool_stats
+from agent.tools.extraction import close_extraction_pool
+from agent.tools.crawl_cache import get_crawl_cache
+from agent.tools.search_cache import get_search_cache
+from agent.cache import close_redis_client
+from agent.answer_cache import get_answer_cache
+from agent.telemetry import start_trace, observe_request, render_metrics
+from agent.admission import AdmissionRejected, get_admission_controller
+from agent.rate_limit import rate_limit_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    global research_graph, refresh_graph
+    
+    # Fails startup when the checkpoint database is unreachable
+    checkpointer = await open_checkpointer()
+    research_graph = create_research_graph(checkpointer)
+    refresh_graph = create_research_graph(MemorySaver())
+    await init_http_client()
+    warmup_llms()
+    await memory_writer.start()
+    yield
+    admission = get_admission_controller()
+    if admission:
+        await admission.close()
+    answer_cache = get_answer_cache()
+    if answer_cache:
+        await answer_cache.close()
+    # Flush queued memory writes before tearing down their dependencies
+    await memory_writer.stop()
+    await close_http_client()
+    close_extraction_pool()
+    await close_redis_client()
+    await close_checkpointer()
+
 
-app = FastAPI(title="Deep Finance Research Agent")
+app = FastAPI(title="Deep Finance Research Agent", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -27,14 +72,24 @@ app.add_middleware(
 
 # Initialize memory manager
 memory_manager = MemoryManager()
+memory_writer = MemoryWriteQueue(memory_manager)
+
+# Compiled research graph, built once in the lifespan
+research_graph = None
+# Graph for answer cache refreshes; their checkpoints are never read back, so
+# they stay in memory and are dropped when the refresh ends
+refresh_graph = None
 
 
 class ResearchRequest(BaseModel):
     query: str
     thread_id: str
     user_id: str
+    tenant_id: Optional[str] = None
     show_thinking: bool = True
     max_iterations: int = 5
+    use_cache: bool = True
+    include_timings: bool = False
 
 
 class ResearchResponse(BaseModel):
@@ -42,6 +97,124 @@ class ResearchResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
     thinking_trace: Optional[List[Dict[str, Any]]] = None
+    cached: bool = False
+    timings: Optional[Dict[str, Any]] = None
+
+
+def build_initial_state(
+    query: str,
+    thread_id: str,
+    user_id: str,
+    max_iterations: int,
+    memory_context: List[Dict[str, Any]]
+) -> ResearchState:
+    """Initial graph state for a research run."""
+    return {
+        "query": query,
+        "thread_id": thread_id,
+        "user_id": user_id,
+        "messages": [],
+        "sources": [],
+        "thinking_trace": [],
+        "final_answer": "",
+        "iteration": 0,
+        "max_iterations": max_iterations,
+        "memory_context": memory_context,
+        "executed_queries": [],
+        "stalled": False,
+        "branch_findings": []
+    }
+
+
+def graph_config(thread_id: str, user_id: str) -> Dict[str, Any]:
+    """Checkpointer config for a research run."""
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": user_id
+        }
+    }
+
+
+def cache_tenant(request: ResearchRequest) -> str:
+    """Answer cache partition: the tenant, or the user when no tenant is given."""
+    return request.tenant_id or request.user_id
+
+
+async def lookup_cached_answer(request: ResearchRequest):
+    """
+    Return (entry, similarity) for a near-duplicate recent query, scheduling
+    a background refresh of entries that are getting old. Cache errors are
+    logged and treated as a miss.
+    """
+    answer_cache = get_answer_cache() if request.use_cache else None
+    if answer_cache is None:
+        return None
+
+    try:
+        cached = await answer_cache.lookup(cache_tenant(request), request.query)
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None
+
+    if cached and answer_cache.needs_refresh(cached[0]):
+        entry = cached[0]
+        thread_id = f"answer-cache-refresh-{uuid.uuid4()}"
+        
+        async def run():
+            # Refreshes take a research slot like any other run of this key
+            ticket = await enter_admission(request)
+            try:
+                if ticket:
+                    async for _ in ticket.wait():
+                        pass
+                # Refreshes run without any one user's memory context
+                state = build_initial_state(entry.query, thread_id, request.user_id, request.max_iterations, [])
+                return await refresh_graph.ainvoke(state, graph_config(thread_id, request.user_id))
+            finally:
+                await refresh_graph.checkpointer.adelete_thread(thread_id)
+                if ticket:
+                    await ticket.release()
+        
+        answer_cache.schedule_refresh(cache_tenant(request), entry, run)
+    return cached
+
+
+def admission_key(request: ResearchRequest) -> str:
+    """Admission fairness key: the tenant, or the user when no tenant is given."""
+    return f"tenant:{request.tenant_id}" if request.tenant_id else f"user:{request.user_id}"
+
+
+async def enter_admission(request: ResearchRequest):
+    """Queue a research run for a slot; None when admission control is off."""
+    controller = get_admission_controller()
+    return await controller.enter(admission_key(request)) if controller else None
+
+
+def admission_rejected(error: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to retry."""
+    return HTTPException(
+        status_code=429,
+        detail=error.reason,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+async def store_answer(request: ResearchRequest, final_state: Dict[str, Any]):
+    """Cache a finished answer for later near-duplicate queries."""
+    answer_cache = get_answer_cache() if request.use_cache else None
+    if answer_cache is None:
+        return
+    try:
+        await answer_cache.store(
+            cache_tenant(request),
+            request.query,
+            final_state.get("final_answer", ""),
+            final_state.get("sources", []),
+            final_state.get("thinking_trace", [])
+        )
+    except Exception as e:
+        print(f"Answer cache store failed: {e}")
 
 
 @app.get("/health")
@@ -51,7 +224,34 @@ async def health_check():
         "status": "healthy",
         "llm_provider": settings.LLM_PROVIDER,
         "search_provider": settings.SEARCH_PROVIDER,
-        "vector_store": settings.VECTOR_STORE
+        "vector_store": settings.VECTOR_STORE,
+        "checkpointer": settings.CHECKPOINTER
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: span latency, queue wait, bytes, tokens and cost."""
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
+@app.get("/stats/http")
+async def http_pool_stats():
+    """Connection pool usage of the shared HTTP client."""
+    return get_pool_stats()
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """Hit-rate metrics of the tool caches."""
+    crawl_cache = get_crawl_cache()
+    search_cache = get_search_cache()
+    answer_cache = get_answer_cache()
+    return {
+        "crawl": crawl_cache.stats.snapshot() if crawl_cache else None,
+        "search": search_cache.stats.snapshot() if search_cache else None,
+        "answer": answer_cache.stats.snapshot() if answer_cache else None
     }
 
 
@@ -59,12 +259,57 @@ async def health_check():
 async def research_stream(request: ResearchRequest):
     """
     Stream research results with thinking trace and final answer.
-    Returns SSE stream with events: thinking, sources, answer, done.
+    Returns SSE stream with events: queued, thinking, thinking_delta, sources, answer, done.
+    Queued events carry the request's place in line while it waits for a slot.
+    Answer events carry report tokens as the model generates them.
+    Thinking deltas carry analysis tokens and, in parallel mode, the branch
+    that generated them.
+    With include_timings the done event carries a per-span timing breakdown.
+    Responds 429 with Retry-After when the research queue is full.
     """
+    trace = start_trace()
+    cached = None
+    ticket = None
+    setup_error = None
+    try:
+        # Serve a recent answer to a near-duplicate query without running the graph
+        cached = await lookup_cached_answer(request)
+        if not cached:
+            # Admitted before the response starts so a shed request gets a real 429
+            ticket = await enter_admission(request)
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
+    except Exception as e:
+        setup_error = e
+    
     async def event_generator():
         try:
-            # Create research graph
-            graph = create_research_graph()
+            if setup_error:
+                raise setup_error
+            
+            if cached:
+                entry, similarity = cached
+                if entry.sources:
+                    yield f"data: {json.dumps({'type': 'sources', 'content': entry.sources})}\n\n"
+                yield f"data: {json.dumps({'type': 'answer', 'content': entry.answer})}\n\n"
+                await memory_writer.enqueue(
+                    user_id=request.user_id,
+                    thread_id=request.thread_id,
+                    query=request.query,
+                    answer=entry.answer,
+                    sources=entry.sources
+                )
+                done = {'sources': entry.sources, 'thinking_trace': entry.thinking_trace, 'cached': True, 'similarity': similarity}
+                if request.include_timings:
+                    done['timings'] = trace.breakdown()
+                observe_request("research_stream", time.perf_counter() - trace.started, cached=True)
+                yield f"data: {json.dumps({'type': 'done', 'content': done})}\n\n"
+                return
+            
+            # Wait for a research slot, reporting the place in line
+            if ticket:
+                async for position in ticket.wait():
+                    yield f"data: {json.dumps({'type': 'queued', 'content': {'position': position + 1}})}\n\n"
             
             # Retrieve long-term memory context
             memory_context = await memory_manager.retrieve_relevant_memories(
@@ -74,51 +319,59 @@ async def research_stream(request: ResearchRequest):
             )
             
             # Initial state
-            initial_state: ResearchState = {
-                "query": request.query,
-                "thread_id": request.thread_id,
-                "user_id": request.user_id,
-                "messages": [],
-                "sources": [],
-                "thinking_trace": [],
-                "final_answer": "",
-                "iteration": 0,
-                "max_iterations": request.max_iterations,
-                "memory_context": memory_context
-            }
+            initial_state = build_initial_state(
+                request.query,
+                request.thread_id,
+                request.user_id,
+                request.max_iterations,
+                memory_context
+            )
             
             # Stream graph execution
-            config = {
-                "configurable": {
-                    "thread_id": request.thread_id,
-                    "checkpoint_ns": request.user_id
-                }
-            }
+            config = graph_config(request.thread_id, request.user_id)
             
-            async for event in graph.astream(initial_state, config):
+            answer_streamed = False
+            async for item in stream_graph(research_graph, initial_state, config):
+                if item[0] == "token":
+                    _, node_name, text, branch = item
+                    if node_name == "synthesize":
+                        answer_streamed = True
+                        yield f"data: {json.dumps({'type': 'answer', 'content': text})}\n\n"
+                    elif node_name == "analyze" and request.show_thinking:
+                        # Parallel branches analyze at once; clients group deltas by branch
+                        yield f"data: {json.dumps({'type': 'thinking_delta', 'content': {'step': 'analysis', 'branch': branch, 'delta': text}})}\n\n"
+                    continue
+                
                 # Extract node name and state
-                for node_name, node_state in event.items():
+                for node_name, node_state in item[1].items():
                     if node_name == "thinking":
                         if request.show_thinking:
                             yield f"data: {json.dumps({'type': 'thinking', 'content': node_state.get('thinking_trace', [])[-1] if node_state.get('thinking_trace') else {}})}\n\n"
                     
-                    elif node_name == "search":
+                    elif node_name in ("search", "research_branch"):
                         sources = node_state.get("sources", [])
                         if sources:
                             yield f"data: {json.dumps({'type': 'sources', 'content': sources})}\n\n"
                     
                     elif node_name == "synthesize":
                         answer = node_state.get("final_answer", "")
-                        if answer:
-                            # Stream answer token by token
-                            for i in range(0, len(answer), 10):
-                                chunk = answer[i:i+10]
-                                yield f"data: {json.dumps({'type': 'answer', 'content': chunk})}\n\n"
-                                await asyncio.sleep(0.01)
+                        if answer and not answer_streamed:
+                            # Provider did not stream; send the report in one event
+                            yield f"data: {json.dumps({'type': 'answer', 'content': answer})}\n\n"
             
-            # Save to long-term memory
-            final_state = node_state
-            await memory_manager.save_interaction(
+            # The slot is free once the graph is done
+            if ticket:
+                await ticket.release()
+            
+            # Node updates are partial; read the accumulated state from the checkpointer.
+            # The root graph checkpoints under the empty namespace, and aget_state
+            # would treat the per-user checkpoint_ns as a subgraph path
+            snapshot = await research_graph.aget_state({"configurable": {"thread_id": request.thread_id}})
+            final_state = snapshot.values
+            
+            # Queue save to long-term memory; written in the background
+            await store_answer(request, final_state)
+            await memory_writer.enqueue(
                 user_id=request.user_id,
                 thread_id=request.thread_id,
                 query=request.query,
@@ -127,10 +380,21 @@ async def research_stream(request: ResearchRequest):
             )
             
             # Send done event
-            yield f"data: {json.dumps({'type': 'done', 'content': {'sources': final_state.get('sources', []), 'thinking_trace': final_state.get('thinking_trace', [])}})}\n\n"
+            done = {'sources': final_state.get('sources', []), 'thinking_trace': final_state.get('thinking_trace', [])}
+            timings = trace.breakdown()
+            if request.include_timings:
+                done['timings'] = timings
+            observe_request("research_stream", time.perf_counter() - trace.started, cached=False, cost=timings["cost_usd"])
+            yield f"data: {json.dumps({'type': 'done', 'content': done})}\n\n"
             
+        except AdmissionRejected as e:
+            yield f"data: {json.dumps({'type': 'error', 'content': str(e), 'retry_after': e.retry_after})}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream
+            if ticket:
+                await ticket.release()
     
     return StreamingResponse(
         event_generator(),
@@ -147,9 +411,38 @@ async def research(request: ResearchRequest):
     """
     Non-streaming research endpoint.
     Returns complete research result with sources and thinking trace.
+    Responds 429 with Retry-After when the research queue is full or the
+    request waits longer than the queue timeout.
     """
+    trace = start_trace()
+    ticket = None
     try:
-        graph = create_research_graph()
+        # Serve a recent answer to a near-duplicate query without running the graph
+        cached = await lookup_cached_answer(request)
+        if cached:
+            entry, _ = cached
+            await memory_writer.enqueue(
+                user_id=request.user_id,
+                thread_id=request.thread_id,
+                query=request.query,
+                answer=entry.answer,
+                sources=entry.sources
+            )
+            observe_request("research", time.perf_counter() - trace.started, cached=True)
+            return ResearchResponse(
+                thread_id=request.thread_id,
+                answer=entry.answer,
+                sources=entry.sources,
+                thinking_trace=entry.thinking_trace if request.show_thinking else None,
+                cached=True,
+                timings=trace.breakdown() if request.include_timings else None
+            )
+        
+        # Wait for a research slot
+        ticket = await enter_admission(request)
+        if ticket:
+            async for _ in ticket.wait():
+                pass
         
         # Retrieve long-term memory
         memory_context = await memory_manager.retrieve_relevant_memories(
@@ -158,31 +451,23 @@ async def research(request: ResearchRequest):
             limit=5
         )
         
-        initial_state: ResearchState = {
-            "query": request.query,
-            "thread_id": request.thread_id,
-            "user_id": request.user_id,
-            "messages": [],
-            "sources": [],
-            "thinking_trace": [],
-            "final_answer": "",
-            "iteration": 0,
-            "max_iterations": request.max_iterations,
-            "memory_context": memory_context
-        }
-        
-        config = {
-            "configurable": {
-                "thread_id": request.thread_id,
-                "checkpoint_ns": request.user_id
-            }
-        }
+        initial_state = build_initial_state(
+            request.query,
+            request.thread_id,
+            request.user_id,
+            request.max_iterations,
+            memory_context
+        )
+        config = graph_config(request.thread_id, request.user_id)
         
         # Execute graph
-        final_state = await graph.ainvoke(initial_state, config)
+        final_state = await research_graph.ainvoke(initial_state, config)
+        if ticket:
+            await ticket.release()
+        await store_answer(request, final_state)
         
-        # Save to long-term memory
-        await memory_manager.save_interaction(
+        # Queue save to long-term memory; written in the background
+        await memory_writer.enqueue(
             user_id=request.user_id,
             thread_id=request.thread_id,
             query=request.query,
@@ -190,15 +475,47 @@ async def research(request: ResearchRequest):
             sources=final_state["sources"]
         )
         
+        timings = trace.breakdown()
+        observe_request("research", time.perf_counter() - trace.started, cached=False, cost=timings["cost_usd"])
+        
         return ResearchResponse(
             thread_id=request.thread_id,
             answer=final_state["final_answer"],
             sources=final_state["sources"],
-            thinking_trace=final_state["thinking_trace"] if request.show_thinking else None
+            thinking_trace=final_state["thinking_trace"] if request.show_thinking else None,
+            timings=timings if request.include_timings else None
         )
         
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if ticket:
+            await ticket.release()
+
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Research runs in flight and queued, and admission outcomes."""
+    controller = get_admission_controller()
+    return await controller.snapshot() if controller else None
+
+
+@app.get("/stats/rate-limits")
+async def rate_limits_stats():
+    """Per-provider budgets, adaptive concurrency and retry outcomes."""
+    return rate_limit_stats()
+
+
+@app.get("/stats/memory-writer")
+async def memory_writer_stats():
+    """Background memory writer queue depth and outcomes."""
+    return {
+        "pending": memory_writer.pending,
+        "written": memory_writer.written,
+        "failed": len(memory_writer.failed)
+    }
 
 
 @app.get("/memory/{user_id}")
@@ -0,0 +1,82 @@
+"""Unit tests for research admission control."""
+import asyncio
+
+import pytest
+
+from agent.admission import AdmissionController, AdmissionRejected, LocalAdmissionBackend
+
+
+def make_controller(**kwargs):
+    options = dict(max_in_flight=2, max_in_flight_per_key=1, max_queue=10, max_queue_per_key=3, queue_timeout=5)
+    options.update(kwargs)
+    return AdmissionController(LocalAdmissionBackend(), **options)
+
+
+@pytest.mark.asyncio
+async def test_admission_caps_in_flight_and_is_fair_across_users():
+    """Test a burst from one user does not queue ahead of another user's request."""
+    controller = make_controller()
+
+    a1 = await controller.enter("user:a")
+    a2 = await controller.enter("user:a")
+    a3 = await controller.enter("user:a")
+    assert a1.admitted and not a2.admitted and not a3.admitted
+
+    # One global slot is free and user a is at its cap, so b goes ahead
+    b1 = await controller.enter("user:b")
+    assert b1.admitted
+
+    c1 = await controller.enter("user:c")
+    assert not c1.admitted
+
+    # c's first request ranks with a's first queued one, ahead of a's second
+    positions = []
+
+    async def wait(ticket, name):
+        async for position in ticket.wait():
+            positions.append((name, position))
+        return name
+
+    waits = [asyncio.create_task(wait(t, n)) for t, n in ((a2, "a2"), (a3, "a3"), (c1, "c1"))]
+    await asyncio.sleep(0.01)
+    assert ("a3", 2) in positions
+
+    await a1.release()
+    done, _ = await asyncio.wait(waits, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+    assert [t.result() for t in done] == ["a2"]
+
+    await b1.release()
+    assert await asyncio.wait_for(waits[2], 1) == "c1"
+    assert not a3.admitted
+
+    snapshot = await controller.snapshot()
+    assert snapshot["in_flight"] == 2 and snapshot["waiting"] == 1
+    for task in waits:
+        task.cancel()
+    await controller.close()
+
+
+@pytest.mark.asyncio
+async def test_admission_sheds_full_queues_and_times_out():
+    """Test full queues are rejected with a retry hint and stale waits time out."""
+    controller = make_controller(max_in_flight=1, max_queue=3, max_queue_per_key=2, queue_timeout=0.1)
+
+    held = await controller.enter("user:a")
+    await controller.enter("user:a")
+    await controller.enter("user:a")
+    with pytest.raises(AdmissionRejected) as per_key:
+        await controller.enter("user:a")
+    assert per_key.value.retry_after >= 1
+
+    waiting = await controller.enter("user:b")
+    with pytest.raises(AdmissionRejected, match="full"):
+        await controller.enter("user:c")
+
+    with pytest.raises(AdmissionRejected, match="timed out"):
+        async for _ in waiting.wait():
+            pass
+
+    stats = controller.stats.snapshot()
+    assert stats["rejected"] == 2 and stats["timeouts"] == 1
+    assert (await controller.snapshot())["waiting"] == 2
+    await held.release()
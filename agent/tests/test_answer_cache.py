@@ -0,0 +1,85 @@
+"""Unit tests for the semantic answer cache."""
+import asyncio
+
+import pytest
+
+from agent.answer_cache import SemanticAnswerCache
+from agent.embeddings import EmbeddingService, HashingEmbeddings
+
+
+def make_cache(**kwargs):
+    embeddings = EmbeddingService(model=HashingEmbeddings(512), batch_window_ms=0)
+    options = dict(threshold=0.8, ttl=60, refresh_after=0, max_entries=10, tenant_thresholds={})
+    options.update(kwargs)
+    return SemanticAnswerCache(embeddings=embeddings, **options)
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_serves_near_duplicates_per_tenant():
+    """Test near-duplicate queries hit, other tenants and unrelated queries miss."""
+    cache = make_cache()
+    await cache.store("acme", "Is HDFC Bank undervalued vs peers?", "Report", [{"url": "https://a.com"}], [])
+    
+    hit = await cache.lookup("acme", "Is HDFC bank undervalued vs. peers")
+    assert hit is not None and hit[0].answer == "Report" and hit[1] >= 0.8
+    
+    assert await cache.lookup("other-tenant", "Is HDFC Bank undervalued vs peers?") is None
+    assert await cache.lookup("acme", "What is Tesla's free cash flow?") is None
+    
+    strict = make_cache(tenant_thresholds={"acme": 0.999})
+    await strict.store("acme", "Is HDFC Bank undervalued vs peers?", "Report", [], [])
+    assert await strict.lookup("acme", "Is HDFC Bank undervalued compared with peers?") is None
+    
+    stats = cache.stats.snapshot()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_expiry_and_background_refresh():
+    """Test expired entries miss and old hits are recomputed once in the background."""
+    cache = make_cache(ttl=60, refresh_after=30)
+    await cache.store("acme", "HDFC Bank NIM trend", "Old report", [], [])
+    
+    entry, _ = await cache.lookup("acme", "HDFC Bank NIM trend")
+    assert not cache.needs_refresh(entry)
+    
+    entry.created_at -= 45
+    assert cache.needs_refresh(entry)
+    
+    runs = []
+    
+    async def run():
+        runs.append(1)
+        return {"final_answer": "New report", "sources": [], "thinking_trace": []}
+    
+    cache.schedule_refresh("acme", entry, run)
+    assert not cache.needs_refresh(entry)
+    await asyncio.sleep(0.05)
+    
+    entry, _ = await cache.lookup("acme", "HDFC Bank NIM trend")
+    assert entry.answer == "New report" and runs == [1]
+    
+    entry.created_at -= 61
+    assert await cache.lookup("acme", "HDFC Bank NIM trend") is None
+    assert cache.stats.snapshot()["refreshes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_misses_on_period_and_ticker_swaps():
+    """Test similar queries for another quarter or company are not served the cached report."""
+    cache = make_cache()
+    await cache.store("acme", "HDFC Bank net interest margin and deposit growth in Q3 FY2024", "Q3 report", [], [])
+    await cache.store("acme", "TCS revenue growth outlook and operating margin guidance for FY2025", "TCS report", [], [])
+
+    swaps = [
+        "HDFC Bank net interest margin and deposit growth in Q2 FY2024",
+        "INFY revenue growth outlook and operating margin guidance for FY2025",
+    ]
+    for query in swaps:
+        # Similar enough to hit on embeddings alone
+        assert cache._tenants["acme"].similar(await cache._embed(query), cache.threshold)
+        assert await cache.lookup("acme", query) is None
+
+    hit = await cache.lookup("acme", "HDFC bank's net interest margin and deposit growth, Q3 FY2024?")
+    assert hit is not None and hit[0].answer == "Q3 report"
+    assert cache.stats.snapshot()["mismatches"] == 2
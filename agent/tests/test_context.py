@@ -0,0 +1,77 @@
+"""Unit tests for prompt context assembly."""
+import pytest
+
+from agent.context import TokenCounter, pack_context
+
+
+def test_pack_context_ranks_dedups_and_fits_budget():
+    """Test relevant sources come first, duplicates are dropped and the budget holds."""
+    counter = TokenCounter()
+    nav = "Home Markets News Login Subscribe " * 50
+    results = "HDFC Bank net interest margin was 3.4% in Q2 while gross NPA fell to 1.3%. " * 20
+    items = [
+        {"content": nav},
+        {"content": results},
+        {"content": "Mirror: " + results},
+        {"content": "ICICI Bank net interest margin stood at 4.3% for the quarter. " * 20},
+    ]
+    
+    packed = pack_context(
+        items,
+        "HDFC Bank net interest margin",
+        ["What is HDFC Bank's NPA?"],
+        budget=300,
+        counter=counter,
+        max_item_tokens=200
+    )
+    
+    assert [p["index"] for p in packed] == [1, 3]
+    assert sum(p["tokens"] for p in packed) <= 300
+    assert all(counter.count(p["text"]) == p["tokens"] for p in packed)
+
+
+def test_pack_context_keeps_items_whole_when_asked():
+    """Test items that do not fit are skipped rather than cut when truncate is off."""
+    items = [{"content": "[1] HDFC Bank results - https://example.com/a"}] * 3
+    
+    packed = pack_context(items, "HDFC Bank", budget=25, max_overlap=1.0, min_item_tokens=1, truncate=False)
+    
+    assert 1 <= len(packed) < 3
+    assert all(p["text"] == items[0]["content"] for p in packed)
+
+
+def test_chunk_text_splits_on_sentences_with_overlap():
+    """Test passages respect the word limit and share trailing sentences."""
+    from agent.passages import chunk_text
+    
+    text = " ".join(f"Sentence number {i} has five words." for i in range(30))
+    passages = chunk_text(text, max_words=30, overlap_words=10)
+    
+    assert len(passages) > 1
+    assert all(len(p.split()) <= 30 for p in passages)
+    last_sentence = "Sentence number " + passages[0].rsplit("Sentence number ", 1)[1]
+    assert passages[1].startswith(last_sentence)
+
+
+@pytest.mark.asyncio
+async def test_rank_passages_prefers_relevant_text(monkeypatch):
+    """Test BM25 and hybrid ranking surface the earnings passage, not the nav boilerplate."""
+    from agent import embeddings
+    from agent.embeddings import EmbeddingService, HashingEmbeddings
+    from agent.passages import rank_passages
+    
+    monkeypatch.setattr(embeddings, "_embedding_service", EmbeddingService(model=HashingEmbeddings(256)))
+    sources = [{
+        "title": "HDFC Bank Q2 results",
+        "url": "https://example.com/hdfc",
+        "content": "Home. Markets. News. Login. Subscribe to our newsletter today.\n" * 5
+        + "HDFC Bank reported a net interest margin of 3.4% and gross NPA of 1.3% in Q2.\n"
+        + "The stock closed flat on Friday."
+    }]
+    
+    for ranking in ("bm25", "hybrid"):
+        passages = await rank_passages(
+            sources, "HDFC Bank net interest margin", ["What is the gross NPA?"], top_k=1, ranking=ranking
+        )
+        assert "net interest margin of 3.4%" in passages[0]["content"]
+        assert passages[0]["source_index"] == 0
@@ -24,7 +24,10 @@ async def test_full_research_workflow():
         "final_answer": "",
         "iteration": 0,
         "max_iterations": 3,
-        "memory_context": []
+        "memory_context": [],
+        "executed_queries": [],
+        "stalled": False,
+        "branch_findings": []
     }
     
     # Execute graph
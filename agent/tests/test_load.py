@@ -0,0 +1,106 @@
+"""
+Load test for the async research graph.
+Replaces the LLM and the search/crawl tools with stand-ins that only wait
+on the event loop, so it measures how one worker scales with concurrency.
+"""
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+from agent import research_graph
+from agent.research_graph import create_research_graph, ResearchState
+from agent.tools import pipeline
+
+
+LLM_LATENCY = 0.2
+TOOL_LATENCY = 0.1
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """LLM stand-in with fixed latency."""
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(LLM_LATENCY)
+        prompt = messages[-1].content
+        if "research plan" in prompt:
+            return FakeMessage(json.dumps({
+                "key_questions": ["What is HDFC Bank's P/E?"],
+                "search_queries": ["HDFC Bank P/E", "ICICI Bank P/E", "Kotak Bank P/E"],
+                "metrics": ["P/E"],
+                "reasoning": "Compare valuations"
+            }))
+        return FakeMessage("HDFC Bank trades at a discount to peers [1].")
+
+    async def astream(self, messages):
+        response = await self.ainvoke(messages)
+        yield response
+
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    async def fake_search(query, max_results):
+        await asyncio.sleep(TOOL_LATENCY)
+        return [
+            {"url": f"https://example.com/{query}/{i}", "title": f"{query} {i}", "snippet": query}
+            for i in range(max_results)
+        ]
+
+    async def fake_crawl(url):
+        await asyncio.sleep(TOOL_LATENCY)
+        return {"text": f"Content of {url}", "facts": []}
+
+    monkeypatch.setattr(research_graph, "get_llm", lambda role="default": FakeLLM())
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+
+
+async def run_session(graph, session: int):
+    # A fresh thread per run, so no round resumes an earlier round's checkpoint
+    thread_id = f"load-thread-{session}-{uuid.uuid4().hex[:8]}"
+    initial_state: ResearchState = {
+        "query": "Is HDFC Bank undervalued vs peers?",
+        "thread_id": thread_id,
+        "user_id": f"load-user-{session}",
+        "messages": [],
+        "sources": [],
+        "thinking_trace": [],
+        "final_answer": "",
+        "iteration": 0,
+        "max_iterations": 3,
+        "memory_context": [],
+        "executed_queries": [],
+        "stalled": False,
+        "branch_findings": []
+    }
+    config = {"configurable": {"thread_id": thread_id}}
+    return await graph.ainvoke(initial_state, config)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_scale(fake_providers):
+    """Test concurrent sessions on one event loop overlap instead of queueing."""
+    graph = create_research_graph()
+
+    timings = {}
+    for concurrency in (1, 10, 50):
+        start = time.monotonic()
+        results = await asyncio.gather(*[run_session(graph, i) for i in range(concurrency)])
+        timings[concurrency] = time.monotonic() - start
+        assert all(r["final_answer"] for r in results)
+        # Each run starts from an empty state
+        assert all(sum(t["step"] == "planning" for t in r["thinking_trace"]) == 1 for r in results)
+
+    print("\n=== Load Test ===")
+    for concurrency, elapsed in timings.items():
+        print(f"{concurrency:>3} sessions: {elapsed:.2f}s ({concurrency / elapsed:.1f} sessions/s)")
+
+    # Sessions only wait on I/O, so 50 of them should take about as long as one
+    assert timings[50] < timings[1] * 3
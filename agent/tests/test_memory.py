@@ -0,0 +1,329 @@
+"""Unit tests for long-term memory and embeddings."""
+import asyncio
+
+import pytest
+
+from agent.embeddings import EmbeddingService, HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """Hashing model that records the batches it receives."""
+
+    def __init__(self):
+        super().__init__(dimensions=64)
+        self.batches = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        return self.embed_documents(texts)
+
+
+@pytest.mark.asyncio
+async def test_embedding_service_batches_concurrent_calls():
+    """Test concurrent embed calls are merged into one model request."""
+    model = CountingEmbeddings()
+    service = EmbeddingService(model=model, batch_window_ms=20)
+
+    vectors = await asyncio.gather(*[service.embed(f"text {i}") for i in range(5)])
+
+    assert len(model.batches) == 1
+    assert len(model.batches[0]) == 5
+    assert all(len(v) == 64 for v in vectors)
+
+
+@pytest.mark.asyncio
+async def test_embedding_service_caches_by_text(tmp_path):
+    """Test repeated texts are served from the memory and disk caches."""
+    model = CountingEmbeddings()
+    path = str(tmp_path / "embeddings.sqlite3")
+    service = EmbeddingService(model=model, disk_cache_path=path, batch_window_ms=1)
+
+    first = await service.embed("HDFC Bank net interest margin")
+    second = await service.embed("HDFC Bank net interest margin")
+    assert first == second
+    assert len(model.batches) == 1
+
+    # The disk write finishes after callers get their vector
+    async def written():
+        while await service.disk_cache.get(service._key("HDFC Bank net interest margin")) is None:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(written(), 1)
+
+    # A fresh service reads the vector back from disk
+    restarted = EmbeddingService(model=model, disk_cache_path=path, batch_window_ms=1)
+    third = await restarted.embed("HDFC Bank net interest margin")
+    assert third == pytest.approx(first, abs=1e-6)
+    assert len(model.batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_embedding_service_survives_disk_cache_errors(tmp_path):
+    """Test a failing disk cache write does not leave embed callers waiting."""
+    service = EmbeddingService(model=CountingEmbeddings(), disk_cache_path=str(tmp_path / "e.sqlite3"), batch_window_ms=1)
+
+    async def broken_set(key, value):
+        raise OSError("disk full")
+
+    service.disk_cache.set = broken_set
+    vectors = await asyncio.wait_for(asyncio.gather(service.embed("NIM"), service.embed("GNPA")), 1)
+    assert all(len(v) == 64 for v in vectors)
+    assert await asyncio.wait_for(service.embed("NIM"), 1) == vectors[0]
+
+
+def test_hashing_embeddings_similarity():
+    """Test the offline model ranks related texts above unrelated ones."""
+    import numpy as np
+
+    model = HashingEmbeddings(dimensions=256)
+    query, related, unrelated = model.embed_documents([
+        "HDFC Bank price to earnings ratio",
+        "HDFC Bank earnings and price ratio",
+        "weather forecast for tomorrow"
+    ])
+
+    assert np.dot(query, related) > np.dot(query, unrelated)
+
+
+class FlakyMemoryManager:
+    """Memory manager stand-in that fails its first write."""
+
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.batches = []
+
+    async def save_interactions(self, interactions):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("vector store unavailable")
+        self.batches.append(list(interactions))
+
+
+@pytest.mark.asyncio
+async def test_memory_writer_batches_retries_and_flushes():
+    """Test queued writes are batched, retried and flushed on stop."""
+    from agent.memory_writer import MemoryWriteQueue
+
+    manager = FlakyMemoryManager(failures=1)
+    writer = MemoryWriteQueue(manager, workers=1, batch_size=10, retry_backoff=0.01)
+    await writer.start()
+
+    for i in range(5):
+        await writer.enqueue(
+            user_id="user", thread_id="thread", query=f"q{i}", answer="a", sources=[]
+        )
+    await writer.stop()
+
+    assert writer.written == 5
+    assert not writer.failed
+    assert sum(len(b) for b in manager.batches) == 5
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_search_and_recent(monkeypatch):
+    """Test per-user top-k search, growth and recency ordering."""
+    from agent.memory import InMemoryStore, settings
+
+    store = InMemoryStore()
+    for i in range(100):
+        embedding = [0.0] * 8
+        embedding[i % 8] = 1.0
+        embedding[(i + 1) % 8] = i / 100
+        await store.save("user-a", f"memory {i}", embedding, {"i": i})
+    await store.save("user-b", "other user", [1.0] + [0.0] * 7, {"i": -1})
+
+    results = await store.search("user-a", [1.0] + [0.0] * 7, limit=3)
+    assert len(results) == 3
+    assert all(r["content"] != "other user" for r in results)
+    assert results[0]["score"] >= results[1]["score"] >= results[2]["score"]
+    assert "score" not in results[0]["metadata"]
+
+    # Large users are searched in a worker thread with the same results
+    monkeypatch.setattr(settings, "INMEMORY_THREAD_SEARCH_MIN", 50)
+    assert await store.search("user-a", [1.0] + [0.0] * 7, limit=3) == results
+
+    recent = await store.get_recent("user-a", limit=2)
+    assert [r["metadata"]["i"] for r in recent] == [99, 98]
+    assert await store.search("nobody", [1.0] * 8, limit=3) == []
+
+
+@pytest.mark.asyncio
+async def test_ann_store_search_filter_and_persistence(tmp_path):
+    """Test the ANN store trains in the background, filters by user and reloads from disk."""
+    import asyncio
+    import numpy as np
+    from agent.memory import AnnStore
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((400, 16)).astype(np.float32)
+    records = [
+        {"user_id": f"user-{i % 2}", "content": f"memory {i}", "embedding": v.tolist(), "metadata": {"i": i}}
+        for i, v in enumerate(vectors)
+    ]
+
+    store = AnnStore(path=str(tmp_path), nlist=4, nprobe=4)
+    store.index.brute_force_max = 0
+    store.index.train_size = 200
+    await store.save_many(records[:300])
+
+    # Searches are exact while the index trains
+    results = await store.search("user-0", vectors[10].tolist(), limit=3)
+    assert results[0]["content"] == "memory 10"
+
+    async def trained():
+        while not store.index.trained:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(trained(), 5)
+    await store.save_many(records[300:])
+
+    results = await store.search("user-0", vectors[10].tolist(), limit=3)
+    assert results[0]["content"] == "memory 10"
+    assert all(r["metadata"]["i"] % 2 == 0 for r in results)
+
+    reloaded = AnnStore(path=str(tmp_path), nlist=4, nprobe=4)
+    reloaded.index.brute_force_max = 0
+    results = await reloaded.search("user-1", vectors[11].tolist(), limit=1)
+    assert results[0]["content"] == "memory 11"
+
+    recent = await reloaded.get_recent("user-1", limit=2)
+    assert [r["metadata"]["i"] for r in recent] == [399, 397]
+
+    # A process dying while saving must not let the next one reuse row ids
+    def crash():
+        reloaded.conn.rollback()
+        raise OSError("process died")
+
+    reloaded.index.flush = crash
+    with pytest.raises(OSError):
+        await reloaded.save("user-1", "lost", vectors[0].tolist(), {"i": -1})
+
+    restarted = AnnStore(path=str(tmp_path), nlist=4, nprobe=4)
+    await restarted.save("user-1", "kept", vectors[1].tolist(), {"i": 400})
+    assert (await restarted.get_recent("user-1", limit=1))[0]["content"] == "kept"
+
+
+def test_ivf_index_indexes_rows_added_while_training(tmp_path):
+    """Test rows added between fitting and installing centroids are searchable."""
+    import numpy as np
+    from agent.ann_index import IVFIndex
+
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    index = IVFIndex(str(tmp_path), nlist=4, nprobe=1, train_size=200, brute_force_max=0)
+    index.add(vectors[:200], np.zeros(200, dtype=np.int32))
+    assert index.needs_training and not index.trained
+
+    fitted = index.fit()
+    index.add(vectors[200:], np.zeros(100, dtype=np.int32))
+    index.install(*fitted)
+
+    assert index.trained and not index.needs_training
+    rows, _ = index.search(vectors[250], 0, 1)
+    assert rows.tolist() == [250]
+
+
+class FakeCollection:
+    """Stand-in for a pymongo collection holding documents in memory."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return [
+            {k: v for k, v in d.items() if projection.get(k)}
+            for d in self.docs if d["user_id"] == query["user_id"]
+        ]
+
+
+def test_mongodb_client_side_search_ranks_each_query():
+    """Test the fallback search scores only the user's memories, best first, per query."""
+    from agent.memory import MongoDBStore
+
+    store = object.__new__(MongoDBStore)
+    store.collection = FakeCollection([
+        {"user_id": "a", "content": "NIM", "metadata": {}, "embedding": [1.0, 0.0, 0.0]},
+        {"user_id": "a", "content": "GNPA", "metadata": {}, "embedding": [0.0, 1.0, 0.0]},
+        {"user_id": "a", "content": "mixed", "metadata": {}, "embedding": [1.0, 1.0, 0.0]},
+        {"user_id": "b", "content": "other user", "metadata": {}, "embedding": [1.0, 0.0, 0.0]},
+    ])
+
+    first, second = store._client_side_search("a", [[2.0, 0.0, 0.0], [0.0, 1.0, 0.1]], limit=2)
+    assert [r["content"] for r in first] == ["NIM", "mixed"]
+    assert first[0]["score"] == pytest.approx(1.0)
+    assert [r["content"] for r in second] == ["GNPA", "mixed"]
+    assert store._client_side_search("nobody", [[1.0, 0.0, 0.0]], limit=2) == [[]]
+
+
+class FakePineconeIndex:
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors):
+        self.vectors.update({v["id"]: v for v in vectors})
+
+    def fetch(self, ids):
+        return {"vectors": {i: self.vectors[i] for i in ids if i in self.vectors}}
+
+    def list(self, prefix):
+        yield [i for i in self.vectors if i.startswith(prefix)]
+
+
+class FakeRedis:
+    """Sorted sets only, enough for the Pinecone recency index."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def zadd(self, key, members):
+        self.sets.setdefault(key, {}).update(members)
+
+    async def execute(self):
+        return []
+
+    async def zrevrange(self, key, start, end):
+        members = sorted(self.sets.get(key, {}).items(), key=lambda m: m[1], reverse=True)
+        return [m.encode() for m, _ in members[start:end + 1]]
+
+
+@pytest.mark.asyncio
+async def test_pinecone_ids_sort_by_time_and_serve_recent(monkeypatch):
+    """Test vector ids are time-sortable per user and recent memories come newest first."""
+    from agent import memory
+    from agent.memory import PineconeStore
+
+    redis = FakeRedis()
+    monkeypatch.setattr(memory, "get_redis_client", lambda: redis)
+    store = object.__new__(PineconeStore)
+    store.index = FakePineconeIndex()
+
+    await store.save_many([
+        {"user_id": "a", "content": f"memory {day}", "embedding": [0.1],
+         "metadata": {"timestamp": f"2024-05-0{day}T10:00:00"}}
+        for day in (3, 1, 2)
+    ] + [{"user_id": "b", "content": "other", "embedding": [0.1], "metadata": {"timestamp": "2024-05-04T10:00:00"}}])
+
+    ids = sorted(i for i in store.index.vectors if i.startswith("a#"))
+    assert [store.index.vectors[i]["metadata"]["content"] for i in ids] == ["memory 1", "memory 2", "memory 3"]
+
+    recent = await store.get_recent("a", limit=2)
+    assert [r["content"] for r in recent] == ["memory 3", "memory 2"]
+
+    # Without Redis the ids are listed by user prefix instead
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(memory, "get_redis_client", unavailable)
+    recent = await store.get_recent("a", limit=2)
+    assert [r["content"] for r in recent] == ["memory 3", "memory 2"]
@@ -0,0 +1,104 @@
+"""Unit tests for provider rate limiting and retries."""
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from agent.rate_limit import ProviderLimiter, TokenBucket, retry_after_seconds
+from agent.streaming import generate, reset_token_queue, set_token_queue
+
+
+def throttled(retry_after=None):
+    request = httpx.Request("POST", "https://api.tavily.com/search")
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(429, headers=headers, request=request)
+    return httpx.HTTPStatusError("429 Too Many Requests", request=request, response=response)
+
+
+async def fail(exc):
+    raise exc
+
+
+@pytest.mark.asyncio
+async def test_limiter_retries_throttled_calls_and_backs_off():
+    """Test a 429 is retried after Retry-After, pauses the provider and halves concurrency."""
+    limiter = ProviderLimiter("tavily", rpm=600, concurrency=8, backoff_base=0.01, max_retry_after=1)
+    calls = []
+
+    async def search():
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise throttled("0.2")
+        return ["result"]
+
+    assert await limiter.call(search) == ["result"]
+    assert calls[1] - calls[0] >= 0.2
+    assert limiter.concurrency.capacity == 4
+    assert limiter.stats.snapshot()["retries"] == 1
+
+    # Client errors fail at once; waits longer than allowed are not honoured
+    async def bad_request():
+        request = httpx.Request("GET", "https://api.search.brave.com")
+        raise httpx.HTTPStatusError("400", request=request, response=httpx.Response(400, request=request))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await limiter.call(bad_request)
+    with pytest.raises(httpx.HTTPStatusError):
+        await limiter.call(lambda: fail(throttled("120")))
+    assert limiter.stats.failures == 2
+
+    # A retried call reserves its tokens once
+    tokens = ProviderLimiter("openai:gpt-4o", rpm=600, tpm=60000, backoff_base=0.01)
+    attempts = []
+
+    async def complete():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise throttled()
+        return "ok"
+
+    assert await tokens.call(complete, tokens=5000) == "ok"
+    assert tokens.backend.buckets["openai:gpt-4o:tokens"].tokens == pytest.approx(55000, abs=100)
+
+    bucket = TokenBucket(60)
+    assert bucket.take(60, bucket.updated) == 0
+    assert bucket.take(2, bucket.updated) == pytest.approx(2.0)
+    assert retry_after_seconds(throttled("Wed, 21 Oct 2015 07:28:00 GMT")) == 0
+
+
+class FlakyStreamingLLM:
+    def __init__(self, fail_after_tokens: bool):
+        self.fail_after_tokens = fail_after_tokens
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        if self.fail_after_tokens:
+            yield AIMessageChunk(content="HDFC ")
+        if self.calls == 1:
+            raise throttled()
+        yield AIMessageChunk(content="trades at 2.5x book.")
+
+
+@pytest.mark.asyncio
+async def test_generate_retries_only_before_tokens_stream(monkeypatch):
+    """Test a throttled stream is retried unless tokens already reached the client."""
+    monkeypatch.setattr("agent.llm.resolve_llm_config", lambda role: ("openai", "gpt-4o", 0))
+    monkeypatch.setattr("agent.rate_limit._limiters", {})
+    monkeypatch.setattr("agent.config.settings.RATE_LIMIT_BACKOFF_BASE_SECONDS", 0.01)
+    messages = [HumanMessage(content="Is HDFC undervalued?")]
+
+    queue = asyncio.Queue()
+    token = set_token_queue(queue)
+    try:
+        llm = FlakyStreamingLLM(fail_after_tokens=False)
+        assert await generate(llm, messages, node="synthesize") == "trades at 2.5x book."
+        assert llm.calls == 2
+
+        llm = FlakyStreamingLLM(fail_after_tokens=True)
+        with pytest.raises(httpx.HTTPStatusError):
+            await generate(llm, messages, node="synthesize")
+        assert llm.calls == 1
+    finally:
+        reset_token_queue(token)
@@ -22,20 +22,25 @@ def initial_state():
         final_answer="",
         iteration=0,
         max_iterations=3,
-        memory_context=[]
+        memory_context=[],
+        executed_queries=[],
+        stalled=False,
+        branch_findings=[]
     )
 
 
-def test_planning_node(initial_state):
+@pytest.mark.asyncio
+async def test_planning_node(initial_state):
     """Test planning node creates research plan."""
-    result = planning_node(initial_state)
+    result = await planning_node(initial_state)
     
     assert len(result["thinking_trace"]) == 1
     assert result["thinking_trace"][0]["step"] == "planning"
     assert "key_questions" in result["thinking_trace"][0]["content"]
 
 
-def test_search_node(initial_state):
+@pytest.mark.asyncio
+async def test_search_node(initial_state):
     """Test search node gathers sources."""
     # Add planning result first
     initial_state["thinking_trace"] = [{
@@ -46,14 +51,15 @@ def test_search_node(initial_state):
         }
     }]
     
-    result = search_node(initial_state)
+    result = await search_node(initial_state)
     
     assert "sources" in result
     assert len(result["thinking_trace"]) == 1
     assert result["thinking_trace"][0]["step"] == "search"
 
 
-def test_synthesis_node(initial_state):
+@pytest.mark.asyncio
+async def test_synthesis_node(initial_state):
     """Test synthesis node creates final answer."""
     # Setup state with analysis
     initial_state["thinking_trace"] = [
@@ -74,8 +80,246 @@ def test_synthesis_node(initial_state):
         }
     ]
     
-    result = synthesis_node(initial_state)
+    result = await synthesis_node(initial_state)
     
     assert result["final_answer"] != ""
     assert len(result["thinking_trace"]) == 1
     assert result["thinking_trace"][0]["step"] == "synthesis"
+
+
+@pytest.fixture
+def llm_registry():
+    """An empty LLM client registry, cleared again after the test."""
+    from agent import llm as llm_module
+
+    llm_module.clear_llm_registry()
+    yield llm_module
+    llm_module.clear_llm_registry()
+
+
+def test_get_llm_reuses_clients(monkeypatch, llm_registry):
+    """Test LLM clients are cached per role and configurable per node."""
+    from agent.config import settings
+
+    created = []
+
+    def create_llm(provider, model, temperature):
+        created.append(model)
+        return object()
+
+    monkeypatch.setattr(llm_registry, "create_llm", create_llm)
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "openai")
+    monkeypatch.setattr(settings, "PLANNING_LLM_MODEL", "gpt-4o-mini")
+    monkeypatch.setattr(settings, "SYNTHESIS_LLM_MODEL", "gpt-4o")
+
+    assert llm_registry.get_llm("planning") is llm_registry.get_llm("planning")
+    assert llm_registry.get_llm("synthesis") is not llm_registry.get_llm("planning")
+    assert created == ["gpt-4o-mini", "gpt-4o"]
+    assert llm_registry.resolve_llm_config("planning")[1] == "gpt-4o-mini"
+    assert llm_registry.resolve_llm_config("synthesis")[1] == "gpt-4o"
+
+
+def test_next_queries_skips_executed_and_targets_gaps():
+    """Test follow-up queries skip executed ones and cover what is missing."""
+    from agent.research_loop import next_queries
+    
+    plan = {
+        "search_queries": ["HDFC Bank valuation"],
+        "key_questions": ["What is HDFC Bank's P/E ratio?", "How has HDFC Bank's NIM changed?"],
+        "metrics": ["NPA"]
+    }
+    sources = [{"url": "https://a.com", "title": "HDFC Bank P/E", "content": "HDFC Bank's P/E ratio is 18."}]
+    
+    queries = next_queries(plan, "Is HDFC Bank undervalued?", sources, ["valuation of HDFC Bank"], limit=3)
+    
+    assert "HDFC Bank valuation" not in queries
+    assert "What is HDFC Bank's P/E ratio?" not in queries
+    # Least covered first
+    assert queries == ["Is HDFC Bank undervalued? NPA", "How has HDFC Bank's NIM changed?"]
+
+
+@pytest.mark.asyncio
+async def test_search_loop_expands_queries_and_stops_when_stalled(initial_state, monkeypatch):
+    """Test each pass runs new queries, skips known URLs and stops on no new content."""
+    from agent import research_graph
+    from agent.research_graph import should_continue
+    
+    monkeypatch.setattr(research_graph.settings, "SEARCH_QUERIES_PER_ITERATION", 1)
+    calls = []
+    
+    async def fake_search_and_crawl(queries, max_results=5, exclude_urls=None, limits=None):
+        calls.append((list(queries), set(exclude_urls or [])))
+        # Same page every time, so the second pass adds nothing new
+        return [
+            {"url": "https://example.com/hdfc", "title": "HDFC", "content": "HDFC Bank results"}
+        ] if not exclude_urls else []
+    
+    monkeypatch.setattr(research_graph, "search_and_crawl", fake_search_and_crawl)
+    
+    state = dict(initial_state)
+    state["thinking_trace"] = [{
+        "step": "planning",
+        "content": {
+            "search_queries": ["HDFC Bank valuation"],
+            "key_questions": ["What is HDFC Bank's net interest margin?"],
+            "metrics": ["NPA"]
+        }
+    }]
+    
+    for _ in range(state["max_iterations"]):
+        update = await search_node(state)
+        state["sources"] = state["sources"] + update["sources"]
+        state["executed_queries"] = state["executed_queries"] + update["executed_queries"]
+        state["iteration"] = update["iteration"]
+        state["stalled"] = update["stalled"]
+        if should_continue(state) != "search":
+            break
+    
+    assert len(calls) == 2
+    assert calls[0] == (["HDFC Bank valuation"], set())
+    assert calls[1] == (["Is HDFC Bank undervalued? NPA"], {"https://example.com/hdfc"})
+    assert state["iteration"] == 2
+    assert state["stalled"] is True
+    assert should_continue(state) == "analyze"
+
+
+@pytest.mark.asyncio
+async def test_search_pass_with_novel_content_from_known_domain_does_not_stall(monkeypatch):
+    """Test a pass only stalls when it adds neither new domains nor new content."""
+    from agent import research_graph
+    
+    existing = [{"url": "https://example.com/hdfc-q2", "title": "HDFC Q2", "content": "HDFC Bank Q2 NIM was 3.4%"}]
+    pages = {
+        "novel": {"url": "https://example.com/hdfc-q3", "title": "HDFC Q3", "content": "HDFC Bank Q3 NIM was 3.6%"},
+        "mirror": {"url": "https://www.example.com/hdfc-q2-amp", "title": "HDFC Q2", "content": "HDFC Bank Q2 NIM was 3.4%"},
+    }
+    
+    async def fake_search_and_crawl(queries, max_results=5, exclude_urls=None, limits=None):
+        return [pages[page]]
+    
+    monkeypatch.setattr(research_graph, "search_and_crawl", fake_search_and_crawl)
+    plan = {"search_queries": ["HDFC Bank NIM"]}
+    
+    page = "novel"
+    _, found, stalled = await research_graph.gather_sources(plan, "HDFC NIM", existing, [])
+    assert found == [pages["novel"]] and not stalled
+    
+    page = "mirror"
+    _, found, stalled = await research_graph.gather_sources(plan, "HDFC NIM", existing, [])
+    assert found == [] and stalled
+
+
+def test_fan_out_branches_respects_width(initial_state, monkeypatch):
+    """Test one branch per key question, capped at the configured width."""
+    from agent import research_graph
+    
+    monkeypatch.setattr(research_graph.settings, "RESEARCH_BRANCH_WIDTH", 2)
+    initial_state["thinking_trace"] = [{
+        "step": "planning",
+        "content": {"key_questions": ["HDFC NIM", "ICICI NIM", "Kotak NIM"]}
+    }]
+    
+    sends = research_graph.fan_out_branches(initial_state)
+    
+    assert [s.node for s in sends] == ["research_branch", "research_branch"]
+    assert [s.arg["questions"] for s in sends] == [["HDFC NIM", "Kotak NIM"], ["ICICI NIM"]]
+
+
+@pytest.mark.asyncio
+async def test_parallel_branches_run_concurrently(initial_state, monkeypatch):
+    """Test parallel mode takes about as long as the slowest branch, not the sum."""
+    import asyncio
+    import json
+    import time
+    from agent import research_graph
+    from agent.research_graph import create_research_graph
+    
+    class FakeMessage:
+        def __init__(self, content):
+            self.content = content
+    
+    class FakeLLM:
+        async def ainvoke(self, messages):
+            await asyncio.sleep(0.2)
+            if "research plan" in messages[-1].content:
+                return FakeMessage(json.dumps({
+                    "key_questions": ["HDFC Bank NIM", "ICICI Bank NIM", "Kotak Bank NIM"],
+                    "search_queries": [],
+                    "metrics": [],
+                    "reasoning": "Compare margins"
+                }))
+            return FakeMessage("Findings [1].")
+    
+    async def fake_search_and_crawl(queries, max_results=5, exclude_urls=None, limits=None):
+        await asyncio.sleep(0.3)
+        return [
+            {"url": f"https://{q.split()[0].lower()}.example.com/{i}", "title": q, "content": f"{q} page {i}"}
+            for q in queries for i in range(4)
+        ]
+    
+    monkeypatch.setattr(research_graph, "get_llm", lambda role="default": FakeLLM())
+    monkeypatch.setattr(research_graph, "search_and_crawl", fake_search_and_crawl)
+    
+    graph = create_research_graph(mode="parallel")
+    start = time.perf_counter()
+    result = await graph.ainvoke(initial_state, {"configurable": {"thread_id": "parallel-test"}})
+    elapsed = time.perf_counter() - start
+    
+    assert len(result["branch_findings"]) == 3
+    assert len(result["sources"]) == 12
+    assert result["final_answer"]
+    # planning + one branch (search + analysis) + synthesis ~= 0.9s; sequential would be ~2.1s
+    assert elapsed < 1.5
+
+
+@pytest.mark.asyncio
+async def test_parallel_branch_analyses_stream_per_branch(initial_state, monkeypatch):
+    """Test tokens streamed by concurrent branches can be told apart and reassembled."""
+    import asyncio
+    import json
+    from agent import research_graph
+    from agent.research_graph import create_research_graph
+    from agent.streaming import stream_graph
+    
+    class FakeMessage:
+        def __init__(self, content):
+            self.content = content
+    
+    class FakeLLM:
+        async def ainvoke(self, messages):
+            return FakeMessage(json.dumps({
+                "key_questions": ["HDFC Bank NIM", "ICICI Bank NIM"],
+                "search_queries": [],
+                "metrics": [],
+                "reasoning": "Compare margins"
+            }))
+        
+        async def astream(self, messages):
+            bank = "HDFC" if "HDFC Bank NIM" in messages[-1].content else "ICICI"
+            for word in f"{bank} margin is stable.".split(" "):
+                await asyncio.sleep(0.01)
+                yield FakeMessage(word + " ")
+    
+    async def fake_search_and_crawl(queries, max_results=5, exclude_urls=None, limits=None):
+        return [{"url": f"https://{q.split()[0].lower()}.example.com", "title": q, "content": f"{q} page"} for q in queries]
+    
+    monkeypatch.setattr(research_graph, "get_llm", lambda role="default": FakeLLM())
+    monkeypatch.setattr(research_graph, "search_and_crawl", fake_search_and_crawl)
+    
+    graph = create_research_graph(mode="parallel")
+    deltas = []
+    findings = []
+    async for item in stream_graph(graph, initial_state, {"configurable": {"thread_id": "parallel-stream-test"}}):
+        if item[0] == "token" and item[1] == "analyze":
+            deltas.append((item[3], item[2]))
+        elif item[0] == "event" and "research_branch" in item[1]:
+            findings += item[1]["research_branch"]["branch_findings"]
+    
+    # The branches interleave, but each branch's deltas spell out its own analysis
+    branches = [branch for branch, _ in deltas]
+    assert branches != sorted(branches)
+    assert {f["branch"] for f in findings} == {0, 1}
+    for finding in findings:
+        text = "".join(delta for branch, delta in deltas if branch == finding["branch"])
+        assert text == finding["analysis"]
+        assert text.startswith(finding["questions"][0].split()[0])
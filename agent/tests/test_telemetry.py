@@ -0,0 +1,68 @@
+"""Unit tests for span instrumentation."""
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.streaming import generate
+from agent.telemetry import add_bytes, record_queue_wait, render_metrics, span, start_trace, traced
+
+
+class FakeLLM:
+    model_name = "gpt-4-turbo-preview"
+
+    async def ainvoke(self, messages):
+        return AIMessage(
+            content="HDFC trades at 2.5x book.",
+            usage_metadata={"input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200}
+        )
+
+
+@pytest.mark.asyncio
+async def test_trace_collects_spans_from_child_tasks():
+    """Test spans in tasks of a traced request land in its breakdown with queue wait and bytes."""
+
+    async def run():
+        trace = start_trace()
+
+        @traced("search")
+        async def node():
+            async def crawl(size):
+                record_queue_wait(0.05)
+                with span("crawl_url"):
+                    add_bytes(size)
+            await asyncio.gather(crawl(1000), crawl(500))
+
+        await node()
+        with pytest.raises(ValueError):
+            with span("crawl_url"):
+                raise ValueError("boom")
+        return trace.breakdown()
+
+    breakdown = await asyncio.create_task(run())
+    crawl = breakdown["spans"]["crawl_url"]
+    assert crawl["count"] == 3 and crawl["bytes"] == 1500 and crawl["errors"] == 1
+    assert crawl["queue_wait_ms"] == pytest.approx(100, abs=1)
+    assert breakdown["spans"]["search"]["kind"] == "node"
+    assert breakdown["spans"]["search"]["wall_ms"] <= breakdown["wall_ms"]
+
+
+@pytest.mark.asyncio
+async def test_generate_records_tokens_cost_and_metrics(monkeypatch):
+    """Test an LLM call records provider usage, estimated cost and Prometheus series."""
+    monkeypatch.setattr("agent.llm.resolve_llm_config", lambda role: ("openai", "gpt-4-turbo-preview", 0))
+
+    async def run():
+        trace = start_trace()
+        await generate(FakeLLM(), [HumanMessage(content="Is HDFC undervalued?")], node="synthesize")
+        return trace.breakdown()
+
+    breakdown = await asyncio.create_task(run())
+    llm = breakdown["spans"]["llm.synthesize"]
+    assert llm["prompt_tokens"] == 1000 and llm["completion_tokens"] == 200
+    # gpt-4-turbo: $10 / $30 per million tokens
+    assert breakdown["cost_usd"] == pytest.approx(0.016)
+
+    body, content_type = render_metrics()
+    if content_type.startswith("text/plain; version"):
+        assert b'research_llm_tokens_total{model="gpt-4-turbo-preview",name="llm.synthesize",type="prompt"}' in body
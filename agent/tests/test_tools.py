@@ -4,9 +4,10 @@ from agent.tools.search import search_web
 from agent.tools.crawler import crawl_url
 
 
-def test_search_web():
+@pytest.mark.asyncio
+async def test_search_web():
     """Test web search returns results."""
-    results = search_web("HDFC Bank", max_results=3)
+    results = await search_web("HDFC Bank", max_results=3)
     
     assert isinstance(results, list)
     assert len(results) <= 3
@@ -16,10 +17,381 @@ def test_search_web():
         assert "title" in results[0]
 
 
-def test_crawl_url():
+@pytest.mark.asyncio
+async def test_crawl_url():
     """Test URL crawler extracts content."""
-    content = crawl_url("https://example.com")
+    content = await crawl_url("https://example.com")
     
     assert content is not None
     assert len(content) > 0
     assert "Example Domain" in content
+
+
+@pytest.mark.asyncio
+async def test_search_and_crawl_runs_concurrently(monkeypatch):
+    """Test pipeline latency tracks the slowest fetch, not the sum."""
+    import asyncio
+    import time
+    from agent.tools import pipeline
+
+    async def fake_search(query, max_results):
+        await asyncio.sleep(0.2)
+        return [{"url": f"https://{query}.example.com/{i}", "title": query} for i in range(3)]
+
+    async def fake_crawl(url):
+        await asyncio.sleep(0.2)
+        return {"text": f"content of {url}", "facts": []}
+
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+
+    start = time.monotonic()
+    sources = await pipeline.SearchCrawlPipeline(max_concurrency=20, deadline=5).run(["a", "b", "c"])
+    elapsed = time.monotonic() - start
+
+    assert len(sources) == 9
+    assert all(s["content"].startswith("content of") for s in sources)
+    assert elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_pipelines_of_one_run_share_fetch_limits(monkeypatch):
+    """Test concurrent pipelines holding the same run id stay within one crawl budget."""
+    import asyncio
+    from agent.tools import pipeline
+
+    active = peak = 0
+
+    async def fake_search(query, max_results):
+        return [{"url": f"https://{query}.example.com/{i}", "title": query} for i in range(4)]
+
+    async def fake_crawl(url):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return {"text": f"content of {url}", "facts": []}
+
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+    monkeypatch.setattr(pipeline.settings, "FETCH_CONCURRENCY", 3)
+
+    async def branch(query):
+        with pipeline.run_fetch_limits("run-1") as limits:
+            return await pipeline.search_and_crawl([query], limits=limits)
+
+    results = await asyncio.gather(*[branch(q) for q in ("hdfc", "icici", "kotak")])
+    assert sum(len(r) for r in results) == 12
+    assert peak == 3
+    assert not pipeline._run_limits
+
+
+@pytest.mark.asyncio
+async def test_throttled_search_does_not_hold_fetch_slots(monkeypatch):
+    """Test a search waiting out a rate limit leaves the fetch slots to crawls."""
+    import asyncio
+    from agent.tools import pipeline
+
+    async def fake_search(query, max_results):
+        if query == "throttled":
+            # Stands in for the rate limiter sleeping on Retry-After
+            await asyncio.sleep(1.0)
+            return []
+        return [{"url": "https://hdfc.example.com", "title": "HDFC"}]
+
+    async def fake_crawl(url):
+        return {"text": f"content of {url}", "facts": []}
+
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+
+    sources = await pipeline.SearchCrawlPipeline(max_concurrency=1, deadline=0.3).run(["throttled", "hdfc"])
+
+    assert sources[0]["content"] == "content of https://hdfc.example.com"
+
+
+@pytest.mark.asyncio
+async def test_search_and_crawl_respects_deadline(monkeypatch):
+    """Test sources crawled after the deadline fall back to their snippet."""
+    import asyncio
+    from agent.tools import pipeline
+
+    async def fake_search(query, max_results):
+        return [{"url": "https://slow.example.com", "title": "Slow", "snippet": "snippet"}]
+
+    async def fake_crawl(url):
+        await asyncio.sleep(1.0)
+        return {"text": "too late", "facts": []}
+
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+
+    sources = await pipeline.SearchCrawlPipeline(deadline=0.2).run(["q"])
+
+    assert len(sources) == 1
+    assert sources[0]["content"] == "snippet"
+
+
+def test_normalize_url():
+    """Test equivalent URLs share a crawl cache key."""
+    from agent.tools.crawl_cache import normalize_url, cache_key
+
+    assert normalize_url("HTTPS://Example.com:443/ir/?utm_source=x&b=2&a=1#top") == \
+        "https://example.com/ir?a=1&b=2"
+    assert cache_key("https://example.com/ir/") == cache_key("https://EXAMPLE.com/ir")
+
+
+@pytest.mark.asyncio
+async def test_crawl_cache_freshness_and_revalidation():
+    """Test fresh hits, stale lookups and 304 revalidation."""
+    from agent.cache import InMemoryCache
+    from agent.tools.crawl_cache import CrawlCache
+
+    cache = CrawlCache(InMemoryCache(max_bytes=1024 * 1024))
+    url = "https://www.sec.gov/Archives/filing.htm"
+
+    entry, fresh = await cache.lookup(url)
+    assert entry is None and not fresh
+
+    await cache.store(url, "filing text", etag='"abc"')
+    entry, fresh = await cache.lookup(url)
+    assert fresh and entry["text"] == "filing text"
+
+    entry["fetched_at"] -= entry["ttl"] + 1
+    await cache._write(entry)
+    entry, fresh = await cache.lookup(url)
+    assert entry is not None and not fresh
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"abc"'}
+
+    await cache.mark_revalidated(entry)
+    _, fresh = await cache.lookup(url)
+    assert fresh
+
+    stats = cache.stats.snapshot()
+    assert stats["misses"] == 1 and stats["revalidated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_in_memory_cache_byte_budget():
+    """Test LRU eviction once the byte budget is exceeded."""
+    from agent.cache import InMemoryCache
+
+    cache = InMemoryCache(max_bytes=100)
+    await cache.set("a", "x" * 40)
+    await cache.set("b", "y" * 40)
+    await cache.get("a")
+    await cache.set("c", "z" * 40)
+
+    assert await cache.get("a") == "x" * 40
+    assert await cache.get("b") is None
+    assert cache.total_bytes <= 100
+
+
+def test_normalize_query():
+    """Test near-identical queries normalize to the same key."""
+    from agent.tools.search_cache import normalize_query
+
+    assert normalize_query("HDFC Bank P/E ratio") == normalize_query("hdfc bank  pe ratio")
+    assert normalize_query("P/E ratio of HDFC Bank") == normalize_query("HDFC Bank P/E ratio")
+
+
+@pytest.mark.asyncio
+async def test_search_cache_coalesces_concurrent_requests():
+    """Test identical concurrent searches make a single upstream call."""
+    import asyncio
+    from agent.cache import InMemoryCache
+    from agent.tools.search_cache import SearchCache
+
+    cache = SearchCache(InMemoryCache(max_entries=10), ttl=60)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return [{"url": "https://example.com"}]
+
+    results = await asyncio.gather(*[
+        cache.get_or_fetch("tavily", q, 5, fetch)
+        for q in ["HDFC Bank P/E ratio", "hdfc bank pe ratio", "HDFC bank P/E Ratio"]
+    ])
+    assert calls == 1
+    assert all(r == results[0] for r in results)
+
+    await cache.get_or_fetch("tavily", "hdfc bank pe ratio", 5, fetch)
+    assert calls == 1
+    assert cache.stats.hits == 1
+
+    # The caller that started a fetch being cancelled does not fail the callers sharing it
+    owner = asyncio.create_task(cache.get_or_fetch("tavily", "HDFC Bank NIM", 5, fetch))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_fetch("tavily", "HDFC Bank NIM", 5, fetch))
+    await asyncio.sleep(0.01)
+    owner.cancel()
+    assert await waiter == [{"url": "https://example.com"}]
+    assert calls == 2 and owner.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_search_and_crawl_skips_known_urls(monkeypatch):
+    """Test URLs already gathered are not returned or crawled again."""
+    from agent.tools import pipeline
+    
+    crawled = []
+    
+    async def fake_search(query, max_results):
+        return [
+            {"url": "https://Example.com/a/?utm_source=x", "title": "A"},
+            {"url": "https://example.com/b", "title": "B"}
+        ]
+    
+    async def fake_crawl(url):
+        crawled.append(url)
+        return {"text": f"Content of {url}", "facts": []}
+    
+    monkeypatch.setattr(pipeline, "search_web", fake_search)
+    monkeypatch.setattr(pipeline, "crawl_document", fake_crawl)
+    
+    sources = await pipeline.SearchCrawlPipeline(deadline=5).run(
+        ["q1", "q2"], exclude_urls=["https://example.com/a"]
+    )
+    
+    assert [s["url"] for s in sources] == ["https://example.com/b"]
+    assert crawled == ["https://example.com/b"]
+
+
+def test_extract_html_prefers_main_content():
+    """Test boilerplate is stripped and table rows stay on one line."""
+    from agent.tools.extraction import extract_content
+    
+    html = b"""<html><head><script>var x = 1;</script></head><body>
+    <nav><a href="/">Home</a> <a href="/markets">Markets</a></nav>
+    <main><h1>HDFC Bank Q2 results</h1>
+    <p>Net interest margin was 3.4% for the quarter.</p>
+    <table><tr><th>Metric</th><th>Q2</th></tr><tr><td>Gross NPA (%)</td><td>1.33</td></tr></table>
+    </main><footer>Copyright</footer></body></html>"""
+    
+    text = extract_content(html, "html", "utf-8", "lxml")
+    
+    assert text.splitlines() == [
+        "HDFC Bank Q2 results",
+        "Net interest margin was 3.4% for the quarter.",
+        "Metric | Q2",
+        "Gross NPA (%) | 1.33"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_crawl_url_streams_with_size_cap_and_content_type_dispatch(monkeypatch):
+    """Test bodies are capped, plain text is kept and unsupported types are skipped."""
+    import httpx
+    from agent.tools import crawler
+    
+    monkeypatch.setattr(crawler.settings, "CRAWL_MAX_BYTES", 1000)
+    monkeypatch.setattr(crawler.settings, "EXTRACTION_WORKERS", 0)
+    monkeypatch.setattr(crawler, "get_crawl_cache", lambda: None)
+    
+    def handler(request):
+        if request.url.path == "/big.html":
+            body = b"<html><body>" + b"<p>NIM 3.4%</p>" * 10000 + b"</body></html>"
+            return httpx.Response(200, content=body, headers={"content-type": "text/html; charset=utf-8"})
+        if request.url.path == "/data.txt":
+            return httpx.Response(200, content=b"Gross NPA 1.33%\n", headers={"content-type": "text/plain"})
+        return httpx.Response(200, content=b"\x89PNG....", headers={"content-type": "image/png"})
+    
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(crawler, "get_http_client", lambda: client)
+    
+    big = await crawler.crawl_url("https://example.com/big.html")
+    assert big and big.count("NIM 3.4%") < 100
+    assert await crawler.crawl_url("https://example.com/data.txt") == "Gross NPA 1.33%"
+    assert await crawler.crawl_url("https://example.com/logo.png") is None
+    assert crawler.content_kind("application/octet-stream", b"%PDF-1.7") == "pdf"
+    await client.aclose()
+
+
+def test_extract_document_turns_tables_and_inline_xbrl_into_facts():
+    """Test numeric tables and ix:nonFraction facts become (metric, period, value, unit) records."""
+    from agent.tools.extraction import extract_document
+    
+    html = b"""<html><body>
+    <div style="display:none"><ix:header><ix:resources>
+      <xbrli:context id="q3"><xbrli:period><xbrli:startDate>2024-07-01</xbrli:startDate>
+        <xbrli:endDate>2024-09-30</xbrli:endDate></xbrli:period></xbrli:context>
+      <xbrli:unit id="usd"><xbrli:measure>iso4217:USD</xbrli:measure></xbrli:unit>
+    </ix:resources></ix:header></div>
+    <p>Revenue was $<ix:nonFraction name="us-gaap:Revenues" contextRef="q3" unitRef="usd" scale="6">1,234</ix:nonFraction> million.</p>
+    <table>
+      <tr><th>Particulars (in crore)</th><th>Q2 FY25</th><th>Q1 FY25</th></tr>
+      <tr><td>Net profit</td><td>16,373</td><td>(1,200)</td></tr>
+      <tr><td>Net interest margin (%)</td><td>3.40</td><td>3.44</td></tr>
+    </table>
+    <table><tr><td><a href="/ir">Investor relations</a></td><td>Contact us</td></tr></table>
+    </body></html>"""
+    
+    document = extract_document(html, "html", "utf-8", "lxml")
+    facts = {(f["metric"], f["period"]): (f["value"], f["unit"]) for f in document["facts"]}
+    
+    assert facts[("Revenues", "2024-07-01..2024-09-30")] == (1234e6, "USD")
+    assert facts[("Net profit", "Q2 FY25")] == (16373, "in crore")
+    assert facts[("Net profit", "Q1 FY25")] == (-1200, "in crore")
+    assert facts[("Net interest margin", "Q1 FY25")] == (3.44, "%")
+    assert len(document["facts"]) == 5
+    # The numeric table is carried by the facts; prose and the link table stay in the text
+    assert "16,373" not in document["text"]
+    assert "Revenue was $1,234 million." in document["text"]
+    assert "Investor relations" in document["text"]
+    assert "2024-07-01" not in document["text"]
+
+
+def test_extract_document_keeps_tables_cut_by_the_fact_cap(monkeypatch):
+    """Test a table whose facts exceed FINANCIAL_FACTS_MAX stays in the text."""
+    from agent.tools.extraction import extract_document
+
+    monkeypatch.setattr("agent.config.settings.FINANCIAL_FACTS_MAX", 4)
+    html = b"""<html><body><table>
+      <tr><th>Metric</th><th>Q2 FY25</th><th>Q1 FY25</th></tr>
+      <tr><td>Net profit</td><td>16,373</td><td>16,175</td></tr>
+      <tr><td>Deposits</td><td>25,001</td><td>23,791</td></tr>
+      <tr><td>NIM (%)</td><td>3.40</td><td>3.44</td></tr>
+      <tr><td>GNPA (%)</td><td>1.36</td><td>1.33</td></tr>
+    </table></body></html>"""
+
+    document = extract_document(html, "html", "utf-8", "lxml")
+    assert len(document["facts"]) == 4
+    assert "GNPA" in document["text"] and "3.44" in document["text"]
+
+
+@pytest.mark.asyncio
+async def test_http_client_counts_pooled_connections():
+    """Test requests through the instrumented pooled client reuse one connection."""
+    import asyncio
+    from agent.tools.http_client import PoolStats, create_http_client
+
+    async def handle(reader, writer):
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok")
+            await writer.drain()
+
+    async def serve(reader, writer):
+        try:
+            await handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    client = create_http_client()
+    stats = client._transport._stats = PoolStats()
+    try:
+        for _ in range(2):
+            response = await client.get(f"http://127.0.0.1:{port}/")
+            assert response.text == "ok"
+    finally:
+        await client.aclose()
+        server.close()
+
+    assert stats.snapshot() == {
+        "requests": 2, "connections_opened": 1, "connections_reused": 1, "waiting": 0, "in_flight": 0
+    }